@@ -1,12 +1,11 @@
 import os
 import glob
 from typing import List, Annotated
-import openai
-from aider.coders import Coder
-from aider import  models
 from dotenv import load_dotenv
 import argparse
-import autogen
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 __code_exec_dir__ = ".cache/user_proxy"
 
@@ -45,6 +44,9 @@ def perform_action(file, action, plan): # env_or_file="oai.json", update_files=F
     Returns:
         str: The response from the coder after running the action.
     """
+    import openai
+    from aider.coders import Coder
+    from aider import  models
       
     client = openai.OpenAI(api_key=os.environ["OPENAI_API_KEY"], 
                             base_url=os.environ.get("OPENAI_API_BASE_URL", "https://api.openai.com/v1"))
@@ -64,6 +66,10 @@ def review_file(file, action, env_or_file, cache_seed):
     """
     Use Autogen to review file based on the action prompt. Then output the output of the autogen review.
     """
+    import autogen
+    from utils import metrics
+    from utils.gateway_llm import GatewayModelClient, gateway_config_list
+    from utils.token_counter import fit_to_budget
 
 
 
@@ -86,9 +92,9 @@ def review_file(file, action, env_or_file, cache_seed):
         cache_seed = None
 
 
-    config_list_local = autogen.config_list_from_json(
-        env_or_file=env_or_file
-    )
+    # Requests go through the shared gateway, which spreads them over the endpoints in env_or_file.
+    config_list_local = gateway_config_list(env_or_file)
+    file_content = fit_to_budget(file_content, model=config_list_local[0]["model"], label=file)
 
     llm_config = {"config_list": config_list_local, "cache_seed": cache_seed}
 
@@ -114,12 +120,18 @@ def review_file(file, action, env_or_file, cache_seed):
         llm_config=llm_config,
     )
 
+    for agent in (coder, reviewer):
+        agent.register_model_client(model_client_cls=GatewayModelClient)
+
     groupchat = autogen.GroupChat(agents=[coder, reviewer, user_proxy], messages=[], max_round=12,
                                   speaker_selection_method="round_robin")
     
     manager = autogen.GroupChatManager(groupchat=groupchat, llm_config=llm_config)
+    manager.register_model_client(model_client_cls=GatewayModelClient)
+    metrics.track_autogen_roles([coder, reviewer, manager])
 
-    user_proxy.initiate_chat(manager, message="REQUEST: " + action + "\n\n" + "CODE: \n\n"  + file_content, clear_history=True)
+    with metrics.timer("task", "group review", role=manager.name):
+        user_proxy.initiate_chat(manager, message="REQUEST: " + action + "\n\n" + "CODE: \n\n"  + file_content, clear_history=True)
         
     # append the content property of all the groupchat.messages to the responses list
     for message in groupchat.messages:
@@ -139,7 +151,8 @@ def review_file(file, action, env_or_file, cache_seed):
     )
     
 
-    review_proxy.send(recipient=coder, message= "REQUEST: " + action + "\n\n" + "CODE: \n\n"  + file_content, request_reply=True)
+    with metrics.timer("task", "review", role=coder.name):
+        review_proxy.send(recipient=coder, message= "REQUEST: " + action + "\n\n" + "CODE: \n\n"  + file_content, request_reply=True)
     
     message = coder.last_message(review_proxy)
     review_output_text = message["content"]
@@ -152,8 +165,11 @@ def review_file(file, action, env_or_file, cache_seed):
             " These include a list of steps that need to be taken to complete the code changes and code samples.",
         llm_config=llm_config,
     )
-    review_proxy.send(recipient=planner, request_reply=True,
-        message="Read this review and reply with a list of steps that need to be taken to complete the code changes. \n\n" + str.join("\n\n", responses))
+    planner.register_model_client(model_client_cls=GatewayModelClient)
+    metrics.track_autogen_roles([planner])
+    with metrics.timer("task", "plan", role=planner.name):
+        review_proxy.send(recipient=planner, request_reply=True,
+            message="Read this review and reply with a list of steps that need to be taken to complete the code changes. \n\n" + str.join("\n\n", responses))
 
     message = planner.last_message()
     #print(message)
@@ -167,8 +183,7 @@ def review_file(file, action, env_or_file, cache_seed):
 
     return review_output_text
 
-def main():
-    load_dotenv()
+def build_parser():
     parser = argparse.ArgumentParser(description="Script to perform an action on files.")
     parser.add_argument("files", nargs='*', help="The glob pattern for file matching or list of files.")
     parser.add_argument("action", type=str, help="The action to be performed on the files.")
@@ -184,8 +199,11 @@ def main():
         default=os.environ.get("ITL_CACHE_SEED", "42"),
         help="Cache seed for the action, or False to disable caching.",
     )
+    return parser
 
-    args = parser.parse_args()
+def main(argv=None):
+    load_dotenv()
+    args = build_parser().parse_args(argv)
 
     env_or_file = args.env_or_file
 
@@ -1,12 +1,11 @@
 import os
 import glob
 from typing import List, Annotated
-import openai
-from aider.coders import Coder
-from aider import  models
 from dotenv import load_dotenv
 import argparse
-import autogen
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 def write_to_markdown(messages: Annotated[List[str], "List of messages to write."], file_name: Annotated[str, "Name of the file to write the messages to."]) -> str:
 
@@ -40,6 +39,9 @@ def perform_action(file, action, plan):
     Returns:
         str: The response from the coder after running the action.
     """
+    import openai
+    from aider.coders import Coder
+    from aider import  models
       
     client = openai.OpenAI(api_key=os.environ["OPENAI_API_KEY"], 
                             base_url=os.environ.get("OPENAI_API_BASE_URL", "https://api.openai.com/v1"))
@@ -59,6 +61,10 @@ def review_file(file, action, env_or_file, cache_seed):
     """
     Use Autogen to review file based on the action prompt. Then output the output of the autogen review.
     """
+    import autogen
+    from utils import metrics
+    from utils.gateway_llm import GatewayModelClient, gateway_config_list
+    from utils.token_counter import fit_to_budget
 
     # read file content from file
     file_content = open(file, 'r').read()
@@ -69,9 +75,9 @@ def review_file(file, action, env_or_file, cache_seed):
         cache_seed = None
 
 
-    config_list_local = autogen.config_list_from_json(
-        env_or_file=env_or_file
-    )
+    # Requests go through the shared gateway, which spreads them over the endpoints in env_or_file.
+    config_list_local = gateway_config_list(env_or_file)
+    file_content = fit_to_budget(file_content, model=config_list_local[0]["model"], label=file)
 
     llm_config = {"config_list": config_list_local, "cache_seed": cache_seed}
 
@@ -100,17 +106,23 @@ def review_file(file, action, env_or_file, cache_seed):
         llm_config=llm_config,
     )
 
+    for agent in (coder, planner):
+        agent.register_model_client(model_client_cls=GatewayModelClient)
+    metrics.track_autogen_roles([coder, planner])
+
     is_silent = True
 
-    review_proxy.send(recipient=coder, request_reply=True, silent=is_silent,
-                      message= "REQUEST: " + action + "\n\n" + "CODE: \n\n"  + file_content)
+    with metrics.timer("task", "review", role=coder.name):
+        review_proxy.send(recipient=coder, request_reply=True, silent=is_silent,
+                          message= "REQUEST: " + action + "\n\n" + "CODE: \n\n"  + file_content)
     
     message = coder.last_message(review_proxy)
     review_output_text = message["content"]
     responses.append(review_output_text)
 
-    review_proxy.send(recipient=planner, request_reply=True, silent=is_silent,
-        message="Read this review and reply with a list of steps that need to be taken to complete the code changes. \n\n" + str.join("\n\n", responses))
+    with metrics.timer("task", "plan", role=planner.name):
+        review_proxy.send(recipient=planner, request_reply=True, silent=is_silent,
+            message="Read this review and reply with a list of steps that need to be taken to complete the code changes. \n\n" + str.join("\n\n", responses))
 
     message = planner.last_message()
     review_output_text = message["content"]
@@ -123,8 +135,7 @@ def review_file(file, action, env_or_file, cache_seed):
 
     return review_output_text
 
-def main():
-    load_dotenv()
+def build_parser():
     parser = argparse.ArgumentParser(description="Script to perform an action on files.")
     parser.add_argument("files", nargs='*', help="The glob pattern for file matching or list of files.")
     parser.add_argument("action", type=str, help="The action to be performed on the files.")
@@ -140,8 +151,11 @@ def main():
         default=os.environ.get("ITL_CACHE_SEED", "42"),
         help="Cache seed for the action, or False to disable caching.",
     )
+    return parser
 
-    args = parser.parse_args()
+def main(argv=None):
+    load_dotenv()
+    args = build_parser().parse_args(argv)
 
     env_or_file = args.oai
 
@@ -0,0 +1,234 @@
+"""
+In-process OpenAI and Ollama compatible HTTP server for the benchmarks.
+
+It answers chat completions, completions and embeddings in the OpenAI format
+and /api/generate and /api/chat in the Ollama format, streaming or not, with a
+canned reply. Every response waits `latency` seconds before the first token and
+then produces `tokens_per_second` tokens (whitespace separated words) per second,
+which is roughly how a local model behaves.
+"""
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# crewAI agents parse ReAct style output, the other pipelines take any text
+DEFAULT_REPLY = ("Thought: Do I need to use a tool? No\n"
+                 "Final Answer: The code is readable and the change is small. "
+                 "Add type hints to the public functions and a docstring to the module.")
+EMBEDDING_SIZE = 64
+
+
+class MockLLMServer:
+    """
+    Args:
+        latency (float): Seconds before the first token of every response.
+        tokens_per_second (float): Generation speed, 0 for instant replies.
+        replies (dict, optional): Maps a substring of the prompt to the reply to send
+            when the prompt contains it. Other prompts get default_reply.
+        default_reply (str, optional): The reply for every other prompt.
+    """
+
+    def __init__(self, latency=0.05, tokens_per_second=200.0, replies=None, default_reply=DEFAULT_REPLY):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.replies = dict(replies or {})
+        self.default_reply = default_reply
+        self.requests = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    @property
+    def openai_url(self):
+        return self.url + "/v1"
+
+    def start(self):
+        server = self
+
+        class Handler(_Handler):
+            mock = server
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-llm-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reset_counters(self):
+        with self._lock:
+            self.requests = 0
+            self.completion_tokens = 0
+
+    def reply_for(self, prompt):
+        for marker, reply in self.replies.items():
+            if marker in prompt:
+                return reply
+        return self.default_reply
+
+    def tokens(self, reply):
+        """Splits a reply into the pieces that are sent one token at a time."""
+        words = reply.split(" ")
+        tokens = [word + " " for word in words[:-1]] + [words[-1]]
+        with self._lock:
+            self.requests += 1
+            self.completion_tokens += len(tokens)
+        return tokens
+
+    def token_delay(self):
+        return 1.0 / self.tokens_per_second if self.tokens_per_second else 0.0
+
+
+def _prompt_text(body):
+    if "messages" in body:
+        return "\n".join(str(message.get("content") or "") for message in body["messages"])
+    prompt = body.get("prompt", "")
+    return "\n".join(prompt) if isinstance(prompt, list) else str(prompt)
+
+
+def _embedding(text):
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return [(digest[i % len(digest)] - 128) / 128.0 for i in range(EMBEDDING_SIZE)]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    mock = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            return self._json({"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "bench"}]})
+        if self.path.rstrip("/").endswith("/api/ps"):
+            return self._json({"models": []})
+        self._json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        path = self.path.rstrip("/")
+        if path.endswith("/embeddings"):
+            return self._embeddings(body)
+        if path.endswith("/api/embeddings") or path.endswith("/api/embed"):
+            return self._json({"embedding": _embedding(str(body.get("prompt") or body.get("input")))})
+        if path.endswith("/chat/completions"):
+            return self._openai(body, chat=True)
+        if path.endswith("/completions"):
+            return self._openai(body, chat=False)
+        if path.endswith("/api/generate") or path.endswith("/api/chat"):
+            return self._ollama(body, chat=path.endswith("/api/chat"))
+        self._json({"error": "not found"}, status=404)
+
+    def _embeddings(self, body):
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        time.sleep(self.mock.latency)
+        self._json({
+            "object": "list",
+            "model": body.get("model"),
+            "data": [{"object": "embedding", "index": index, "embedding": _embedding(str(text))}
+                     for index, text in enumerate(inputs)],
+            "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+        })
+
+    def _openai(self, body, chat):
+        prompt = _prompt_text(body)
+        tokens = self.mock.tokens(self.mock.reply_for(prompt))
+        model = body.get("model") or "mock"
+        usage = {"prompt_tokens": len(prompt.split()), "completion_tokens": len(tokens),
+                 "total_tokens": len(prompt.split()) + len(tokens)}
+        time.sleep(self.mock.latency)
+
+        if body.get("stream"):
+            self._start_stream("text/event-stream")
+            for token in tokens:
+                time.sleep(self.mock.token_delay())
+                choice = {"index": 0, "finish_reason": None}
+                if chat:
+                    choice["delta"] = {"role": "assistant", "content": token}
+                else:
+                    choice["text"] = token
+                chunk = {"id": "bench", "object": "chat.completion.chunk" if chat else "text_completion",
+                         "created": int(time.time()), "model": model, "choices": [choice]}
+                self._chunk(f"data: {json.dumps(chunk)}\n\n")
+            self._chunk("data: [DONE]\n\n")
+            return self._end_stream()
+
+        time.sleep(self.mock.token_delay() * len(tokens))
+        text = "".join(tokens)
+        if chat:
+            choice = {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}
+        else:
+            choice = {"index": 0, "finish_reason": "stop", "text": text, "logprobs": None}
+        self._json({"id": "bench", "object": "chat.completion" if chat else "text_completion",
+                    "created": int(time.time()), "model": model, "choices": [choice], "usage": usage})
+
+    def _ollama(self, body, chat):
+        prompt = _prompt_text(body)
+        if not prompt:
+            # A preload or unload request, see utils/model_scheduler.py
+            return self._json({"model": body.get("model"), "response": "", "done": True})
+        tokens = self.mock.tokens(self.mock.reply_for(prompt))
+        time.sleep(self.mock.latency)
+
+        def message(text, done):
+            entry = {"model": body.get("model"), "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ"), "done": done}
+            if chat:
+                entry["message"] = {"role": "assistant", "content": text}
+            else:
+                entry["response"] = text
+            if done:
+                entry.update(prompt_eval_count=len(prompt.split()), eval_count=len(tokens))
+            return entry
+
+        if body.get("stream", True):
+            self._start_stream("application/x-ndjson")
+            for token in tokens:
+                time.sleep(self.mock.token_delay())
+                self._chunk(json.dumps(message(token, False)) + "\n")
+            self._chunk(json.dumps(message("", True)) + "\n")
+            return self._end_stream()
+
+        time.sleep(self.mock.token_delay() * len(tokens))
+        self._json(message("".join(tokens), True))
+
+    def _json(self, data, status=200):
+        raw = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _start_stream(self, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _chunk(self, text):
+        raw = text.encode("utf-8")
+        self.wfile.write(f"{len(raw):x}\r\n".encode("ascii") + raw + b"\r\n")
+        self.wfile.flush()
+
+    def _end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
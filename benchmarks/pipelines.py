@@ -0,0 +1,86 @@
+"""
+The pipelines the benchmark suite times.
+
+Each pipeline is a function that runs one end-to-end pass in the current working
+directory, which the suite points at a scratch directory with a sample source
+file and markdown document. The scripts are loaded the way `itl` loads them.
+"""
+import os
+import uuid
+
+from itlackey_assistants.cli import load_script
+
+SAMPLE_SOURCE = "sample.py"
+SAMPLE_MARKDOWN = "sample.md"
+ACTION = "Add type hints and docstrings."
+GATEWAY_CONFIG_ENV = "ITL_BENCH_CONFIG_LIST"
+
+SAMPLE_SOURCE_TEXT = '''import json
+
+
+def load(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def total(items):
+    result = 0
+    for item in items:
+        result += item["price"] * item["quantity"]
+    return result
+'''
+
+SAMPLE_MARKDOWN_TEXT = """# Sample document
+Some text without a blank line after the heading.
+* a list item
++ another list item
+"""
+
+
+def write_samples():
+    with open(SAMPLE_SOURCE, "w") as file:
+        file.write(SAMPLE_SOURCE_TEXT)
+    with open(SAMPLE_MARKDOWN, "w") as file:
+        file.write(SAMPLE_MARKDOWN_TEXT)
+
+
+def _fresh_seed():
+    # autogen caches by seed, a new seed per run keeps the runs from hitting that cache
+    return "bench-" + uuid.uuid4().hex[:8]
+
+
+def crew_review():
+    load_script("review").review_file(SAMPLE_SOURCE, ACTION, cache_seed=_fresh_seed(),
+                                      env_or_file=GATEWAY_CONFIG_ENV)
+
+
+def autogen_review():
+    load_script("review-autogen").review_file(SAMPLE_SOURCE, ACTION, env_or_file=GATEWAY_CONFIG_ENV,
+                                              cache_seed=_fresh_seed())
+
+
+def autogen_group_review():
+    load_script("review-group").review_file(SAMPLE_SOURCE, ACTION, env_or_file=GATEWAY_CONFIG_ENV,
+                                            cache_seed=_fresh_seed())
+
+
+def markdown_update():
+    load_script("md-update").process_markdown_document(os.path.abspath(SAMPLE_MARKDOWN))
+
+
+def companion():
+    load_script("companion").main(["Where are the totals computed?"])
+
+
+def write_article():
+    load_script("article").write_article("Type hints in Python", cache_seed="False")
+
+
+PIPELINES = {
+    "crew_review": crew_review,
+    "autogen_review": autogen_review,
+    "autogen_group_review": autogen_group_review,
+    "markdown_update": markdown_update,
+    "companion": companion,
+    "write_article": write_article,
+}
@@ -0,0 +1,168 @@
+"""
+End-to-end benchmark suite.
+
+Starts the mock server, points every client at it (OPENAI_API_BASE_URL,
+OPENAI_API_URL, OLLAMA_BASE_URL and the gateway config list), runs each pipeline
+a few times in a scratch directory and writes the timings to a JSON file. When a
+baseline exists, a pipeline whose median wall time grew by more than the
+threshold is reported as a regression and the exit status is 1.
+
+Usage:
+    python -m benchmarks
+    python -m benchmarks crew_review companion --repeat 5
+    python -m benchmarks --update-baseline
+"""
+import argparse
+import contextlib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import traceback
+
+from benchmarks.mock_server import MockLLMServer
+from benchmarks.pipelines import GATEWAY_CONFIG_ENV, PIPELINES, write_samples
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_DIR, "baseline.json")
+DEFAULT_THRESHOLD = 0.2
+
+
+@contextlib.contextmanager
+def bench_environment(server, workdir):
+    """Points the clients at the mock server and runs in workdir, restoring both afterwards."""
+    overrides = {
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_API_BASE_URL": server.openai_url,
+        "OPENAI_API_URL": server.openai_url + "/",
+        "AIDER_OPENAI_API_BASE_URL": server.openai_url,
+        "OLLAMA_BASE_URL": server.url,
+        GATEWAY_CONFIG_ENV: json.dumps([{"api_key": "bench", "model": "local", "base_url": server.openai_url}]),
+        "ITL_CONFIG_LIST": GATEWAY_CONFIG_ENV,
+        "ITL_CACHE_SEED": "False",
+        "ITL_CASSETTE_MODE": "",
+        "ITL_METRICS_DIR": os.path.join(workdir, "metrics"),
+    }
+    previous_env = {name: os.environ.get(name) for name in overrides}
+    previous_cwd = os.getcwd()
+    os.environ.update(overrides)
+    os.chdir(workdir)
+    try:
+        yield
+    finally:
+        os.chdir(previous_cwd)
+        for name, value in previous_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def run_pipeline(name, server, repeat):
+    """
+    Runs a pipeline `repeat` times.
+
+    Returns:
+        dict: Median/p95/min wall time, runs per minute and completion tokens per
+        second, or the error when the pipeline failed.
+    """
+    server.reset_counters()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            PIPELINES[name]()
+        except Exception as error:
+            traceback.print_exc()
+            return {"error": f"{type(error).__name__}: {error}"}
+        timings.append(time.perf_counter() - start)
+
+    timings.sort()
+    median = statistics.median(timings)
+    return {
+        "runs": repeat,
+        "median_s": round(median, 4),
+        "p95_s": round(timings[min(int(round(0.95 * (len(timings) - 1))), len(timings) - 1)], 4),
+        "min_s": round(timings[0], 4),
+        "runs_per_min": round(60.0 / median, 2) if median else None,
+        "requests": server.requests,
+        "completion_tokens_per_s": round(server.completion_tokens / sum(timings), 1) if sum(timings) else None,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Returns (name, baseline median, median) for every pipeline slower than the baseline allows."""
+    regressions = []
+    for name, result in results["pipelines"].items():
+        previous = baseline.get("pipelines", {}).get(name)
+        if not previous or "median_s" not in previous or "median_s" not in result:
+            continue
+        if result["median_s"] > previous["median_s"] * (1 + threshold):
+            regressions.append((name, previous["median_s"], result["median_s"]))
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Time the pipelines against an in-process mock LLM server.")
+    parser.add_argument("pipelines", nargs="*", metavar="pipeline",
+                        help=f"Pipelines to run: {', '.join(PIPELINES)}. Defaults to all of them.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per pipeline.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mock time to first token in seconds.")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="Mock generation speed.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="The baseline JSON file.")
+    parser.add_argument("--output", default=None, help="Where to write the results JSON.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed slowdown of the median before a pipeline counts as regressed.")
+    parser.add_argument("--update-baseline", action="store_true", help="Write the results to the baseline file.")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    names = args.pipelines or list(PIPELINES)
+    unknown = [name for name in names if name not in PIPELINES]
+    if unknown:
+        print(f"Unknown pipeline(s): {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    config = {"latency": args.latency, "tokens_per_second": args.tokens_per_second, "repeat": args.repeat}
+    results = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "config": config, "pipelines": {}}
+    with tempfile.TemporaryDirectory(prefix="itl-bench-") as workdir, \
+            MockLLMServer(latency=args.latency, tokens_per_second=args.tokens_per_second) as server, \
+            bench_environment(server, workdir):
+        write_samples()
+        for name in names:
+            print(f"Running {name}...", flush=True)
+            results["pipelines"][name] = run_pipeline(name, server, args.repeat)
+
+    print(f"\n{'pipeline':<22} {'median s':>9} {'p95 s':>8} {'runs/min':>9} {'requests':>9}")
+    for name, result in results["pipelines"].items():
+        if "error" in result:
+            print(f"{name:<22} ERROR {result['error']}")
+        else:
+            print(f"{name:<22} {result['median_s']:>9.3f} {result['p95_s']:>8.3f} "
+                  f"{result['runs_per_min']:>9} {result['requests']:>9}")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    status = 0
+    if os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline, "r") as file:
+            baseline = json.load(file)
+        if baseline.get("config") != config:
+            print(f"\nThe baseline was recorded with {baseline.get('config')}, not comparing.")
+        else:
+            for name, before, after in compare(results, baseline, args.threshold):
+                print(f"REGRESSION {name}: median {before:.3f}s -> {after:.3f}s")
+                status = 1
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"\nBaseline written to {args.baseline}")
+    return status
@@ -1,32 +1,92 @@
 import os
 import sys
-import openai
-from qdrant_client import QdrantClient
+import json
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from dotenv import load_dotenv
-import transformers
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.embedding_cache import get_embedding_cache
+from compression import (CACHE_DIR as DIGEST_CACHE_DIR, DIGEST_MODEL, ENABLED as CONTEXT_COMPRESSION, Compressor,
+                         DigestCache)
+from context_buffer import ContextBuffer, PRIORITY_FILE, PRIORITY_QUERY
+from lexical_index import LexicalIndex
+from query_cache import get_query_cache
+from rerank import get_reranker
+from retrieval import search_chunks_batch
+from vector_store import LocalVectorStore, QdrantVectorStore
+from utils.llm_gateway import get_gateway
+from utils.token_counter import count_tokens, get_tokenizer, truncate_tokens
 
 # Load environment variables
 load_dotenv()
+logger = logging.getLogger(__name__)
 QDRANT_URL = os.getenv('QDRANT_URL', 'http://localhost:6333')
 QDRANT_API_KEY = os.getenv('QDRANT_API_KEY')
 QDRANT_COLLECTION = os.getenv('QDRANT_COLLECTION', 'dimm-city-page')
+# "qdrant" or "local" (vector_store.py); the local store is also used when Qdrant cannot be reached
+VECTOR_STORE = os.getenv('ITL_VECTOR_STORE', 'qdrant')
+VECTOR_STORE_DIR = os.getenv('ITL_VECTOR_STORE_DIR', os.path.join('.cache', 'vectors'))
 OPENAI_API_URL = os.getenv('OPENAI_API_URL', 'http://localhost:11434/v1/')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 LLM_MODEL = os.getenv('LLM_MODEL', 'llama3.2')
 EMBED_MODEL = os.getenv('EMBED_MODEL', 'nomic-embed-text')
-#encoding = tiktoken.encoding_for_model(EMBED_MODEL)
-encoding = transformers.AutoTokenizer.from_pretrained('bert-base-uncased')
+ITL_CONFIG_LIST = os.getenv('ITL_CONFIG_LIST')
+STREAM_RESPONSES = os.getenv('STREAM_RESPONSES', 'false').lower() in ('1', 'true', 'yes')
+EXACT_TOKEN_COUNTS = os.getenv('EXACT_TOKEN_COUNTS', 'false').lower() in ('1', 'true', 'yes')
+# Retrieve for the instruction itself before the first LLM call
+PREFETCH = os.getenv('ITL_PREFETCH', 'true').lower() in ('1', 'true', 'yes')
+PREFETCH_K = int(os.getenv('ITL_PREFETCH_K', '5'))
 
 MAX_TOKENS = 4096
 RESERVED_TOKENS = 500  # Reserve tokens for the response and other parts
 MAX_CONTEXT_TOKENS = MAX_TOKENS - RESERVED_TOKENS
+# Threads running the directives of one response
+RETRIEVAL_WORKERS = int(os.getenv('ITL_RETRIEVAL_WORKERS', '4'))
+
+# All LLM and embedding calls go through the gateway. Without ITL_CONFIG_LIST it
+# only knows the single OPENAI_API_URL endpoint.
+if ITL_CONFIG_LIST:
+    gateway = get_gateway(ITL_CONFIG_LIST)
+else:
+    gateway = get_gateway(config_list=[{"base_url": OPENAI_API_URL, "api_key": OPENAI_API_KEY, "model": None}])
+
+# The Qdrant client is created on first use so that `--help` and runs that never
+# need it do not pay for importing qdrant_client.
+@lru_cache(maxsize=None)
+def get_qdrant_client():
+    from qdrant_client import QdrantClient
+    if QDRANT_URL == ":memory:":
+        # qdrant_client's local mode, used by the tests and the benchmarks
+        return QdrantClient(location=":memory:")
+    return QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+
+@lru_cache(maxsize=None)
+def get_vector_store():
+    if VECTOR_STORE == "local":
+        return LocalVectorStore(VECTOR_STORE_DIR)
+    from qdrant_client.http.exceptions import ResponseHandlingException
+    client = get_qdrant_client()
+    try:
+        client.get_collections()
+    except ResponseHandlingException as error:
+        logger.warning("Qdrant at %s cannot be reached, falling back to the local vector store in %s: %s",
+                       QDRANT_URL, VECTOR_STORE_DIR, error)
+        return LocalVectorStore(VECTOR_STORE_DIR)
+    return QdrantVectorStore(client)
 
-# Initialize OpenAI API key
-openai.api_key = OPENAI_API_KEY
-openai.base_url = OPENAI_API_URL
+_lexical_indexes = {}
 
-# Initialize Qdrant client
-qdrant_client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+# Only an index that exists is kept, so a long-running process finds one the indexer writes later
+def get_lexical_index(collection_name):
+    if collection_name not in _lexical_indexes:
+        index = LexicalIndex.open(collection_name)
+        if index is None:
+            return None
+        _lexical_indexes[collection_name] = index
+    return _lexical_indexes[collection_name]
 
 
 # System prompt for the LLM
@@ -49,93 +109,311 @@ INSTUCTION_PROMPT = (
 )
 
 # Function to generate embeddings using OpenAI's embedding model
+def embed_texts(texts):
+    response = gateway.embed(texts, model=EMBED_MODEL)
+    return [item.embedding for item in response.data]
+
+# Repeated queries are answered from the on-disk cache, see utils/embedding_cache.py
 def get_embedding(text):
-    response = openai.embeddings.create(
-        input=text,
-        model=EMBED_MODEL
-    )
-    return response.data[0].embedding
+    return get_embedding_cache().embed(EMBED_MODEL, [text], embed_texts)[0].tolist()
 
-# Function to interact with the LLM using OpenAI's ChatCompletion endpoint
-def query_llm(instruction, context):
+def build_messages(instruction, context):
     prompt = INSTUCTION_PROMPT.format(instruction=instruction, context=context)
     #print(prompt)
-    messages = [
+    return [
         {"role": "system", "content": SYSTEM_PROMPT},
         {
             "role": "user",
             "content": prompt
         }
     ]
-    response = openai.chat.completions.create(
+
+# Function to interact with the LLM using OpenAI's ChatCompletion endpoint
+def query_llm(instruction, context):
+    response = gateway.chat(
+        build_messages(instruction, context),
         model=LLM_MODEL,
-        messages=messages,
         #TODO: all settings to be set easily
         # max_tokens=500,
         # temperature=0.7,
     )
     return response.choices[0].message.content.strip()
 
-# Function to query the Qdrant database
-def query_qdrant(collection_name, query_text, limit=5):
-    query_embedding = get_embedding(query_text)
-    search_result = qdrant_client.search(
-        collection_name=collection_name,
-        query_vector=query_embedding,
-        limit=limit,        
-    )
-    return [point.payload.get('content', '') for point in search_result]
+def summarize_llm(messages, model, max_tokens):
+    response = gateway.chat(messages, model=model, max_tokens=max_tokens)
+    return response.choices[0].message.content
+
+# Summarizes older context segments once the context is over budget, None when compression is off
+@lru_cache(maxsize=None)
+def get_compressor():
+    if not CONTEXT_COMPRESSION:
+        return None
+    return Compressor(summarize_llm, DIGEST_MODEL or LLM_MODEL, cache=DigestCache(DIGEST_CACHE_DIR))
 
-# Function to calculate the number of tokens in a string
+# Same as query_llm but yields the response text as it is generated
+def stream_llm(instruction, context):
+    yield from gateway.chat_stream(build_messages(instruction, context), model=LLM_MODEL)
+
+DIRECTIVES = ("QUERY:", "FILE:")
+
+# Returns (directive, value) when the line holds a QUERY:/FILE: directive, e.g. ("QUERY", "auth flow")
+def parse_directive(line):
+    for marker in DIRECTIVES:
+        index = line.find(marker)
+        if index > -1:
+            value = line[index + len(marker):].strip()
+            if value:
+                return marker[:-1], value
+    return None
+
+# Returns every directive in a complete response, in order and without repeats; empty for a final answer
+def find_directives(response):
+    directives = (parse_directive(line) for line in response.splitlines())
+    return list(dict.fromkeys(directive for directive in directives if directive))
+
+class DirectiveScanner:
+    """
+    Finds QUERY:/FILE: directives in streamed text as soon as their line is complete.
+    `done` is set once a non-empty line follows the directives, i.e. the model has
+    finished listing what it needs.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.found = 0
+        self.done = False
+
+    def feed(self, text):
+        self.buffer += text
+        directives = []
+        while "\n" in self.buffer:
+            line, self.buffer = self.buffer.split("\n", 1)
+            directive = parse_directive(line)
+            if directive:
+                directives.append(directive)
+                self.found += 1
+            elif self.found and line.strip():
+                self.done = True
+        return directives
+
+    def flush(self):
+        line, self.buffer = self.buffer, ""
+        directive = parse_directive(line)
+        return [directive] if directive else []
+
+# Function to query the vector store (Qdrant or the local one), together with the BM25
+# index when the indexer built one. Chunks in exclude_ids (already in the context) are skipped and the results
+# are reranked when ITL_RERANKER is set and diversified, see retrieval.py. filters restricts the search by
+# payload, e.g. {"language": ["py"]}. Only the content payload is fetched.
+def query_qdrant(collection_name, query_text, limit=5, exclude_ids=(), filters=None):
+    return query_qdrant_batch(collection_name, [query_text], limit=limit, exclude_ids=exclude_ids, filters=filters)[0]
+
+# Same as query_qdrant for several queries: one embeddings request and one batch search for the
+# queries that are not answered by the semantic query cache (query_cache.py)
+def query_qdrant_batch(collection_name, query_texts, limit=5, exclude_ids=(), filters=None):
+    query_texts = list(query_texts)
+    query_embeddings = get_embedding_cache().embed(EMBED_MODEL, query_texts, embed_texts)
+    lexical_index = get_lexical_index(collection_name)
+    reranker = get_reranker()
+    cache = get_query_cache()
+    params = json.dumps({"filters": filters or {}, "limit": limit, "lexical": lexical_index is not None,
+                         "reranker": reranker.scorer.name if reranker else None}, sort_keys=True)
+    results = [cache.get(collection_name, embedding, params, exclude_ids) if cache else None
+               for embedding in query_embeddings]
+
+    misses = [index for index, result in enumerate(results) if result is None]
+    if misses:
+        found = search_chunks_batch(get_vector_store(), collection_name, [query_embeddings[index] for index in misses],
+                                    limit=limit, exclude_ids=exclude_ids,
+                                    query_texts=[query_texts[index] for index in misses],
+                                    lexical_index=lexical_index, filters=filters,
+                                    payload_fields=["content"], reranker=reranker)
+        for index, points in zip(misses, found):
+            results[index] = [(point.id, point.payload.get('content', '')) for point in points]
+            if cache:
+                cache.put(collection_name, query_embeddings[index], params, exclude_ids, results[index])
+    return results
+
+# Function to calculate the number of tokens in a string. The estimate is used unless
+# EXACT_TOKEN_COUNTS is set, then LLM_MODEL's tokenizer is loaded on first use.
 def num_tokens_from_string(string):
-    num_tokens = len(encoding.encode(string))
-    return num_tokens
-
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: python script.py '<instruction>'")
-        sys.exit(1)
-
-    instruction = sys.argv[1]
-    context = ""
-    max_iterations = 5
-    iteration = 0
-
-
-    while iteration < max_iterations:
-        # Manage context length to stay within token limits
-        context_tokens = num_tokens_from_string(context)
-        if context_tokens > MAX_CONTEXT_TOKENS:
-            # Truncate the context by removing the oldest information
-            
-            tokens = encoding.encode(context)
-            truncated_tokens = tokens[-MAX_CONTEXT_TOKENS:]
-            context = encoding.decode(truncated_tokens)
-
-        response = query_llm(instruction, context)
-
-        if response.find("QUERY:") > -1:
-            query_text = response[len("QUERY:"):].strip()
-            additional_data = query_qdrant(QDRANT_COLLECTION, query_text)
-            context += "\n" + "\n".join(additional_data)
-        elif response.find("FILE:") > -1:
-            file_path = response[len("FILE:"):].strip()
-            try:
-                with open(file_path, 'r') as file:
-                    file_content = file.read()
-                context += "\n" + file_content
-            except FileNotFoundError:
-                context += f"\n[Error: File '{file_path}' not found.]"
+    return count_tokens(string, LLM_MODEL, exact=EXACT_TOKEN_COUNTS)
+
+# Keeps the first max_tokens tokens of a string
+def truncate_to_tokens(string, max_tokens):
+    return truncate_tokens(string, max_tokens, model=LLM_MODEL, exact=EXACT_TOKEN_COUNTS)
+
+FILE_KEY_PREFIX = "FILE:"
+
+# The context keys that are chunk ids, the ones a search can exclude. File keys are not point ids
+# and a Qdrant server rejects them in a filter.
+def context_chunk_ids(context):
+    return {key for key in context.keys() if not (isinstance(key, str) and key.startswith(FILE_KEY_PREFIX))}
+
+# Reads a FILE directive's file into a (text, priority, key) segment
+def read_file_segment(path):
+    try:
+        with open(path, 'r') as file:
+            file_content = file.read()
+        return [(file_content, PRIORITY_FILE, FILE_KEY_PREFIX + os.path.abspath(path))]
+    except FileNotFoundError:
+        return [(f"[Error: File '{path}' not found.]", PRIORITY_FILE, None)]
+
+# Runs QUERY directives as one batch search and returns the (text, priority, key) segments of all of them
+def run_queries(queries, exclude_ids=(), filters=None):
+    results = query_qdrant_batch(QDRANT_COLLECTION, queries, exclude_ids=exclude_ids, filters=filters)
+    return [(content, PRIORITY_QUERY, point_id) for additional_data in results for point_id, content in additional_data]
+
+# Runs a QUERY/FILE directive and returns the (text, priority, key) segments to add to the context
+def run_directive(directive, value, exclude_ids=(), filters=None):
+    if directive == "QUERY":
+        additional_data = query_qdrant(QDRANT_COLLECTION, value, exclude_ids=exclude_ids, filters=filters)
+        return [(content, PRIORITY_QUERY, point_id) for point_id, content in additional_data]
+    return read_file_segment(value)
+
+# Iteration zero: the top chunks for the instruction, or nothing when the search fails
+def prefetch(instruction, filters=None, exclude_ids=()):
+    try:
+        additional_data = query_qdrant(QDRANT_COLLECTION, instruction, limit=PREFETCH_K, exclude_ids=exclude_ids,
+                                       filters=filters)
+    except Exception as error:
+        print(f"Note: could not prefetch context for the instruction: {error}")
+        return []
+    return [(content, PRIORITY_QUERY, point_id) for point_id, content in additional_data]
+
+def run_directives(directives, executor, exclude_ids=(), filters=None):
+    """
+    Starts every directive of a response at once: the queries as one batch search
+    and each file read on its own thread.
+
+    Returns:
+        list: Futures of (text, priority, key) segment lists, in the order to add them.
+    """
+    queries = [value for directive, value in directives if directive == "QUERY"]
+    pending = [executor.submit(run_queries, queries, exclude_ids, filters)] if queries else []
+    pending.extend(executor.submit(read_file_segment, value) for directive, value in directives if directive == "FILE")
+    return pending
+
+# Default output of a session: printed as it comes
+def print_text(text):
+    print(text, end="", flush=True)
+
+def stream_until_directive(instruction, context, executor, exclude_ids=(), filters=None, emit=print_text):
+    """
+    Emits the response as it streams in. Each directive's retrieval is started on the
+    executor as soon as its line is complete, and the rest of the generation is
+    cancelled once the model writes something other than directives after them.
+
+    Returns:
+        tuple: The response text so far and the pending retrieval futures (empty for a final answer).
+    """
+    scanner = DirectiveScanner()
+    parts = []
+    pending = []
+    seen = set()
+
+    def start(directives):
+        for directive in directives:
+            if directive not in seen:
+                seen.add(directive)
+                pending.append(executor.submit(run_directive, *directive, exclude_ids, filters))
+
+    stream = stream_llm(instruction, context)
+    try:
+        for text in stream:
+            emit(text)
+            parts.append(text)
+            start(scanner.feed(text))
+            if scanner.done:
+                return "".join(parts), pending
+    finally:
+        stream.close()
+        emit("\n")
+
+    start(scanner.flush())
+    return "".join(parts).strip(), pending
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Answer questions about a code base using the Qdrant index.")
+    parser.add_argument("instruction", type=str, help="The instruction or question for the assistant.")
+    parser.add_argument("--stream", action="store_true", default=STREAM_RESPONSES,
+                        help="Print tokens as they arrive and start retrieval as soon as a directive is seen.")
+    parser.add_argument("--language", action="append",
+                        help="Only search chunks of files with this extension, e.g. py (repeatable).")
+    parser.add_argument("--path", action="append",
+                        help="Only search chunks of this file, relative to the indexed repository (repeatable).")
+    parser.add_argument("--no-prefetch", dest="prefetch", action="store_false", default=PREFETCH,
+                        help="Start with an empty context instead of the chunks that match the instruction.")
+    return parser
+
+# Each retrieved chunk or file is tokenized once when it is added; when the budget
+# is exceeded whole segments are dropped, search results before files, oldest first.
+def new_context():
+    return ContextBuffer(MAX_CONTEXT_TOKENS, num_tokens_from_string, truncate=truncate_to_tokens,
+                         compress=get_compressor())
+
+def answer(instruction, context, executor, stream=False, filters=None, prefetch_context=PREFETCH,
+           emit=print_text, max_iterations=5):
+    """
+    Runs a companion session: calls the LLM and adds what it asks for to the context
+    until it answers or max_iterations is reached.
+
+    Args:
+        context (ContextBuffer): The session's context. It is updated in place, so a
+            follow-up question can start from it.
+        executor (Executor): Runs the retrievals.
+        emit (callable): Receives the output text as it is produced. Prints it by default.
+
+    Returns:
+        str: The final response.
+    """
+    if prefetch_context:
+        # The exact tokenizer loads while the instruction is embedded and searched,
+        # so the first call already carries context instead of asking for it
+        if EXACT_TOKEN_COUNTS:
+            executor.submit(get_tokenizer, LLM_MODEL)
+        prefetched = executor.submit(prefetch, instruction, filters, context_chunk_ids(context))
+        for text, priority, key in prefetched.result():
+            context.add(text, priority, key=key)
+
+    for iteration in range(max_iterations):
+        if stream:
+            response, pending = stream_until_directive(instruction, context.render(), executor,
+                                                       context_chunk_ids(context), filters, emit)
         else:
-            print("Final Response:", response)
-            break
-        print(response)
-        iteration += 1
-
-    if iteration == max_iterations:
-        print("Max iterations reached. Final context and instruction sent to LLM.")
-        final_response = query_llm(instruction, context)
-        print("Final Response:", final_response)
+            response = query_llm(instruction, context.render())
+            pending = run_directives(find_directives(response), executor, context_chunk_ids(context), filters)
+
+        if not pending:
+            if not stream:
+                emit(f"Final Response: {response}\n")
+            return response
+
+        # Everything the model asked for in this turn is added before the next call
+        for future in pending:
+            for text, priority, key in future.result():
+                context.add(text, priority, key=key)
+        if not stream:
+            emit(response + "\n")
+
+    emit("Max iterations reached. Final context and instruction sent to LLM.\n")
+    if stream:
+        parts = []
+        for text in stream_llm(instruction, context.render()):
+            emit(text)
+            parts.append(text)
+        emit("\n")
+        return "".join(parts).strip()
+    final_response = query_llm(instruction, context.render())
+    emit(f"Final Response: {final_response}\n")
+    return final_response
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    filters = {field: values for field, values in (("language", args.language), ("path", args.path)) if values}
+    with ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS) as executor:
+        answer(args.instruction, new_context(), executor, stream=args.stream, filters=filters,
+               prefetch_context=args.prefetch)
 
 if __name__ == "__main__":
     main()
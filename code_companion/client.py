@@ -0,0 +1,122 @@
+"""
+Thin client for the code companion server (server.py).
+
+Sends the question to a running `itl serve` and prints the answer the way cc.py
+does, without importing cc.py or any of its dependencies, so it starts
+instantly. The server address is ITL_COMPANION_URL, either http://host:port or
+unix:/path/to/socket (default http://127.0.0.1:8765).
+
+Usage:
+    itl ask "Where is the auth flow implemented?" --stream
+    itl ask "And where is it tested?" --session auth
+    ITL_COMPANION_URL=unix:/tmp/itl-companion.sock itl ask "..."
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import sys
+from urllib.parse import urlsplit
+
+DEFAULT_URL = os.getenv('ITL_COMPANION_URL', 'http://127.0.0.1:8765')
+
+
+def parse_address(url):
+    """Returns ("unix", path) for unix:/path and ("tcp", host, port) for http://host:port."""
+    if url.startswith("unix:"):
+        return "unix", url[len("unix:"):]
+    parts = urlsplit(url if "://" in url else "http://" + url)
+    return "tcp", parts.hostname or "127.0.0.1", parts.port or 8765
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def connect(url=None, timeout=None):
+    address = parse_address(url or DEFAULT_URL)
+    if address[0] == "unix":
+        return UnixHTTPConnection(address[1], timeout=timeout)
+    return http.client.HTTPConnection(address[1], address[2], timeout=timeout)
+
+
+def request(method, path, body=None, url=None, timeout=None):
+    """Sends a request to the server and returns the open response."""
+    connection = connect(url, timeout=timeout)
+    payload = None if body is None else json.dumps(body).encode("utf-8")
+    connection.request(method, path, body=payload, headers={"Content-Type": "application/json"})
+    return connection.getresponse()
+
+
+def ask(instruction, url=None, session=None, stream=False, language=None, path=None, prefetch=None, emit=None):
+    """
+    Asks the server a question and passes its output to emit as it arrives.
+
+    Returns:
+        str: The final response.
+    """
+    emit = emit or (lambda text: print(text, end="", flush=True))
+    body = {"instruction": instruction, "session": session, "stream": stream, "language": language, "path": path,
+            "prefetch": prefetch}
+    response = request("POST", "/ask", {key: value for key, value in body.items() if value is not None}, url=url)
+    if not stream:
+        result = json.loads(response.read() or b"{}")
+        if response.status != 200:
+            raise RuntimeError(result.get("error", f"HTTP {response.status}"))
+        emit(result["output"])
+        return result["response"]
+
+    # One JSON object per line: {"text": ...} while the answer streams, then {"response": ...}
+    for line in response:
+        message = json.loads(line)
+        if "error" in message:
+            raise RuntimeError(message["error"])
+        if "text" in message:
+            emit(message["text"])
+        if "response" in message:
+            return message["response"]
+    raise RuntimeError("The server closed the connection before the answer was complete.")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Ask a running code companion server (itl serve).")
+    parser.add_argument("instruction", type=str, help="The instruction or question for the assistant.")
+    parser.add_argument("--stream", action="store_true", help="Print tokens as they arrive.")
+    parser.add_argument("--session", default=None,
+                        help="Keep the context under this name so follow-up questions can use it.")
+    parser.add_argument("--language", action="append",
+                        help="Only search chunks of files with this extension, e.g. py (repeatable).")
+    parser.add_argument("--path", action="append",
+                        help="Only search chunks of this file, relative to the indexed repository (repeatable).")
+    parser.add_argument("--no-prefetch", dest="prefetch", action="store_false", default=None,
+                        help="Start with an empty context instead of the chunks that match the instruction.")
+    parser.add_argument("--url", default=DEFAULT_URL,
+                        help="The server, http://host:port or unix:/path. Defaults to ITL_COMPANION_URL.")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        ask(args.instruction, url=args.url, session=args.session, stream=args.stream, language=args.language,
+            path=args.path, prefetch=args.prefetch)
+    except (ConnectionError, FileNotFoundError):
+        print(f"No companion server at {args.url}. Start one with `itl serve`.", file=sys.stderr)
+        return 1
+    except RuntimeError as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+Context compression for the code companion.
+
+When the context is over its token budget, ContextBuffer asks a Compressor for
+digests of its older segments before it drops anything: a cheap model
+(ITL_DIGEST_MODEL) summarizes each segment in about ITL_DIGEST_TOKENS (default
+150) tokens, keeping the paths, names and facts a later question may need. If
+the digests still do not fit they are summarized together into one. Digests are
+cached on disk by model and segment hash (.cache/digests, ITL_DIGEST_CACHE_DIR),
+so a chunk is only ever summarized once per model.
+
+Compression is off unless ITL_DIGEST_MODEL names a model for it, since every
+digest is an extra LLM call. ITL_CONTEXT_COMPRESSION=true turns it on with
+LLM_MODEL as the digest model, ITL_CONTEXT_COMPRESSION=false turns it off.
+Without compression the context falls back to dropping whole segments.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DIGEST_MODEL = os.getenv('ITL_DIGEST_MODEL')
+ENABLED = os.getenv('ITL_CONTEXT_COMPRESSION', 'true' if DIGEST_MODEL else 'false').lower() in ('1', 'true', 'yes')
+DIGEST_TOKENS = int(os.getenv('ITL_DIGEST_TOKENS', '150'))
+CACHE_DIR = os.getenv('ITL_DIGEST_CACHE_DIR', os.path.join(".cache", "digests"))
+WORKERS = 4
+
+DIGEST_PROMPT = (
+    "Summarize the following context for a code assistant in at most {max_words} words. "
+    "Keep file paths, function, class and variable names, signatures and any facts needed "
+    "to answer questions about it. Leave out everything else. Reply with the summary only.\n\n"
+    "{text}"
+)
+
+logger = logging.getLogger(__name__)
+
+
+class DigestCache:
+    """
+    Args:
+        directory (str): Where digests.sqlite is kept.
+    """
+
+    def __init__(self, directory):
+        self._lock = threading.Lock()
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self._conn = sqlite3.connect(os.path.join(directory, "digests.sqlite"), check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS digests ("
+                " model TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " digest TEXT NOT NULL,"
+                " created REAL NOT NULL,"
+                " PRIMARY KEY (model, key))"
+            )
+
+    def get(self, model, key):
+        with self._lock:
+            row = self._conn.execute("SELECT digest FROM digests WHERE model = ? AND key = ?", (model, key)).fetchone()
+        return row[0] if row else None
+
+    def put(self, model, key, digest):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?)", (model, key, digest, time.time()))
+
+
+class Compressor:
+    """
+    Summarizes context segments, the `compress` callable of a ContextBuffer.
+
+    Args:
+        chat (callable): chat(messages, model, max_tokens) returns the reply text.
+        model (str): The model that writes the digests.
+        max_tokens (int, optional): The length of a digest. Defaults to ITL_DIGEST_TOKENS.
+        cache (DigestCache, optional): Where digests are looked up and stored.
+    """
+
+    def __init__(self, chat, model, max_tokens=None, cache=None):
+        self.chat = chat
+        self.model = model
+        self.max_tokens = max_tokens or DIGEST_TOKENS
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(max_workers=WORKERS)
+
+    def digest(self, text):
+        """Returns the digest of one text, or None when the model could not be reached."""
+        key = hashlib.sha256(f"{self.max_tokens}\x00{text}".encode("utf-8")).hexdigest()
+        cached = self.cache.get(self.model, key) if self.cache else None
+        if cached is not None:
+            return cached
+        prompt = DIGEST_PROMPT.format(max_words=int(self.max_tokens * 0.75), text=text)
+        try:
+            digest = self.chat([{"role": "user", "content": prompt}], self.model, self.max_tokens).strip()
+        except Exception as error:
+            logger.warning("Could not summarize a context segment with %s: %s", self.model, error)
+            return None
+        digest = "[Summary] " + digest
+        if self.cache:
+            self.cache.put(self.model, key, digest)
+        return digest
+
+    def __call__(self, texts):
+        """Returns a digest per text (None where it failed), summarizing the uncached ones concurrently."""
+        return list(self._executor.map(self.digest, texts))
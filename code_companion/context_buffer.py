@@ -0,0 +1,148 @@
+"""
+Token-budgeted context for the code companion.
+
+The context is a list of segments (a retrieved chunk, a file) that each know
+their token count, so adding a segment costs one tokenization of that segment
+and staying within the budget is a sum over the segments, not a re-tokenization
+of the whole context. When the budget is exceeded and a compressor is given,
+the older segments are first replaced by digests, and the digests by a single
+digest of all of them if that is still too much (compression.py). Only then are
+whole segments dropped, lowest priority first and oldest first within a
+priority. Segments can carry a key (a Qdrant point id, a file path) so the same
+chunk is not added twice, also after it was summarized.
+"""
+from collections import namedtuple
+
+# Files the model asked for by name are worth more than search results
+PRIORITY_QUERY = 1
+PRIORITY_FILE = 2
+
+# level is 0 for the text as added, 1 for a digest and 2 for a digest of digests;
+# merged_keys are the keys of the segments a digest of digests stands for
+Segment = namedtuple("Segment", ["text", "tokens", "priority", "order", "key", "level", "merged_keys"],
+                     defaults=(0, ()))
+
+
+class ContextBuffer:
+    """
+    Args:
+        max_tokens (int): The token budget of the rendered context.
+        count_tokens (callable): Returns the number of tokens in a string.
+        truncate (callable, optional): truncate(text, max_tokens) shortens a single
+            segment that is larger than the whole budget. Without it such a segment is
+            cut proportionally by characters.
+        compress (callable, optional): compress(texts) returns a shorter digest per
+            text, or None where it has none. Without it segments are only dropped.
+    """
+
+    def __init__(self, max_tokens, count_tokens, truncate=None, compress=None):
+        self.max_tokens = max_tokens
+        self.count_tokens = count_tokens
+        self.truncate = truncate
+        self.compress = compress
+        self.segments = []
+        self.tokens = 0
+        self._order = 0
+        self._rendered = ""
+
+    def __len__(self):
+        return len(self.segments)
+
+    def keys(self):
+        """Returns the keys of the segments in the context."""
+        keys = {segment.key for segment in self.segments if segment.key is not None}
+        keys.update(key for segment in self.segments for key in segment.merged_keys)
+        return keys
+
+    def add(self, text, priority=PRIORITY_QUERY, key=None):
+        """
+        Adds a segment and evicts segments until the context fits the budget again.
+        A segment whose key is already in the context is skipped.
+
+        Returns:
+            bool: Whether the segment was added.
+        """
+        if not text.strip() or (key is not None and key in self.keys()):
+            return False
+        tokens = self.count_tokens(text)
+        if tokens > self.max_tokens:
+            text = self._truncate(text, tokens)
+            tokens = self.count_tokens(text)
+        self.segments.append(Segment(text, tokens, priority, self._order, key))
+        self._order += 1
+        self.tokens += tokens
+        self._evict()
+        self._rendered = None
+        return True
+
+    def _truncate(self, text, tokens):
+        if self.truncate is not None:
+            return self.truncate(text, self.max_tokens)
+        return text[:int(len(text) * self.max_tokens / tokens)]
+
+    def _replace(self, replacements):
+        """Swaps segments (by order) for new ones, keeping the token total in step."""
+        for index, segment in enumerate(self.segments):
+            if segment.order in replacements:
+                replacement = replacements[segment.order]
+                self.tokens += replacement.tokens - segment.tokens
+                self.segments[index] = replacement
+
+    def _compress(self):
+        # The newest segment is the one that was just asked for and is kept as it is
+        older = [segment for segment in self.segments[:-1] if segment.level == 0]
+        digests = self.compress([segment.text for segment in older]) if older else []
+        replacements = {}
+        for segment, digest in zip(older, digests):
+            if digest is None:
+                continue
+            tokens = self.count_tokens(digest)
+            if tokens < segment.tokens:
+                replacements[segment.order] = segment._replace(text=digest, tokens=tokens, level=1)
+        self._replace(replacements)
+        if self.tokens <= self.max_tokens:
+            return
+
+        # A digest of digests is folded into the next one, so the oldest context is kept as a rolling summary
+        summaries = [segment for segment in self.segments[:-1] if segment.level > 0]
+        if len(summaries) < 2:
+            return
+        digest, = self.compress(["\n".join(segment.text for segment in summaries)])
+        tokens = self.count_tokens(digest) if digest is not None else None
+        if tokens is None or tokens >= sum(segment.tokens for segment in summaries):
+            return
+        first = summaries[0]
+        merged_keys = tuple(key for segment in summaries
+                            for key in ((segment.key,) if segment.key is not None else ()) + segment.merged_keys)
+        merged = Segment(digest, tokens, min(segment.priority for segment in summaries), first.order, None, 2,
+                         merged_keys)
+        dropped = {segment.order for segment in summaries if segment.order != first.order}
+        self.tokens -= sum(segment.tokens for segment in summaries if segment.order in dropped)
+        self.segments = [segment for segment in self.segments if segment.order not in dropped]
+        self._replace({first.order: merged})
+
+    def _evict(self):
+        if self.tokens <= self.max_tokens:
+            return
+        if self.compress is not None:
+            self._compress()
+            if self.tokens <= self.max_tokens:
+                return
+        # The newest segment is the one that was just asked for and always fits on its own
+        candidates = sorted(self.segments[:-1], key=lambda segment: (segment.priority, segment.order))
+        evicted = set()
+        for segment in candidates:
+            if self.tokens <= self.max_tokens:
+                break
+            evicted.add(segment.order)
+            self.tokens -= segment.tokens
+        self.segments = [segment for segment in self.segments if segment.order not in evicted]
+
+    def render(self):
+        """Returns the context text, segments in the order they were added."""
+        if self._rendered is None:
+            self._rendered = "".join("\n" + segment.text for segment in self.segments)
+        return self._rendered
+
+    def __str__(self):
+        return self.render()
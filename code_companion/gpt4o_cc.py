@@ -2,7 +2,6 @@ import os
 import sys
 import openai
 from qdrant_client import QdrantClient
-from qdrant_client.http.models import Filter, FieldCondition, MatchValue
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -48,9 +47,11 @@ def query_qdrant(collection_name, query_text, limit=5):
     search_result = qdrant_client.search(
         collection_name=collection_name,
         query_vector=query_text,
-        limit=limit
+        limit=limit,
+        with_payload=["content"],
+        with_vectors=False,
     )
-    return [point.payload for point in search_result]
+    return [point.payload.get("content", "") for point in search_result]
 
 # Main processing loop
 def main():
@@ -0,0 +1,380 @@
+"""
+Builds the vector collection the code companion answers from, in Qdrant or in
+the local store (vector_store.py).
+
+Walks a repository, splits every text file into chunks along its structure
+(top-level functions and classes for Python, headings for markdown, top-level
+blocks for everything else), embeds the chunks in batches with a few requests in
+flight and upserts them with their path and line range. cc.py reads the `content`
+payload of the points this creates.
+
+Runs after the first one are incremental: a manifest (.cache/index) records the
+chunk hashes of every file, the files git reports as changed since the last run
+(or, outside git, the ones whose size or mtime changed) are re-chunked, and only
+chunks with new content are embedded. Points of removed chunks are deleted and
+unchanged chunks that moved get their line range updated.
+
+The same chunks go into a BM25 index next to the manifest (lexical_index.py),
+which cc.py searches together with the vectors.
+
+Usage:
+    python code_companion/indexer.py ~/src/my-repo --collection my-repo
+    python code_companion/indexer.py ~/src/my-repo --full
+    QDRANT_URL=:memory: python code_companion/indexer.py .
+    ITL_VECTOR_STORE=local python code_companion/indexer.py .
+"""
+import argparse
+import ast
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from cc import EMBED_MODEL, QDRANT_COLLECTION, embed_texts, get_vector_store
+from lexical_index import LexicalIndex, index_path
+from query_cache import bump_index_version
+
+CHUNK_LINES = int(os.getenv('ITL_INDEX_CHUNK_LINES', '60'))
+BATCH_SIZE = int(os.getenv('ITL_INDEX_BATCH_SIZE', '64'))
+CONCURRENCY = int(os.getenv('ITL_INDEX_CONCURRENCY', '4'))
+UPSERT_BATCH_SIZE = int(os.getenv('ITL_INDEX_UPSERT_BATCH_SIZE', '256'))
+MAX_FILE_BYTES = int(os.getenv('ITL_INDEX_MAX_FILE_KB', '256')) * 1024
+MANIFEST_DIR = os.getenv('ITL_INDEX_MANIFEST_DIR', os.path.join(".cache", "index"))
+MANIFEST_VERSION = 1
+
+SKIP_DIRS = {".git", ".cache", ".output", ".venv", "venv", "node_modules", "__pycache__", "dist", "build"}
+TEXT_EXTENSIONS = {
+    ".py", ".js", ".jsx", ".ts", ".tsx", ".mjs", ".vue", ".svelte", ".java", ".kt", ".go", ".rs", ".c", ".h",
+    ".cpp", ".hpp", ".cs", ".rb", ".php", ".swift", ".scala", ".sh", ".sql", ".html", ".css", ".scss",
+    ".md", ".rst", ".txt", ".json", ".yaml", ".yml", ".toml", ".ini", ".cfg",
+}
+MARKDOWN_EXTENSIONS = {".md", ".rst"}
+
+Chunk = namedtuple("Chunk", ["path", "start_line", "end_line", "content"])
+
+
+def list_files(root):
+    """Returns the repository's text files relative to root, the ones git tracks when it is a git repo."""
+    try:
+        output = subprocess.run(["git", "ls-files", "--cached", "--others", "--exclude-standard"],
+                                cwd=root, capture_output=True, text=True, check=True).stdout
+        candidates = output.splitlines()
+    except (OSError, subprocess.CalledProcessError):
+        candidates = []
+        for directory, dirnames, filenames in os.walk(root):
+            dirnames[:] = [name for name in dirnames if name not in SKIP_DIRS and not name.startswith(".")]
+            for filename in filenames:
+                candidates.append(os.path.relpath(os.path.join(directory, filename), root))
+
+    files = []
+    for path in sorted(candidates):
+        parts = path.replace(os.sep, "/").split("/")
+        if os.path.splitext(path)[1].lower() not in TEXT_EXTENSIONS or SKIP_DIRS.intersection(parts[:-1]):
+            continue
+        full_path = os.path.join(root, path)
+        if os.path.isfile(full_path) and os.path.getsize(full_path) <= MAX_FILE_BYTES:
+            files.append(path)
+    return files
+
+
+def _split_range(start, end, max_lines):
+    """Splits the line range [start, end) into windows of at most max_lines."""
+    return [(offset, min(offset + max_lines, end)) for offset in range(start, end, max_lines)]
+
+
+def _python_boundaries(text):
+    """Returns the first line (0 based) of every top-level statement, or None when the file does not parse."""
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        return None
+    boundaries = []
+    for node in tree.body:
+        decorators = getattr(node, "decorator_list", [])
+        first_line = min([node.lineno] + [decorator.lineno for decorator in decorators])
+        boundaries.append(first_line - 1)
+    return boundaries
+
+
+def _markdown_boundaries(lines):
+    return [index for index, line in enumerate(lines) if line.lstrip().startswith("#")]
+
+
+def _block_boundaries(lines):
+    # A non-indented line after a blank line usually starts a new top-level block
+    return [index for index, line in enumerate(lines)
+            if line.strip() and not line[0].isspace() and (index == 0 or not lines[index - 1].strip())]
+
+
+def chunk_text(path, text, max_lines=None):
+    """
+    Splits a file into chunks that start at top-level boundaries. Neighbouring small
+    blocks are merged up to max_lines, larger blocks are split into windows.
+    """
+    max_lines = max_lines or CHUNK_LINES
+    lines = text.splitlines()
+    if not lines:
+        return []
+
+    extension = os.path.splitext(path)[1].lower()
+    boundaries = None
+    if extension == ".py":
+        boundaries = _python_boundaries(text)
+    elif extension in MARKDOWN_EXTENSIONS:
+        boundaries = _markdown_boundaries(lines)
+    if boundaries is None:
+        boundaries = _block_boundaries(lines)
+
+    starts = sorted(set([0] + [boundary for boundary in boundaries if 0 < boundary < len(lines)]))
+    blocks = list(zip(starts, starts[1:] + [len(lines)]))
+
+    ranges = []
+    for start, end in blocks:
+        if end - start > max_lines:
+            ranges.extend(_split_range(start, end, max_lines))
+        elif ranges and end - ranges[-1][0] <= max_lines:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+
+    chunks = []
+    for start, end in ranges:
+        content = "\n".join(lines[start:end]).strip()
+        if content:
+            # No line numbers in the embedded text, so a chunk that only moved keeps its embedding
+            chunks.append(Chunk(path, start + 1, end, f"# {path}\n{content}"))
+    return chunks
+
+
+def read_text(root, path):
+    try:
+        with open(os.path.join(root, path), "rb") as file:
+            data = file.read()
+        return data.decode("utf-8"), hashlib.sha256(data).hexdigest()
+    except (UnicodeDecodeError, OSError):
+        return None, None
+
+
+def chunk_ids(chunks):
+    """Returns a point id per chunk, derived from its path and content."""
+    ids = []
+    seen = {}
+    for chunk in chunks:
+        digest = hashlib.sha256(chunk.content.encode("utf-8")).hexdigest()
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        ids.append(str(uuid.uuid5(uuid.NAMESPACE_URL, f"{chunk.path}\x00{digest}\x00{occurrence}")))
+    return ids
+
+
+def chunk_payload(chunk):
+    return {
+        "content": chunk.content,
+        "path": chunk.path,
+        "start_line": chunk.start_line,
+        "end_line": chunk.end_line,
+        "language": os.path.splitext(chunk.path)[1].lstrip(".").lower(),
+    }
+
+
+def embed_chunks(chunks, embed_fn=None, batch_size=None, concurrency=None):
+    """Embeds the chunks in batches, with up to `concurrency` batches in flight."""
+    embed_fn = embed_fn or embed_texts
+    batch_size = batch_size or BATCH_SIZE
+    batches = [chunks[offset:offset + batch_size] for offset in range(0, len(chunks), batch_size)]
+    with ThreadPoolExecutor(max_workers=concurrency or CONCURRENCY) as executor:
+        results = executor.map(lambda batch: embed_fn([chunk.content for chunk in batch]), batches)
+        return [embedding for embeddings in results for embedding in embeddings]
+
+
+def upsert_chunks(store, collection, chunks, ids, embeddings, batch_size=None):
+    batch_size = batch_size or UPSERT_BATCH_SIZE
+    for offset in range(0, len(chunks), batch_size):
+        store.upsert(collection, ids[offset:offset + batch_size], embeddings[offset:offset + batch_size],
+                     [chunk_payload(chunk) for chunk in chunks[offset:offset + batch_size]])
+
+
+def delete_points(store, collection, ids, batch_size=None):
+    batch_size = batch_size or UPSERT_BATCH_SIZE
+    for offset in range(0, len(ids), batch_size):
+        store.delete(collection, ids[offset:offset + batch_size])
+
+
+def manifest_path(root, collection):
+    root_hash = hashlib.sha256(os.path.abspath(root).encode("utf-8")).hexdigest()[:8]
+    return os.path.join(MANIFEST_DIR, f"{collection}-{root_hash}.json")
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as file:
+        return json.load(file)
+
+
+def save_manifest(path, manifest):
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(path + ".tmp", "w") as file:
+        json.dump(manifest, file)
+    os.replace(path + ".tmp", path)
+
+
+def git_head(root):
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=root, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def git_changed_files(root, since):
+    """
+    Returns the paths (relative to root) that differ between the commit `since` and
+    the working tree, plus the untracked ones, or None when git cannot tell.
+    """
+    try:
+        changed = subprocess.run(["git", "diff", "--name-only", "--relative", since, "--", "."], cwd=root,
+                                 capture_output=True, text=True, check=True).stdout.splitlines()
+        untracked = subprocess.run(["git", "ls-files", "--others", "--exclude-standard"], cwd=root,
+                                   capture_output=True, text=True, check=True).stdout.splitlines()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return set(changed) | set(untracked)
+
+
+def _file_stat(root, path):
+    stat = os.stat(os.path.join(root, path))
+    return stat.st_mtime, stat.st_size
+
+
+def index_repository(root, store=None, collection=None, embed_fn=None, recreate=False,
+                     max_lines=None, batch_size=None, concurrency=None):
+    """
+    Brings a collection up to date with a repository, re-embedding only what changed
+    since the last run. The whole repository is indexed when there is no manifest yet,
+    when the chunking or embedding settings changed, or with recreate.
+
+    Args:
+        root (str): The repository to index.
+        store (VectorStore, optional): Defaults to the companion's store (Qdrant or local).
+        collection (str, optional): Defaults to QDRANT_COLLECTION.
+        embed_fn (callable, optional): Maps a list of texts to a list of vectors.
+            Defaults to the companion's embedding model through the gateway.
+        recreate (bool, optional): Drop the collection and index everything.
+
+    Returns:
+        dict: Counts of the files checked and the chunks embedded, moved and deleted.
+    """
+    store = store or get_vector_store()
+    collection = collection or QDRANT_COLLECTION
+    max_lines = max_lines or CHUNK_LINES
+    path = manifest_path(root, collection)
+    settings = {"version": MANIFEST_VERSION, "collection": collection, "embed_model": EMBED_MODEL,
+                "chunk_lines": max_lines}
+
+    manifest = load_manifest(path)
+    if manifest is not None and (manifest.get("settings") != settings or not store.exists(collection)
+                                 or not os.path.exists(index_path(collection))):
+        manifest = None
+    lexical = LexicalIndex(index_path(collection))
+    if recreate or manifest is None:
+        recreate = True
+        manifest = {"settings": settings, "git_head": None, "files": {}}
+        lexical.clear()
+
+    files = list_files(root)
+    known = manifest["files"]
+    current = set(files)
+    deleted = [name for name in known if name not in current]
+
+    changed_in_git = git_changed_files(root, manifest["git_head"]) if manifest["git_head"] else None
+    # git catches edits that keep the mtime, the stat check catches files reverted to
+    # the committed version and works outside git. Candidates are hashed before re-chunking.
+    candidates = [name for name in files
+                  if name not in known
+                  or (changed_in_git is not None and name in changed_in_git)
+                  or list(_file_stat(root, name)) != [known[name]["mtime"], known[name]["size"]]]
+
+    stats = {"files": len(files), "changed_files": 0, "embedded": 0, "moved": 0, "deleted": 0}
+    new_chunks, new_ids, stale_ids, moved = [], [], [], []
+    for name in candidates:
+        text, file_hash = read_text(root, name)
+        entry = known.get(name)
+        if text is None:
+            if entry is not None:
+                deleted.append(name)
+            continue
+        mtime, size = _file_stat(root, name)
+        if entry is not None and entry["hash"] == file_hash:
+            entry.update(mtime=mtime, size=size)
+            continue
+
+        stats["changed_files"] += 1
+        chunks = chunk_text(name, text, max_lines=max_lines)
+        ids = chunk_ids(chunks)
+        old_chunks = entry["chunks"] if entry else {}
+        for chunk, point_id in zip(chunks, ids):
+            if point_id not in old_chunks:
+                new_chunks.append(chunk)
+                new_ids.append(point_id)
+            elif old_chunks[point_id] != [chunk.start_line, chunk.end_line]:
+                moved.append((point_id, chunk))
+        current_ids = set(ids)
+        stale_ids.extend(point_id for point_id in old_chunks if point_id not in current_ids)
+        known[name] = {"hash": file_hash, "mtime": mtime, "size": size,
+                       "chunks": {point_id: [chunk.start_line, chunk.end_line] for chunk, point_id in zip(chunks, ids)}}
+
+    for name in deleted:
+        stale_ids.extend(known.pop(name)["chunks"])
+
+    if new_chunks:
+        embeddings = embed_chunks(new_chunks, embed_fn=embed_fn, batch_size=batch_size, concurrency=concurrency)
+        store.create(collection, len(embeddings[0]), recreate=recreate)
+        upsert_chunks(store, collection, new_chunks, new_ids, embeddings)
+        lexical.add(new_ids, [chunk.content for chunk in new_chunks])
+    elif recreate:
+        store.drop(collection)
+    for point_id, chunk in moved:
+        store.set_payload(collection, point_id, {"start_line": chunk.start_line, "end_line": chunk.end_line})
+    if stale_ids and store.exists(collection):
+        delete_points(store, collection, stale_ids)
+    lexical.delete(stale_ids)
+
+    stats.update(embedded=len(new_chunks), moved=len(moved), deleted=len(stale_ids))
+    if recreate or new_chunks or moved or stale_ids:
+        bump_index_version(collection)
+    manifest["git_head"] = git_head(root)
+    save_manifest(path, manifest)
+    return stats
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Index a repository into the code companion's vector collection.")
+    parser.add_argument("root", nargs="?", default=".", help="The repository to index.")
+    parser.add_argument("--collection", default=QDRANT_COLLECTION, help="The collection to write to.")
+    parser.add_argument("--full", "--recreate", dest="recreate", action="store_true",
+                        help="Drop the collection and index everything instead of only what changed.")
+    parser.add_argument("--chunk-lines", type=int, default=CHUNK_LINES, help="Maximum lines per chunk.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Chunks per embeddings request.")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Embeddings requests in flight.")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    stats = index_repository(args.root, collection=args.collection, recreate=args.recreate,
+                             max_lines=args.chunk_lines, batch_size=args.batch_size,
+                             concurrency=args.concurrency)
+    print(f"Indexed {os.path.abspath(args.root)} into '{args.collection}' ({EMBED_MODEL}): "
+          f"{stats['changed_files']} of {stats['files']} files changed, {stats['embedded']} chunks embedded, "
+          f"{stats['moved']} moved, {stats['deleted']} deleted.")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""
+On-disk BM25 index of the companion's chunks.
+
+The indexer writes it next to its manifest (.cache/index/<collection>.lexical.sqlite)
+whenever it upserts or deletes points, with the same point ids. Terms are code
+aware: `getUserById` and `get_user_by_id` are indexed whole and as their parts, so
+a search for an exact identifier or error string finds the chunk that contains it
+even when the embedding does not. Lookups go through the term index in SQLite, so
+a search only reads the postings of its own terms.
+"""
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+
+INDEX_DIR = os.getenv('ITL_INDEX_MANIFEST_DIR', os.path.join(".cache", "index"))
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+CAMEL_PART = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+def tokenize(text):
+    """Returns the lowercased identifiers in text plus their snake_case and camelCase parts."""
+    terms = []
+    for identifier in IDENTIFIER.findall(text):
+        terms.append(identifier.lower())
+        parts = [part for piece in identifier.split("_") for part in CAMEL_PART.findall(piece)]
+        if len(parts) > 1:
+            terms.extend(part.lower() for part in parts)
+    return terms
+
+
+def index_path(collection):
+    return os.path.join(INDEX_DIR, f"{collection}.lexical.sqlite")
+
+
+class LexicalIndex:
+    """
+    Args:
+        path (str): The SQLite file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                " id TEXT PRIMARY KEY,"
+                " length INTEGER NOT NULL,"
+                " content TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS postings ("
+                " term TEXT NOT NULL,"
+                " id TEXT NOT NULL,"
+                " tf INTEGER NOT NULL,"
+                " PRIMARY KEY (term, id)) WITHOUT ROWID"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS postings_id ON postings (id)")
+
+    @classmethod
+    def open(cls, collection):
+        """Returns the collection's index, or None when the indexer has not written one."""
+        path = index_path(collection)
+        return cls(path) if os.path.exists(path) else None
+
+    def add(self, ids, contents):
+        """Adds or replaces documents."""
+        with self._lock, self._conn:
+            for doc_id, content in zip(ids, contents):
+                doc_id = str(doc_id)
+                terms = Counter(tokenize(content))
+                self._conn.execute("DELETE FROM postings WHERE id = ?", (doc_id,))
+                self._conn.execute("INSERT OR REPLACE INTO documents (id, length, content) VALUES (?, ?, ?)",
+                                   (doc_id, sum(terms.values()), content))
+                self._conn.executemany("INSERT INTO postings (term, id, tf) VALUES (?, ?, ?)",
+                                       [(term, doc_id, tf) for term, tf in terms.items()])
+
+    def delete(self, ids):
+        with self._lock, self._conn:
+            for doc_id in ids:
+                self._conn.execute("DELETE FROM postings WHERE id = ?", (str(doc_id),))
+                self._conn.execute("DELETE FROM documents WHERE id = ?", (str(doc_id),))
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM postings")
+            self._conn.execute("DELETE FROM documents")
+
+    def content(self, ids):
+        """Returns {id: content} for the given ids."""
+        ids = [str(doc_id) for doc_id in ids]
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, content FROM documents WHERE id IN ({','.join('?' * len(ids))})", ids
+            ).fetchall() if ids else []
+        return dict(rows)
+
+    def search(self, query, limit=20, exclude_ids=()):
+        """
+        Returns up to `limit` (id, score) pairs ranked by BM25, leaving out exclude_ids.
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        excluded = {str(doc_id) for doc_id in exclude_ids}
+        with self._lock:
+            count, total_length = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM documents").fetchone()
+            if not count:
+                return []
+            average_length = total_length / count
+            scores = {}
+            for term in terms:
+                postings = self._conn.execute(
+                    "SELECT p.id, p.tf, d.length FROM postings p JOIN documents d ON d.id = p.id WHERE p.term = ?",
+                    (term,)).fetchall()
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf, length in postings:
+                    if doc_id in excluded:
+                        continue
+                    norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
@@ -0,0 +1,200 @@
+"""
+Semantic cache of the companion's search results.
+
+Models often ask for nearly the same QUERY again, within a session and across
+sessions. Every search stores its query embedding and the chunks it returned
+(.cache/query_cache/queries.sqlite). A later query whose embedding has a cosine
+similarity of at least ITL_QUERY_CACHE_THRESHOLD (default 0.95) to a cached one,
+with the same collection, filters, limit and reranker, gets the cached chunks
+without a search. The lookup is a NumPy dot product over the cached embeddings.
+
+A cached result is only used when the query excludes everything the cached
+search excluded and none of its chunks, so it is the result the search would
+return. Entries expire after ITL_QUERY_CACHE_TTL seconds (default 3600) and as
+soon as the indexer changes the collection: every indexing run that changes
+something writes a new index version (.cache/index/<collection>.version).
+ITL_QUERY_CACHE_MAX_ENTRIES (default 4096) bounds the file, least recently used
+entries are dropped first. ITL_QUERY_CACHE=false turns the cache off.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from lexical_index import INDEX_DIR
+from vector_store import normalize
+
+ENABLED = os.getenv('ITL_QUERY_CACHE', 'true').lower() in ('1', 'true', 'yes')
+CACHE_DIR = os.getenv('ITL_QUERY_CACHE_DIR', os.path.join(".cache", "query_cache"))
+THRESHOLD = float(os.getenv('ITL_QUERY_CACHE_THRESHOLD', '0.95'))
+TTL = float(os.getenv('ITL_QUERY_CACHE_TTL', '3600'))
+MAX_ENTRIES = int(os.getenv('ITL_QUERY_CACHE_MAX_ENTRIES', '4096'))
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def version_path(collection):
+    return os.path.join(INDEX_DIR, f"{collection}.version")
+
+
+def index_version(collection):
+    """Returns the collection's index version, empty when the indexer has not written one."""
+    try:
+        with open(version_path(collection), "r") as file:
+            return file.read().strip()
+    except FileNotFoundError:
+        return ""
+
+
+def bump_index_version(collection):
+    """Marks the collection as changed, which invalidates its cached search results."""
+    path = version_path(collection)
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(path + ".tmp", "w") as file:
+        file.write(uuid.uuid4().hex)
+    os.replace(path + ".tmp", path)
+
+
+class _Scope:
+    """The cached entries of one (collection, index version, params) in memory."""
+
+    def __init__(self, rows):
+        import numpy as np
+        self.ids = [row[0] for row in rows]
+        self.matrix = np.array([np.frombuffer(row[1], dtype=np.float32) for row in rows], dtype=np.float32)
+        self.excluded = [set(json.loads(row[2])) for row in rows]
+        self.results = [json.loads(row[3]) for row in rows]
+        self.created = [row[4] for row in rows]
+
+    def add(self, entry_id, embedding, excluded, results, created):
+        import numpy as np
+        self.ids.append(entry_id)
+        self.matrix = np.vstack([self.matrix.reshape(-1, len(embedding)), embedding[None, :]])
+        self.excluded.append(set(excluded))
+        self.results.append(results)
+        self.created.append(created)
+
+
+class QueryCache:
+    """
+    Args:
+        directory (str, optional): Where queries.sqlite lives. Defaults to ITL_QUERY_CACHE_DIR.
+        threshold (float, optional): The cosine similarity from which a cached query matches.
+        ttl (float, optional): Seconds an entry stays valid.
+        max_entries (int, optional): Entries to keep, least recently used are dropped.
+    """
+
+    def __init__(self, directory=None, threshold=None, ttl=None, max_entries=None):
+        self.directory = directory or CACHE_DIR
+        self.threshold = THRESHOLD if threshold is None else threshold
+        self.ttl = TTL if ttl is None else ttl
+        self.max_entries = max_entries or MAX_ENTRIES
+        self._lock = threading.Lock()
+        self._scopes = {}
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        self._conn = sqlite3.connect(os.path.join(self.directory, "queries.sqlite"), check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " id INTEGER PRIMARY KEY,"
+                " collection TEXT NOT NULL,"
+                " version TEXT NOT NULL,"
+                " params TEXT NOT NULL,"
+                " embedding BLOB NOT NULL,"
+                " excluded TEXT NOT NULL,"
+                " results TEXT NOT NULL,"
+                " created REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_scope ON entries (collection, version, params)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access)")
+
+    def _scope(self, collection, params):
+        version = index_version(collection)
+        key = (collection, version, params)
+        if key not in self._scopes:
+            with self._conn:
+                # Results of an older index are never valid again
+                self._conn.execute("DELETE FROM entries WHERE collection = ? AND version != ?", (collection, version))
+            rows = self._conn.execute(
+                "SELECT id, embedding, excluded, results, created FROM entries "
+                "WHERE collection = ? AND version = ? AND params = ? AND created > ?",
+                (collection, version, params, time.time() - self.ttl)).fetchall()
+            self._scopes = {scope: value for scope, value in self._scopes.items()
+                            if scope[0] != collection or scope[1] == version}
+            self._scopes[key] = _Scope(rows)
+        return version, self._scopes[key]
+
+    def get(self, collection, embedding, params, exclude_ids=()):
+        """
+        Returns the cached results of a similar query, or None.
+
+        Args:
+            embedding (sequence of float): The query embedding.
+            params (str): Everything else the results depend on (filters, limit, ...), serialized.
+            exclude_ids (iterable): The chunks the search has to leave out.
+        """
+        import numpy as np
+        with self._lock:
+            _, scope = self._scope(collection, params)
+            if not scope.ids:
+                return None
+            similarity = scope.matrix @ normalize(np.asarray(embedding, dtype=np.float32))
+            excluded = {str(point_id) for point_id in exclude_ids}
+            expired = time.time() - self.ttl
+            for index in np.argsort(-similarity):
+                if similarity[index] < self.threshold:
+                    return None
+                results = scope.results[index]
+                if (scope.created[index] > expired and scope.excluded[index] <= excluded
+                        and not any(point_id in excluded for point_id, _ in results)):
+                    with self._conn:
+                        self._conn.execute("UPDATE entries SET last_access = ? WHERE id = ?",
+                                           (time.time(), scope.ids[index]))
+                    return [tuple(result) for result in results]
+            return None
+
+    def put(self, collection, embedding, params, exclude_ids, results):
+        """Stores the results, (point id, content) pairs, of a search."""
+        import numpy as np
+        embedding = normalize(np.asarray(embedding, dtype=np.float32))
+        excluded = sorted(str(point_id) for point_id in exclude_ids)
+        results = [[str(point_id), content] for point_id, content in results]
+        now = time.time()
+        with self._lock:
+            version, scope = self._scope(collection, params)
+            with self._conn:
+                cursor = self._conn.execute(
+                    "INSERT INTO entries (collection, version, params, embedding, excluded, results, created, "
+                    "last_access) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (collection, version, params, embedding.tobytes(), json.dumps(excluded), json.dumps(results),
+                     now, now))
+                scope.add(cursor.lastrowid, embedding, excluded, results, now)
+                count, = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+                if count > self.max_entries:
+                    self._conn.execute("DELETE FROM entries WHERE id IN (SELECT id FROM entries "
+                                       "ORDER BY last_access LIMIT ?)", (count - self.max_entries,))
+                    self._scopes = {}
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM entries")
+            self._scopes = {}
+
+
+def get_query_cache():
+    """Returns the process-wide query cache, or None when ITL_QUERY_CACHE is off."""
+    global _cache
+    if not ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = QueryCache()
+        return _cache
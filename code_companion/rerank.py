@@ -0,0 +1,172 @@
+"""
+Optional rerank stage for the companion's retrieval.
+
+When ITL_RERANKER is set, search_chunks over-fetches candidates and a scorer
+reads every candidate together with the query, a much better relevance signal
+than the vector distance, and only the best ones are kept. Scorers:
+
+    cross-encoder           a local sentence-transformers CrossEncoder, ITL_RERANK_MODEL
+                            (default cross-encoder/ms-marco-MiniLM-L-6-v2), or
+                            cross-encoder:<model> to name the model inline
+    lexical                 the share of query terms found in the chunk, no model needed
+
+Scores are cached on disk (.cache/rerank/scores.sqlite, ITL_RERANK_CACHE_DIR) by
+scorer, query and chunk content, so a repeated question is not scored again. The
+file keeps the ITL_RERANK_CACHE_MAX_ROWS (default 100000) newest scores.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+from lexical_index import tokenize
+
+RERANKER = os.getenv('ITL_RERANKER', '')
+RERANK_MODEL = os.getenv('ITL_RERANK_MODEL', 'cross-encoder/ms-marco-MiniLM-L-6-v2')
+CACHE_DIR = os.getenv('ITL_RERANK_CACHE_DIR', os.path.join(".cache", "rerank"))
+CACHE_MAX_ROWS = int(os.getenv('ITL_RERANK_CACHE_MAX_ROWS', '100000'))
+
+logger = logging.getLogger(__name__)
+
+
+class LexicalOverlapScorer:
+    """Scores a chunk by the share of the query's terms it contains."""
+
+    name = "lexical"
+
+    def load(self):
+        pass
+
+    def score(self, query, texts):
+        terms = set(tokenize(query))
+        if not terms:
+            return [0.0] * len(texts)
+        return [len(terms & set(tokenize(text))) / len(terms) for text in texts]
+
+
+class CrossEncoderScorer:
+    """
+    Args:
+        model (str): A sentence-transformers cross-encoder model.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.name = "cross-encoder:" + model
+        self._encoder = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self._encoder is None:
+                from sentence_transformers import CrossEncoder
+                self._encoder = CrossEncoder(self.model)
+        return self._encoder
+
+    def score(self, query, texts):
+        encoder = self.load()
+        with self._lock:
+            return [float(score) for score in encoder.predict([(query, text) for text in texts])]
+
+
+def create_scorer(spec):
+    """Returns the scorer for an ITL_RERANKER value."""
+    name, _, model = spec.partition(":")
+    if name == "lexical":
+        return LexicalOverlapScorer()
+    if name == "cross-encoder":
+        return CrossEncoderScorer(model or RERANK_MODEL)
+    raise ValueError(f"Unknown reranker '{spec}', expected lexical or cross-encoder[:<model>]")
+
+
+def _digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ScoreCache:
+    """
+    Args:
+        directory (str): Where scores.sqlite is kept.
+        max_rows (int): The number of scores to keep, oldest are dropped first.
+    """
+
+    def __init__(self, directory, max_rows=None):
+        self.max_rows = max_rows or CACHE_MAX_ROWS
+        self._lock = threading.Lock()
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self._conn = sqlite3.connect(os.path.join(directory, "scores.sqlite"), check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS scores ("
+                " scorer TEXT NOT NULL,"
+                " query TEXT NOT NULL,"
+                " chunk TEXT NOT NULL,"
+                " score REAL NOT NULL,"
+                " created REAL NOT NULL,"
+                " PRIMARY KEY (scorer, query, chunk)) WITHOUT ROWID"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS scores_created ON scores (created)")
+
+    def get_many(self, scorer, query, chunks):
+        """Returns {chunk digest: score} for the chunk digests that are cached."""
+        if not chunks:
+            return {}
+        with self._lock:
+            return dict(self._conn.execute(
+                "SELECT chunk, score FROM scores WHERE scorer = ? AND query = ? "
+                f"AND chunk IN ({','.join('?' * len(chunks))})", [scorer, query, *chunks]).fetchall())
+
+    def put_many(self, scorer, query, scores):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?)",
+                                   [(scorer, query, chunk, score, now) for chunk, score in scores.items()])
+            count, = self._conn.execute("SELECT COUNT(*) FROM scores").fetchone()
+            if count > self.max_rows:
+                self._conn.execute("DELETE FROM scores WHERE (scorer, query, chunk) IN (SELECT scorer, query, chunk "
+                                   "FROM scores ORDER BY created LIMIT ?)", (count - self.max_rows,))
+
+
+class Reranker:
+    """
+    Args:
+        scorer: An object with a `name` and score(query, texts) -> list of float.
+        cache (ScoreCache, optional): Where scores are looked up and stored.
+    """
+
+    def __init__(self, scorer, cache=None):
+        self.scorer = scorer
+        self.cache = cache
+
+    def scores(self, query, texts):
+        """Returns a score per text, higher is more relevant. Only uncached pairs are scored."""
+        query_key = _digest(query)
+        keys = [_digest(text) for text in texts]
+        cached = self.cache.get_many(self.scorer.name, query_key, keys) if self.cache else {}
+        missing = list(dict.fromkeys(key for key in keys if key not in cached))
+        if missing:
+            text_of = dict(zip(keys, texts))
+            computed = dict(zip(missing, self.scorer.score(query, [text_of[key] for key in missing])))
+            if self.cache:
+                self.cache.put_many(self.scorer.name, query_key, computed)
+            cached.update(computed)
+        return [cached[key] for key in keys]
+
+
+@lru_cache(maxsize=None)
+def get_reranker():
+    """Returns the Reranker configured by ITL_RERANKER, or None when reranking is off or unavailable."""
+    if not RERANKER:
+        return None
+    scorer = create_scorer(RERANKER)
+    try:
+        scorer.load()
+    except Exception as error:
+        logger.warning("Could not load the %s reranker, results are not reranked: %s", scorer.name, error)
+        return None
+    return Reranker(scorer, ScoreCache(CACHE_DIR))
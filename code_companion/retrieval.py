@@ -0,0 +1,159 @@
+"""
+Hybrid retrieval for the code companion.
+
+`search_chunks` over-fetches candidates from the vector store and, when the indexer wrote
+one, from the BM25 index, leaving out the chunks that are already in the
+context. The two rankings are fused with reciprocal rank fusion, so an exact
+identifier the embedding misses still ranks high, and the final results are
+picked by maximal marginal relevance, so every result is relevant to the query
+and different from the results picked before it. An optional reranker
+(rerank.py) rescores the fused candidates before MMR.
+"""
+import os
+
+from vector_store import matches, normalize
+
+FETCH_MULTIPLIER = int(os.getenv('ITL_RETRIEVAL_OVERFETCH', '4'))
+MMR_LAMBDA = float(os.getenv('ITL_MMR_LAMBDA', '0.5'))
+RRF_K = int(os.getenv('ITL_RRF_K', '60'))
+
+
+def reciprocal_rank_fusion(rankings, k=None):
+    """
+    Fuses ranked id lists: every id scores the sum of 1 / (k + rank) over the lists
+    it appears in.
+
+    Returns:
+        list: (id, score) pairs, best first.
+    """
+    k = k or RRF_K
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def mmr(query_vector, vectors, k, lambda_mult=None, relevance=None):
+    """
+    Returns the indexes of k vectors chosen by maximal marginal relevance: each pick
+    maximizes lambda * sim(query, v) - (1 - lambda) * max sim(v, picked).
+
+    Args:
+        query_vector (sequence of float): The query embedding.
+        vectors (sequence of sequences of float): The candidate embeddings.
+        k (int): How many to pick.
+        lambda_mult (float, optional): 1 ranks by relevance only, 0 by diversity only.
+            Defaults to ITL_MMR_LAMBDA or 0.5.
+        relevance (sequence of float, optional): Relevance scores in [0, 1] to use
+            instead of the cosine similarity to the query.
+    """
+    import numpy as np
+    if lambda_mult is None:
+        lambda_mult = MMR_LAMBDA
+    if len(vectors) == 0 or k <= 0:
+        return []
+    candidates = normalize(np.asarray(vectors, dtype=np.float32))
+    query = normalize(np.asarray(query_vector, dtype=np.float32))
+    relevance = candidates @ query if relevance is None else np.asarray(relevance, dtype=np.float32)
+    similarity = candidates @ candidates.T
+
+    picked = [int(np.argmax(relevance))]
+    # Highest similarity of every candidate to anything picked so far
+    redundancy = similarity[picked[0]].copy()
+    available = np.ones(len(candidates), dtype=bool)
+    available[picked[0]] = False
+    while len(picked) < min(k, len(candidates)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        index = int(np.argmax(scores))
+        picked.append(index)
+        available[index] = False
+        redundancy = np.maximum(redundancy, similarity[index])
+    return picked
+
+
+def _rerank(reranker, query_text, candidates):
+    """Returns the candidates sorted by the reranker's scores, with those scores scaled to [0, 1]."""
+    scores = reranker.scores(query_text, [point.payload.get("content", "") for point in candidates])
+    low, high = min(scores), max(scores)
+    scaled = [(score - low) / (high - low) if high > low else 1.0 for score in scores]
+    ranked = sorted(zip(candidates, scaled), key=lambda item: item[1], reverse=True)
+    return [point for point, _ in ranked], [score for _, score in ranked]
+
+
+def _select(store, collection, query_vector, vector_hits, limit, exclude_ids, lambda_mult, query_text,
+            lexical_index, filters, payload_fields, reranker):
+    """Fuses the vector hits of one query with its BM25 hits, reranks them and picks the results."""
+    diversify = lambda_mult < 1
+    # Without fusion or a reranker MMR compares the candidates to the query vector itself
+    candidates, relevance = vector_hits, None
+
+    if lexical_index is not None and query_text:
+        fetch = len(vector_hits) or limit
+        lexical_hits = lexical_index.search(query_text, limit=fetch, exclude_ids=exclude_ids)
+        fused = reciprocal_rank_fusion([[str(point.id) for point in vector_hits],
+                                        [doc_id for doc_id, _ in lexical_hits]])[:fetch]
+        points = {str(point.id): point for point in vector_hits}
+        missing = [doc_id for doc_id, _ in fused if doc_id not in points]
+        if missing:
+            fields = None if payload_fields is None else list(dict.fromkeys([*payload_fields, *(filters or {})]))
+            for point in store.retrieve(collection, missing, with_vectors=diversify, payload_fields=fields):
+                # The BM25 index does not know the payloads, so its hits are filtered here
+                if matches(point.payload, filters):
+                    points[str(point.id)] = point
+        fused = [(doc_id, score) for doc_id, score in fused if doc_id in points]
+        candidates = [points[doc_id] for doc_id, _ in fused]
+        relevance = [score / fused[0][1] for _, score in fused]
+
+    if reranker is not None and query_text and candidates:
+        candidates, relevance = _rerank(reranker, query_text, candidates)
+
+    if not diversify or len(candidates) <= limit:
+        return candidates[:limit]
+    picked = mmr(query_vector, [point.vector for point in candidates], limit, lambda_mult=lambda_mult,
+                 relevance=relevance)
+    return [candidates[index] for index in picked]
+
+
+def search_chunks(store, collection, query_vector, limit=5, exclude_ids=(), fetch_multiplier=None,
+                  lambda_mult=None, query_text=None, lexical_index=None, filters=None, payload_fields=None,
+                  reranker=None):
+    """
+    Returns up to `limit` points of a VectorStore for the query, none of them in exclude_ids.
+    The candidates are the `limit * fetch_multiplier` nearest points, fused with as
+    many BM25 hits for query_text when a lexical index is given and ordered by the
+    reranker when one is given, and MMR picks among them.
+    Vectors are only fetched when MMR needs them (lambda_mult < 1).
+
+    Args:
+        filters (dict, optional): Payload field -> allowed value(s), see vector_store.py.
+        payload_fields (list of str, optional): The payload fields to fetch, all when None.
+            The reranker reads `content`.
+        reranker (Reranker, optional): Scores the candidates against query_text, see rerank.py.
+    """
+    return search_chunks_batch(store, collection, [query_vector], limit=limit, exclude_ids=exclude_ids,
+                               fetch_multiplier=fetch_multiplier, lambda_mult=lambda_mult,
+                               query_texts=[query_text], lexical_index=lexical_index, filters=filters,
+                               payload_fields=payload_fields, reranker=reranker)[0]
+
+
+def search_chunks_batch(store, collection, query_vectors, limit=5, exclude_ids=(), fetch_multiplier=None,
+                        lambda_mult=None, query_texts=None, lexical_index=None, filters=None, payload_fields=None,
+                        reranker=None):
+    """
+    Same as search_chunks for several queries, with the vector searches sent as one batch request.
+
+    Returns:
+        list: The points for each query.
+    """
+    if lambda_mult is None:
+        lambda_mult = MMR_LAMBDA
+    query_texts = query_texts or [None] * len(query_vectors)
+    over_fetch = lambda_mult < 1 or lexical_index is not None or reranker is not None
+    fetch = limit * (fetch_multiplier or FETCH_MULTIPLIER) if over_fetch else limit
+    all_hits = store.query_batch(collection, query_vectors, fetch, exclude_ids=exclude_ids, filters=filters,
+                                 with_vectors=lambda_mult < 1, payload_fields=payload_fields)
+    return [_select(store, collection, query_vector, vector_hits, limit, exclude_ids, lambda_mult, query_text,
+                    lexical_index, filters, payload_fields, reranker)
+            for query_vector, vector_hits, query_text in zip(query_vectors, all_hits, query_texts)]
@@ -0,0 +1,233 @@
+"""
+Long-running code companion.
+
+`itl serve` imports cc.py once, opens the vector store and the BM25 index (and
+loads the reranker and the tokenizer when they are configured), then answers companion
+questions over HTTP on a TCP port or a Unix socket. Every request runs on its
+own thread and the gateway keeps its connections to the model server open, so a
+question costs the retrieval and the LLM calls only. `itl ask` (client.py) is the
+matching command line client.
+
+API:
+    GET /health
+        {"status": "ok", "sessions": 1}
+    POST /ask {"instruction": "...", "session": "auth", "stream": false,
+               "language": ["py"], "path": ["src/app.py"], "prefetch": true}
+        {"response": "...", "output": "...", "session": "auth"}
+        With "stream": true the body is one JSON object per line, {"text": "..."}
+        while the answer is generated and {"response": "..."} at the end.
+    DELETE /sessions/<name>
+        Drops the context of a session.
+
+A request with a session name continues from that session's context; the
+ITL_COMPANION_MAX_SESSIONS (default 32) most recently used sessions are kept.
+
+Usage:
+    itl serve
+    itl serve --url unix:/tmp/itl-companion.sock
+"""
+import argparse
+import json
+import os
+import socketserver
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+from cc import (EXACT_TOKEN_COUNTS, LLM_MODEL, PREFETCH, QDRANT_COLLECTION, RETRIEVAL_WORKERS, answer,
+                get_compressor, get_lexical_index, get_vector_store, new_context)
+from client import DEFAULT_URL, parse_address
+from query_cache import get_query_cache
+from rerank import get_reranker
+from utils.token_counter import get_tokenizer
+
+MAX_SESSIONS = int(os.getenv('ITL_COMPANION_MAX_SESSIONS', '32'))
+
+
+class Session:
+    def __init__(self):
+        self.context = new_context()
+        # One question at a time per session, the context is not shared between threads
+        self.lock = threading.Lock()
+
+
+class CompanionServer:
+    """
+    Args:
+        url (str, optional): http://host:port or unix:/path. Defaults to ITL_COMPANION_URL.
+        workers (int, optional): Threads shared by the retrievals of all requests.
+        max_sessions (int, optional): Named sessions to keep, least recently used are dropped.
+    """
+
+    def __init__(self, url=None, workers=None, max_sessions=None):
+        self.url = url or DEFAULT_URL
+        self.executor = ThreadPoolExecutor(max_workers=workers or RETRIEVAL_WORKERS * 4)
+        self.max_sessions = max_sessions or MAX_SESSIONS
+        self.sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._server = None
+
+    def warm_up(self):
+        """Opens everything a first question would otherwise wait for."""
+        store = get_vector_store()
+        if store.exists(QDRANT_COLLECTION):
+            store.retrieve(QDRANT_COLLECTION, [])
+        get_lexical_index(QDRANT_COLLECTION)
+        get_reranker()
+        get_query_cache()
+        get_compressor()
+        if EXACT_TOKEN_COUNTS:
+            get_tokenizer(LLM_MODEL)
+        import numpy  # noqa: F401 used by every retrieval
+
+    def session(self, name):
+        if name is None:
+            return Session()
+        with self._lock:
+            if name not in self.sessions:
+                self.sessions[name] = Session()
+                while len(self.sessions) > self.max_sessions:
+                    self.sessions.popitem(last=False)
+            self.sessions.move_to_end(name)
+            return self.sessions[name]
+
+    def drop_session(self, name):
+        with self._lock:
+            return self.sessions.pop(name, None) is not None
+
+    def ask(self, body, emit):
+        """Answers a /ask request body, passing the output to emit. Returns the final response."""
+        filters = {field: body[field] for field in ("language", "path") if body.get(field)}
+        session = self.session(body.get("session"))
+        with session.lock:
+            return answer(body["instruction"], session.context, self.executor, stream=bool(body.get("stream")),
+                          filters=filters, prefetch_context=body.get("prefetch", PREFETCH), emit=emit)
+
+    def start(self):
+        address = parse_address(self.url)
+        if address[0] == "unix":
+            self._server = _UnixHTTPServer(address[1], _Handler)
+        else:
+            self._server = ThreadingHTTPServer(address[1:], _Handler)
+        self._server.daemon_threads = True
+        self._server.companion = self
+        return self
+
+    def serve_forever(self):
+        try:
+            self._server.serve_forever()
+        finally:
+            self.stop()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.server_close()
+            address = parse_address(self.url)
+            if address[0] == "unix" and os.path.exists(address[1]):
+                os.remove(address[1])
+            self._server = None
+        self.executor.shutdown(wait=False)
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    def server_bind(self):
+        # A socket left behind by a server that did not shut down cleanly
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        super().server_bind()
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def companion(self):
+        return self.server.companion
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/health":
+            return self._json({"status": "ok", "sessions": len(self.companion.sessions)})
+        self._json({"error": "not found"}, status=404)
+
+    def do_DELETE(self):
+        if self.path.startswith("/sessions/"):
+            name = unquote(self.path[len("/sessions/"):])
+            if self.companion.drop_session(name):
+                return self._json({"session": name})
+        self._json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/ask":
+            return self._json({"error": "not found"}, status=404)
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        except ValueError:
+            return self._json({"error": "the body is not JSON"}, status=400)
+        if not isinstance(body, dict):
+            return self._json({"error": "the body must be a JSON object"}, status=400)
+        if not body.get("instruction"):
+            return self._json({"error": "instruction is required"}, status=400)
+        if body.get("stream"):
+            return self._stream(body)
+
+        output = []
+        try:
+            response = self.companion.ask(body, output.append)
+        except Exception as error:
+            return self._json({"error": str(error)}, status=500)
+        self._json({"response": response, "output": "".join(output), "session": body.get("session")})
+
+    def _stream(self, body):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+
+        def write(message):
+            self.wfile.write(json.dumps(message).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+        try:
+            response = self.companion.ask(body, lambda text: write({"text": text}))
+        except (BrokenPipeError, ConnectionResetError):
+            return
+        except Exception as error:
+            return write({"error": str(error)})
+        write({"response": response, "session": body.get("session")})
+
+    def _json(self, data, status=200):
+        raw = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Serve code companion questions over a local HTTP API.")
+    parser.add_argument("--url", default=DEFAULT_URL,
+                        help="Where to listen, http://host:port or unix:/path. Defaults to ITL_COMPANION_URL.")
+    parser.add_argument("--workers", type=int, default=None, help="Threads for the retrievals of all requests.")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    server = CompanionServer(args.url, workers=args.workers)
+    server.warm_up()
+    server.start()
+    print(f"Code companion listening on {args.url} (collection '{QDRANT_COLLECTION}').", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,472 @@
+"""
+Vector stores behind the companion's retrieval and the indexer.
+
+`QdrantVectorStore` wraps a Qdrant client. `LocalVectorStore` needs no server:
+every collection is a directory with the vectors in a memory-mapped float32
+matrix and the point ids and payloads in SQLite, so opening one reads the id
+list and maps the matrix without loading it. Queries are an exact NumPy scan
+over the normalized vectors; from ITL_HNSW_THRESHOLD points on, an HNSW graph
+is used instead when hnswlib is installed. The graph is rebuilt on the first
+query after a write and saved next to the vectors. A store that is open in a
+long-running process picks up the writes of other processes (the indexer) on
+its next query.
+
+Both stores use cosine similarity and return points with `id`, `score`,
+`payload` and `vector` attributes. Requests ask only for what the caller uses:
+`payload_fields` projects the payload, vectors are returned only when asked for,
+and `filters` ({"language": ["py", "md"], "path": "cc.py"}) restrict the search
+to points whose payload field has one of the given values. `query_batch` sends
+several queries in one request.
+
+Qdrant's search can be tuned with ITL_HNSW_EF (also used by the local graph),
+ITL_QDRANT_EXACT, and for quantized collections ITL_QDRANT_RESCORE and
+ITL_QDRANT_OVERSAMPLING.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from collections import namedtuple
+
+HNSW_THRESHOLD = int(os.getenv('ITL_HNSW_THRESHOLD', '20000'))
+# Unset leaves Qdrant's own default; the local graph then uses 64
+HNSW_EF = int(os.getenv('ITL_HNSW_EF', '0')) or None
+QDRANT_EXACT = os.getenv('ITL_QDRANT_EXACT', 'false').lower() in ('1', 'true', 'yes')
+QDRANT_RESCORE = os.getenv('ITL_QDRANT_RESCORE')
+QDRANT_OVERSAMPLING = float(os.getenv('ITL_QDRANT_OVERSAMPLING', '0')) or None
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+INITIAL_CAPACITY = 1024
+
+Point = namedtuple("Point", ["id", "score", "payload", "vector"])
+
+logger = logging.getLogger(__name__)
+
+
+def _values(value):
+    return list(value) if isinstance(value, (list, tuple, set)) else [value]
+
+
+def normalize(vectors):
+    """Scales vectors (the last axis) to unit length, so a dot product is their cosine similarity."""
+    import numpy as np
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def matches(payload, filters):
+    """Returns whether a payload passes the filters."""
+    return all(payload.get(field) in _values(value) for field, value in (filters or {}).items())
+
+
+def _project(payload, payload_fields):
+    if payload_fields is None:
+        return payload
+    return {field: payload[field] for field in payload_fields if field in payload}
+
+
+class VectorStore:
+    """The operations the indexer and the companion need from a vector database."""
+
+    def exists(self, collection):
+        raise NotImplementedError
+
+    def create(self, collection, dim, recreate=False):
+        """Creates the collection for `dim` dimensional vectors unless it exists (or recreate is set)."""
+        raise NotImplementedError
+
+    def drop(self, collection):
+        raise NotImplementedError
+
+    def upsert(self, collection, ids, vectors, payloads):
+        raise NotImplementedError
+
+    def set_payload(self, collection, point_id, payload):
+        """Updates some payload fields of a point."""
+        raise NotImplementedError
+
+    def delete(self, collection, ids):
+        raise NotImplementedError
+
+    def query(self, collection, vector, limit, exclude_ids=(), filters=None, with_vectors=False,
+              payload_fields=None):
+        """
+        Returns the `limit` nearest points that pass the filters, leaving out exclude_ids.
+
+        Args:
+            with_vectors (bool, optional): Return the vectors of the points too.
+            payload_fields (list of str, optional): The payload fields to return, all when None.
+        """
+        raise NotImplementedError
+
+    def query_batch(self, collection, vectors, limit, exclude_ids=(), filters=None, with_vectors=False,
+                    payload_fields=None):
+        """Runs `query` for several vectors and returns a list of results per vector."""
+        return [self.query(collection, vector, limit, exclude_ids=exclude_ids, filters=filters,
+                           with_vectors=with_vectors, payload_fields=payload_fields) for vector in vectors]
+
+    def retrieve(self, collection, ids, with_vectors=False, payload_fields=None):
+        """Returns the points with the given ids."""
+        raise NotImplementedError
+
+
+class QdrantVectorStore(VectorStore):
+    """
+    Args:
+        client (QdrantClient): The client to send requests with.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def exists(self, collection):
+        return self.client.collection_exists(collection)
+
+    def create(self, collection, dim, recreate=False):
+        from qdrant_client import models
+        if recreate and self.client.collection_exists(collection):
+            self.client.delete_collection(collection)
+        if not self.client.collection_exists(collection):
+            self.client.create_collection(collection, vectors_config=models.VectorParams(
+                size=dim, distance=models.Distance.COSINE))
+
+    def drop(self, collection):
+        if self.client.collection_exists(collection):
+            self.client.delete_collection(collection)
+
+    def upsert(self, collection, ids, vectors, payloads):
+        from qdrant_client import models
+        points = [models.PointStruct(id=point_id, vector=list(map(float, vector)), payload=payload)
+                  for point_id, vector, payload in zip(ids, vectors, payloads)]
+        self.client.upsert(collection_name=collection, points=points, wait=True)
+
+    def set_payload(self, collection, point_id, payload):
+        self.client.set_payload(collection_name=collection, payload=payload, points=[point_id])
+
+    def delete(self, collection, ids):
+        from qdrant_client import models
+        self.client.delete(collection_name=collection, wait=True,
+                           points_selector=models.PointIdsList(points=list(ids)))
+
+    @staticmethod
+    def _filter(exclude_ids, filters):
+        from qdrant_client import models
+        must = [models.FieldCondition(key=field, match=models.MatchAny(any=_values(value)))
+                for field, value in (filters or {}).items()]
+        must_not = [models.HasIdCondition(has_id=list(exclude_ids))] if exclude_ids else []
+        if not must and not must_not:
+            return None
+        return models.Filter(must=must or None, must_not=must_not or None)
+
+    @staticmethod
+    def _search_params():
+        from qdrant_client import models
+        quantization = None
+        if QDRANT_RESCORE is not None or QDRANT_OVERSAMPLING:
+            quantization = models.QuantizationSearchParams(
+                rescore=None if QDRANT_RESCORE is None else QDRANT_RESCORE.lower() in ('1', 'true', 'yes'),
+                oversampling=QDRANT_OVERSAMPLING)
+        if not (HNSW_EF or QDRANT_EXACT or quantization):
+            return None
+        return models.SearchParams(hnsw_ef=HNSW_EF, exact=QDRANT_EXACT, quantization=quantization)
+
+    def query(self, collection, vector, limit, exclude_ids=(), filters=None, with_vectors=False,
+              payload_fields=None):
+        return self.client.query_points(
+            collection_name=collection,
+            query=list(vector),
+            query_filter=self._filter(exclude_ids, filters),
+            search_params=self._search_params(),
+            limit=limit,
+            with_payload=True if payload_fields is None else list(payload_fields),
+            with_vectors=with_vectors,
+        ).points
+
+    def query_batch(self, collection, vectors, limit, exclude_ids=(), filters=None, with_vectors=False,
+                    payload_fields=None):
+        from qdrant_client import models
+        query_filter = self._filter(exclude_ids, filters)
+        params = self._search_params()
+        requests = [models.QueryRequest(query=list(vector), filter=query_filter, params=params, limit=limit,
+                                        with_payload=True if payload_fields is None else list(payload_fields),
+                                        with_vector=with_vectors)
+                    for vector in vectors]
+        if not requests:
+            return []
+        return [response.points for response in self.client.query_batch_points(collection, requests=requests)]
+
+    def retrieve(self, collection, ids, with_vectors=False, payload_fields=None):
+        return self.client.retrieve(collection_name=collection, ids=list(ids), with_vectors=with_vectors,
+                                    with_payload=True if payload_fields is None else list(payload_fields))
+
+
+class _LocalCollection:
+    """One collection of a LocalVectorStore: vectors.f32, points.sqlite and, once built, hnsw.bin."""
+
+    def __init__(self, directory):
+        import numpy as np
+        self.directory = directory
+        self._conn = sqlite3.connect(os.path.join(directory, "points.sqlite"), check_same_thread=False)
+        # A dropped and recreated collection is a new file, the open connection keeps reading the old one
+        self._inode = os.stat(os.path.join(directory, "points.sqlite")).st_ino
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS points (row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, payload TEXT)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        meta = dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+        self.dim = int(meta["dim"])
+        self.version = int(meta.get("version", 0))
+        self.generation = meta.get("generation")
+        self._rows = dict(self._conn.execute("SELECT id, row FROM points").fetchall())
+        path = os.path.join(directory, "vectors.f32")
+        mapped = os.path.getsize(path) // (self.dim * 4) if os.path.exists(path) else 0
+        capacity = max(INITIAL_CAPACITY, mapped, max(self._rows.values(), default=-1) + 1)
+        self._map(capacity)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._alive[list(self._rows.values())] = True
+        self._ids = {row: point_id for point_id, row in self._rows.items()}
+        self._hnsw = None
+        self._hnsw_version = None
+
+    @staticmethod
+    def initialize(directory, dim):
+        os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(os.path.join(directory, "points.sqlite"))
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dim', ?)", (str(dim),))
+            # Tells a recreated collection from the one a process has open
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('generation', ?)", (uuid.uuid4().hex,))
+        conn.close()
+
+    def _map(self, capacity):
+        import numpy as np
+        path = os.path.join(self.directory, "vectors.f32")
+        size = capacity * self.dim * 4
+        with open(path, "ab") as file:
+            if file.tell() < size:
+                file.truncate(size)
+        self.vectors = np.memmap(path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    def _grow(self, needed):
+        import numpy as np
+        capacity = len(self._alive)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        self.vectors.flush()
+        self._map(capacity)
+        self._alive = np.concatenate([self._alive, np.zeros(capacity - len(self._alive), dtype=bool)])
+
+    def stale(self):
+        """Returns whether another process changed or recreated the collection since it was opened."""
+        try:
+            if os.stat(os.path.join(self.directory, "points.sqlite")).st_ino != self._inode:
+                return True
+            meta = dict(self._conn.execute(
+                "SELECT key, value FROM meta WHERE key IN ('version', 'generation')").fetchall())
+        except (OSError, sqlite3.Error):
+            return True
+        return int(meta.get("version", 0)) != self.version or meta.get("generation") != self.generation
+
+    def _bump_version(self):
+        self.version += 1
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (str(self.version),))
+
+    def upsert(self, ids, vectors, payloads):
+        import numpy as np
+        vectors = normalize(np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim))
+        ids = [str(point_id) for point_id in ids]
+        new_ids = [point_id for point_id in dict.fromkeys(ids) if point_id not in self._rows]
+        free = np.flatnonzero(~self._alive)
+        if len(free) < len(new_ids):
+            self._grow(len(self._rows) + len(new_ids))
+            free = np.flatnonzero(~self._alive)
+        for point_id, row in zip(new_ids, free.tolist()):
+            self._rows[point_id] = row
+            self._ids[row] = point_id
+        self._alive[free[:len(new_ids)]] = True
+        rows = [self._rows[point_id] for point_id in ids]
+        self.vectors[rows] = vectors
+        self.vectors.flush()
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO points (row, id, payload) VALUES (?, ?, ?)",
+                                   [(row, self._ids[row], json.dumps(payload)) for row, payload in zip(rows, payloads)])
+            self._bump_version()
+
+    def set_payload(self, point_id, payload):
+        row = self._rows.get(str(point_id))
+        if row is None:
+            return
+        current, = self._conn.execute("SELECT payload FROM points WHERE row = ?", (row,)).fetchone()
+        with self._conn:
+            self._conn.execute("UPDATE points SET payload = ? WHERE row = ?",
+                               (json.dumps({**json.loads(current), **payload}), row))
+
+    def delete(self, ids):
+        rows = [self._rows.pop(point_id) for point_id in map(str, ids) if point_id in self._rows]
+        for row in rows:
+            del self._ids[row]
+        self._alive[rows] = False
+        with self._conn:
+            self._conn.executemany("DELETE FROM points WHERE row = ?", [(row,) for row in rows])
+            self._bump_version()
+
+    def points(self, rows, scores=None, with_vectors=False, payload_fields=None):
+        if not rows:
+            return []
+        payloads = dict(self._conn.execute(
+            f"SELECT row, payload FROM points WHERE row IN ({','.join('?' * len(rows))})", rows).fetchall())
+        return [Point(self._ids[row], None if scores is None else scores[index],
+                      _project(json.loads(payloads[row]), payload_fields),
+                      self.vectors[row].tolist() if with_vectors else None)
+                for index, row in enumerate(rows)]
+
+    def retrieve(self, ids, with_vectors=False, payload_fields=None):
+        return self.points([self._rows[point_id] for point_id in map(str, ids) if point_id in self._rows],
+                           with_vectors=with_vectors, payload_fields=payload_fields)
+
+    def _filtered_out(self, filters):
+        """Returns a mask of the rows whose payload does not pass the filters."""
+        import numpy as np
+        mask = np.zeros(len(self._alive), dtype=bool)
+        for field, value in filters.items():
+            values = _values(value)
+            allowed = [row for row, in self._conn.execute(
+                f"SELECT row FROM points WHERE json_extract(payload, ?) IN ({','.join('?' * len(values))})",
+                [f"$.{field}", *values])]
+            field_mask = np.ones(len(self._alive), dtype=bool)
+            field_mask[allowed] = False
+            mask |= field_mask
+        return mask
+
+    def query(self, vector, limit, exclude_ids=(), filters=None, with_vectors=False, payload_fields=None):
+        import numpy as np
+        query = normalize(np.asarray(vector, dtype=np.float32))
+        excluded = [self._rows[point_id] for point_id in map(str, exclude_ids) if point_id in self._rows]
+        # Filtered queries scan, the graph would need an unknown number of extra candidates
+        if len(self._rows) >= HNSW_THRESHOLD and not filters:
+            index = self._load_hnsw()
+            if index is not None:
+                k = min(len(self._rows), limit + len(excluded))
+                index.set_ef(max(HNSW_EF or 64, k))
+                labels, distances = index.knn_query(query, k=k)
+                excluded = set(excluded)
+                hits = [(int(row), 1.0 - float(distance)) for row, distance in zip(labels[0], distances[0])
+                        if int(row) not in excluded][:limit]
+                return self.points([row for row, _ in hits], [score for _, score in hits], with_vectors=with_vectors,
+                                   payload_fields=payload_fields)
+
+        high = int(np.flatnonzero(self._alive).max()) + 1 if self._rows else 0
+        scores = np.asarray(self.vectors[:high] @ query)
+        dropped = ~self._alive[:high]
+        if filters:
+            dropped |= self._filtered_out(filters)[:high]
+        dropped[excluded] = True
+        scores[dropped] = -np.inf
+        k = min(limit, high - int(dropped.sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return self.points(top.tolist(), scores[top].tolist(), with_vectors=with_vectors,
+                           payload_fields=payload_fields)
+
+    def _load_hnsw(self):
+        if self._hnsw is not None and self._hnsw_version == self.version:
+            return self._hnsw
+        try:
+            import hnswlib
+        except ImportError:
+            logger.warning("hnswlib is not installed, searching %d vectors exhaustively", len(self._rows))
+            return None
+        import numpy as np
+        path = os.path.join(self.directory, "hnsw.bin")
+        saved = self._conn.execute("SELECT value FROM meta WHERE key = 'hnsw_version'").fetchone()
+        index = hnswlib.Index(space="cosine", dim=self.dim)
+        if saved is not None and int(saved[0]) == self.version and os.path.exists(path):
+            index.load_index(path, max_elements=len(self._rows))
+        else:
+            rows = np.flatnonzero(self._alive)
+            index.init_index(max_elements=len(rows), ef_construction=HNSW_EF_CONSTRUCTION, M=HNSW_M)
+            index.add_items(np.asarray(self.vectors[rows]), rows)
+            index.save_index(path)
+            with self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('hnsw_version', ?)",
+                                   (str(self.version),))
+        self._hnsw, self._hnsw_version = index, self.version
+        return index
+
+    def close(self):
+        self.vectors.flush()
+        self._conn.close()
+
+
+class LocalVectorStore(VectorStore):
+    """
+    Args:
+        directory (str): Holds one subdirectory per collection.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._collections = {}
+        self._lock = threading.RLock()
+
+    def _path(self, collection):
+        return os.path.join(self.directory, collection)
+
+    def _collection(self, collection):
+        with self._lock:
+            if collection in self._collections and self._collections[collection].stale():
+                self._collections.pop(collection).close()
+            if collection not in self._collections:
+                self._collections[collection] = _LocalCollection(self._path(collection))
+            return self._collections[collection]
+
+    def exists(self, collection):
+        return os.path.exists(os.path.join(self._path(collection), "points.sqlite"))
+
+    def create(self, collection, dim, recreate=False):
+        with self._lock:
+            if recreate:
+                self.drop(collection)
+            if not self.exists(collection):
+                _LocalCollection.initialize(self._path(collection), dim)
+
+    def drop(self, collection):
+        import shutil
+        with self._lock:
+            if collection in self._collections:
+                self._collections.pop(collection).close()
+            shutil.rmtree(self._path(collection), ignore_errors=True)
+
+    def upsert(self, collection, ids, vectors, payloads):
+        with self._lock:
+            self._collection(collection).upsert(ids, vectors, payloads)
+
+    def set_payload(self, collection, point_id, payload):
+        with self._lock:
+            self._collection(collection).set_payload(point_id, payload)
+
+    def delete(self, collection, ids):
+        with self._lock:
+            self._collection(collection).delete(ids)
+
+    def query(self, collection, vector, limit, exclude_ids=(), filters=None, with_vectors=False,
+              payload_fields=None):
+        if not self.exists(collection):
+            return []
+        with self._lock:
+            return self._collection(collection).query(vector, limit, exclude_ids=exclude_ids, filters=filters,
+                                                      with_vectors=with_vectors, payload_fields=payload_fields)
+
+    def retrieve(self, collection, ids, with_vectors=False, payload_fields=None):
+        if not self.exists(collection):
+            return []
+        with self._lock:
+            return self._collection(collection).retrieve(ids, with_vectors=with_vectors,
+                                                         payload_fields=payload_fields)
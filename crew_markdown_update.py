@@ -1,19 +1,10 @@
-import sys
-from crewai import Agent, Task, Crew, Process
+import argparse
 import os
 from dotenv import load_dotenv
 
-from langchain.llms import Ollama
-from tools.AiderCoderTools import file_editor_tool
-from tools.MarkdownTools import markdown_validation_tool
-
 load_dotenv()
 
 
-hermes_llm = Ollama(model="openhermes")
-coder_llm = Ollama(model="deepseek-coder")
-phi_llm = Ollama(model="phi")
-
 def process_markdown_document(filename):
     """
     Processes a markdown document by reviewing its syntax validation 
@@ -26,6 +17,14 @@ def process_markdown_document(filename):
         str: The list of recommended changes to make to the document.
 
     """
+    from crewai import Agent, Task, Crew, Process
+    from utils import metrics
+    from utils.llm_cache import cache_seed_from_env
+    from utils.llm_factory import create_llm
+    from tools.AiderCoderTools import file_editor_tool
+    from tools.MarkdownTools import markdown_validation_tool
+
+    cache_seed = cache_seed_from_env()
 
     # Define general agent
     general_agent  = Agent(role='Requirements Manager',
@@ -42,7 +41,7 @@ def process_markdown_document(filename):
                     allow_delegation=False, 
                     verbose=True,
                     tools=[markdown_validation_tool],
-                    llm=hermes_llm)
+                    llm=create_llm("openhermes", "ollama", cache_seed=cache_seed))
     
     file_editor_agent = Agent(role='File Editor',
                     goal="""To take a list of changes and apply them to a file.
@@ -53,7 +52,7 @@ def process_markdown_document(filename):
                     allow_delegation=False, 
                     verbose=True,
                     tools=[file_editor_tool, markdown_validation_tool],
-                    llm=coder_llm)
+                    llm=create_llm("deepseek-coder", "ollama", cache_seed=cache_seed))
 
 
     # Define Tasks Using Crew Tools
@@ -104,17 +103,23 @@ def process_markdown_document(filename):
                           agents=[general_agent,file_editor_agent], 
                           process=Process.sequential)
     
-    result = file_edit_crew.kickoff()
+    result = metrics.instrumented_kickoff(file_edit_crew)
 
     return result
 
 
+def build_parser():
+    parser = argparse.ArgumentParser(description="Validate a markdown file and apply the suggested fixes.")
+    parser.add_argument("filename", type=str, help="The path to the markdown file to be processed.")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    processed_document = process_markdown_document(args.filename)
+    print(processed_document)
+
 # If called directly from the command line take the first argument as the filename
 if __name__ == "__main__":
-
-    if len(sys.argv) > 1:
-        filename = sys.argv[1]
-        processed_document = process_markdown_document(filename)
-        print(processed_document)
+    main()
 
 
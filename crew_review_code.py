@@ -2,18 +2,9 @@ import glob
 import os
 import argparse
 from typing import Annotated
-import openai
-from aider.coders import Coder
-from aider import  models
 from dotenv import load_dotenv
-from langchain.tools import DuckDuckGoSearchRun
-from crewai import Agent, Task, Crew, Process
-from langchain.chat_models.openai import ChatOpenAI
 
-def main():
-    os.environ.clear()
-    load_dotenv()
-    print(os.environ.items())
+def build_parser():
     parser = argparse.ArgumentParser(description="Script to perform an action on files.")
     parser.add_argument("files", nargs='*', help="The glob pattern for file matching or list of files.")
     parser.add_argument("action", type=str, help="The action to be performed on the files.")
@@ -22,15 +13,20 @@ def main():
         action="store_true",
         help="Whether to update the files after running the action.",
     )
-    #parser.add_argument("--oai", type=str, default="local.json", help="The environment variable or JSON file to load configurations from.")
+    parser.add_argument("--oai", type=str, default="local.json", help="The environment variable or JSON file to load configurations from.")
     
     parser.add_argument(
         "--cache-seed",
         default=os.environ.get("ITL_CACHE_SEED", "42"),
         help="Cache seed for the action, or False to disable caching.",
     )
+    return parser
 
-    args = parser.parse_args()
+def main(argv=None):
+    os.environ.clear()
+    load_dotenv()
+    print(os.environ.items())
+    args = build_parser().parse_args(argv)
 
     if os.path.isfile(args.action):
         action = read_action_from_file(args.action)
@@ -51,7 +47,7 @@ def main():
         print(f'Files: {files}')
         for file in files:
             print(f'Reviewing File: {file}')
-            plan = review_file(file, action, cache_seed=args.cache_seed)
+            plan = review_file(file, action, cache_seed=args.cache_seed, env_or_file=args.oai)
             if args.update_files and plan is not None:
                 print(f'Updating file: {file}')
                 response = perform_action(file, action, plan)
@@ -88,6 +84,9 @@ def perform_action(file, action, plan):
     Returns:
         str: The response from the coder after running the action.
     """
+    import openai
+    from aider.coders import Coder
+    from aider import  models
       
     client = openai.OpenAI(api_key=os.environ.get("AIDER_OPENAI_API_KEY", os.environ["OPENAI_API_KEY"]), 
                             base_url=
@@ -104,14 +103,21 @@ def perform_action(file, action, plan):
 
     return response
 
-def review_file(file, action, cache_seed):
+def review_file(file, action, cache_seed, env_or_file="local.json"):
+    from crewai import Agent, Task, Crew, Process
+    from utils import metrics
+    from utils.llm_factory import create_llm
+    from utils.search_tools import create_search_tool
+    from utils.token_counter import fit_to_budget
 
-    search_tool = DuckDuckGoSearchRun()
+    search_tool = create_search_tool()
 
-    defalut_llm = ChatOpenAI(openai_api_base=os.environ.get("OPENAI_API_BASE_URL", "https://api.openai.com/v1"),
+    # Calls go through the gateway so they share the per-endpoint limits of env_or_file
+    defalut_llm = create_llm("Magicoder-DS-6.7B", "gateway", #"gpt-3.5-turbo"
+                        base_url=env_or_file,
+                        cache_seed=cache_seed,
                         temperature=0,
-                        top_p=0.3,
-                        model_name="Magicoder-DS-6.7B") #"gpt-3.5-turbo")
+                        top_p=0.3)
     # Define your agents with roles and goals
     researcher = Agent(
         role='Researcher',
@@ -150,8 +156,9 @@ def review_file(file, action, cache_seed):
 
     code = open(file, 'r').read()
 
-    # take just the first 1000 characters
-    code = code[:1000]
+    # take just the first ITL_MAX_FILE_TOKENS tokens (about the first 1000 characters by default)
+    code = fit_to_budget(code, max_tokens=int(os.environ.get("ITL_MAX_FILE_TOKENS") or 300),
+                         model="Magicoder-DS-6.7B", label=file)
 
     # Create tasks for your agents
     overview = Task(
@@ -250,7 +257,7 @@ def review_file(file, action, cache_seed):
     )
 
     # Get your crew to work!
-    result = crew.kickoff()
+    result = metrics.instrumented_kickoff(crew)
 
     file_name = os.path.join(".cache", cache_seed, "reviews/", file + ".md")
     
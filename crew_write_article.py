@@ -2,23 +2,13 @@ import glob
 import os
 import argparse
 from dotenv import load_dotenv
-from langchain.tools import DuckDuckGoSearchRun
-from crewai import Agent, Task, Crew, Process
-from langchain.chat_models.openai import ChatOpenAI
-from langchain.llms import Ollama
-from langchain_community.agent_toolkits import FileManagementToolkit
-
-hermes_llm = Ollama(model="openhermes")
-mixtral_llm = Ollama(model="dolphin-mixtral")
-mistral_llm = Ollama(model="mistral")
-coder_llm = Ollama(model="magicoder:7b-s-cl-q5_K_M")
-phi_llm = Ollama(model="phi")
-gpt3_llm = ChatOpenAI(temperature=0.7, model_name="gpt-3.5-turbo") # It uses langchain.chat_models, default is GPT4
-
-tools = FileManagementToolkit(
-    root_dir=str(".cache/temp"),
-    selected_tools=["read_file", "write_file", "list_directory"],
-).get_tools()
+
+def get_file_tools():
+    from langchain_community.agent_toolkits import FileManagementToolkit
+    return FileManagementToolkit(
+        root_dir=str(".cache/temp"),
+        selected_tools=["read_file", "write_file", "list_directory"],
+    ).get_tools()
 
 def clean_filename(filename):
     import re
@@ -26,9 +16,21 @@ def clean_filename(filename):
     cleaned_name = re.sub('[^\w\s-]', '', filename).replace(' ', '_').lower()
     return os.path.basename(cleaned_name)
 
-def write_article(topic):
+def write_article(topic, cache_seed=None):
+    from crewai import Agent, Task
+    from utils.llm_cache import cache_seed_from_env
+    from utils.llm_factory import create_llm
+    from utils.model_scheduler import ModelScheduler
+    from utils.search_tools import create_search_tool
+
+    search_tool = create_search_tool()
 
-    search_tool = DuckDuckGoSearchRun()
+    if cache_seed is None:
+        cache_seed = cache_seed_from_env()
+    hermes_llm = create_llm("openhermes", "ollama", cache_seed=cache_seed)
+    mixtral_llm = create_llm("dolphin-mixtral", "ollama", cache_seed=cache_seed)
+    mistral_llm = create_llm("mistral", "ollama", cache_seed=cache_seed)
+    coder_llm = create_llm("magicoder:7b-s-cl-q5_K_M", "ollama", cache_seed=cache_seed)
 
     # Define your agents with roles and goals
     researcher = Agent(
@@ -93,25 +95,27 @@ def write_article(topic):
         agent=writer
     )
 
-    # Instantiate your crew with a sequential process
-    crew = Crew(
-        agents=[researcher, writer, editor, coder],
-        tasks=[research_task, outline_task],
-        verbose=2, # Crew verbose more will let you know what tasks are being worked on, you can set it to 1 or 2 to different logging levels
-        process=Process.sequential # Sequential process will have tasks executed one after the other and the outcome of the previous one is passed as extra content into this next.
-    )
-
-    # Get your crew to work!
-    result = crew.kickoff()
-
-
-    filename = Task(description=f"""Create a valid file name based this topic: {topic}. 
+    filename_task = Task(description=f"""Create a valid file name based this topic: {topic}. 
                     It should be less than 50 characters and have no special characters.
                     IT IS VERY IMPORTANT THAT YOU ONLY RETURN A VALID FILE NAME.
                     DO NOT RETURN ANYTHING ELSE OR THE JOB WILL FAIL!
-                    """, agent=researcher).execute()
+                    """, agent=researcher)
+
+    # Every agent runs on its own model. The scheduler runs the file name task while
+    # the researcher's model is still loaded and keeps a model loaded after its task when
+    # a later task uses it again, instead of swapping models in and out of Ollama after
+    # every task. The next task's model is only warmed during the current task when the
+    # host fits two models (ITL_OLLAMA_MAX_LOADED_MODELS of 2 or more).
+    scheduler = ModelScheduler(agents=[researcher, writer, editor, coder])
+    research = scheduler.add(research_task)
+    outline = scheduler.add(outline_task, depends_on=[research])
+    file_name = scheduler.add(filename_task)
 
-    filename = clean_filename(filename)
+    # Get your crew to work!
+    outputs = scheduler.run()
+    result = outputs[outline]
+
+    filename = clean_filename(outputs[file_name])
 
     print(f"Outline complete! Writing to {filename}...")
 
@@ -158,16 +162,13 @@ def write_article(topic):
         agent=editor
     )
 
-    article_crew = Crew(
-        agents=[researcher, writer, editor, coder],
-        tasks=[write_article_task, review_task],
-        verbose=2, # Crew verbose more will let you know what tasks are being worked on, you can set it to 1 or 2 to different logging levels
-        process=Process.sequential # Sequential process will have tasks executed one after the other and the outcome of the previous one is passed as extra content into this next.
-    )
+    draft = scheduler.add(write_article_task)
+    review = scheduler.add(review_task, depends_on=[draft])
 
     print("Outline saved, writing article...")
 
-    result = article_crew.kickoff()
+    result = scheduler.run()[review]
+    scheduler.close()
 
     print("Article complete! Writing to file...")
 
@@ -180,13 +181,20 @@ def write_article(topic):
     return result
 
 
-def main():
-    load_dotenv()
+def build_parser():
     parser = argparse.ArgumentParser(description="Script to perform an action on files.")
     parser.add_argument("topic", type=str, help="The action to be performed on the files.")
+    parser.add_argument(
+        "--cache-seed",
+        default=os.environ.get("ITL_CACHE_SEED", "42"),
+        help="Cache seed for the LLM responses, or False to disable caching.",
+    )
+    return parser
 
-    args = parser.parse_args()
-    write_article(args.topic)
+def main(argv=None):
+    load_dotenv()
+    args = build_parser().parse_args(argv)
+    write_article(args.topic, cache_seed=args.cache_seed)
 
      
 if __name__ == "__main__":
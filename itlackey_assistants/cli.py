@@ -0,0 +1,145 @@
+"""
+The `itl` command line entry point.
+
+Each subcommand maps to one of the scripts in this repository. A script is only
+loaded once its subcommand is chosen, and the scripts themselves import crewAI,
+langchain, aider, autogen or transformers inside the functions that need them, so
+`itl --help` and `itl <command> --help` return without loading any framework.
+
+Usage:
+    itl review "src/*.py" "Add type hints" --update-files
+    itl index ~/src/my-repo --collection my-repo
+    itl companion "Where is the auth flow implemented?" --stream
+    itl serve & itl ask "Where is the auth flow implemented?"
+    itl check-imports
+    itl stats
+"""
+import argparse
+import importlib.util
+import os
+import sys
+from collections import namedtuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+Command = namedtuple("Command", ["script", "help", "search_paths"])
+
+COMMANDS = {
+    "review": Command("crew_review_code.py",
+                      "Review files with a crewAI crew and optionally apply the action items.", []),
+    "review-autogen": Command("autogen/autogen_review_code.py",
+                              "Review files with autogen agents and optionally apply the plan.", []),
+    "review-group": Command("autogen/autogen_group_review_files.py",
+                            "Review files with an autogen group chat.", []),
+    "md-review": Command("itlackey_assistants/crew_markdown_review.py",
+                         "List the changes a markdown file needs to pass validation.", []),
+    "md-update": Command("crew_markdown_update.py",
+                         "Validate a markdown file and apply the fixes with aider.", ["itlackey_assistants"]),
+    "article": Command("crew_write_article.py",
+                       "Research and write a blog article with an Ollama crew.", []),
+    "tutorial": Command("write_tutorial/write_tutorial.py",
+                        "Outline, write and publish a technical tutorial.", []),
+    "companion": Command("code_companion/cc.py",
+                         "Answer questions about a code base from its Qdrant index.", []),
+    "index": Command("code_companion/indexer.py",
+                     "Chunk, embed and upload a repository to the companion's vector collection.", []),
+    "serve": Command("code_companion/server.py",
+                     "Keep the companion loaded and answer questions over a local HTTP API.", []),
+    "ask": Command("code_companion/client.py",
+                   "Ask a running companion server (itl serve).", []),
+}
+
+
+def load_script(name):
+    """
+    Imports the script behind a subcommand with the same import paths it sees when
+    run as `python <script>`, and returns the module.
+    """
+    command = COMMANDS[name]
+    path = os.path.join(REPO_ROOT, command.script)
+    if os.path.dirname(path) not in sys.path:
+        sys.path.insert(0, os.path.dirname(path))
+    # Appended like the scripts do it, so that the repository's autogen/ folder
+    # does not shadow the autogen package.
+    for search_path in [REPO_ROOT] + [os.path.join(REPO_ROOT, p) for p in command.search_paths]:
+        if search_path not in sys.path:
+            sys.path.append(search_path)
+
+    module_name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_command(name, argv):
+    module = load_script(name)
+    sys.argv = [COMMANDS[name].script] + list(argv)
+    result = module.main(argv)
+    return result if isinstance(result, int) else 0
+
+
+def check_imports(args):
+    from itlackey_assistants.importtime import check_import_time
+    unknown = [name for name in args.commands if name not in COMMANDS]
+    if unknown:
+        print(f"Unknown command(s): {', '.join(unknown)}", file=sys.stderr)
+        return 2
+    failures = check_import_time(args.commands or list(COMMANDS), budget_ms=args.budget_ms)
+    return 1 if failures else 0
+
+
+def stats(args):
+    from utils import metrics
+    records = metrics.load_records(args.file)
+    if not records:
+        print(f"No metrics recorded in {args.file or metrics.jsonl_path()}.")
+        return 1
+    print(metrics.format_summary(metrics.summarize(records)))
+    if args.prometheus:
+        metrics.write_prometheus(args.prometheus, records)
+        print(f"Prometheus metrics written to {args.prometheus}")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="itl", description="ITLackey's assistants.")
+    subparsers = parser.add_subparsers(dest="command", metavar="command")
+
+    for name, command in COMMANDS.items():
+        # Arguments are parsed by the script itself, see run_command.
+        subparsers.add_parser(name, help=command.help, add_help=False)
+
+    check = subparsers.add_parser("check-imports",
+                                  help="Fail when a command imports too slowly or loads a framework eagerly.")
+    check.add_argument("commands", nargs="*", metavar="command",
+                       help="The commands to check. Defaults to all of them.")
+    check.add_argument("--budget-ms", type=float, default=None,
+                       help="Import time budget per command. Defaults to ITL_IMPORT_BUDGET_MS or 300.")
+    check.set_defaults(handler=check_imports)
+
+    stats_parser = subparsers.add_parser("stats", help="Summarize recorded latency and token metrics per agent role.")
+    stats_parser.add_argument("--file", default=None,
+                              help="The metrics JSONL file. Defaults to $ITL_METRICS_DIR/metrics.jsonl.")
+    stats_parser.add_argument("--prometheus", default=None, metavar="PATH",
+                              help="Also write the metrics in Prometheus text format to PATH.")
+    stats_parser.set_defaults(handler=stats)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0] in COMMANDS:
+        return run_command(argv[0], argv[1:])
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 1
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
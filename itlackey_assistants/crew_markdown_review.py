@@ -1,28 +1,18 @@
+import argparse
 import sys
-from crewai import Agent, Task
 import os
 from dotenv import load_dotenv
-from langchain.chat_models.openai import ChatOpenAI
-from langchain.llms import Ollama
-from tools.MarkdownTools import markdown_validation_tool
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 os.environ.clear()
 load_dotenv()
 
 default_model_name = os.environ.get("ITL_MAIN_MODEL_NAME", "gpt-3.5-turbo")
 
-hermes_llm = Ollama(model="openhermes")
-mixtral_llm = Ollama(model="dolphin-mixtral")
-mistral_llm = Ollama(model="mistral")
-phi_llm = Ollama(model="phi")
-coder_llm = Ollama(model="magicoder:7b-s-cl-q5_K_M")
-starling_llm = Ollama(model="starling-lm:7b-alpha-q8_0")
-api_llm = ChatOpenAI(openai_api_base=os.environ.get("OPENAI_API_BASE_URL", "https://api.openai.com/v1"),
-                        openai_api_key=os.environ.get("OPENAI_API_KEY"),
-                        temperature=0.1,                        
-                        model_name="vicuna-7b-v1.5")
-                        #,top_p=0.3)
-
-default_llm = starling_llm
+# Other models that have been tried with this crew, created on demand via create_llm:
+# ollama: openhermes, dolphin-mixtral, mistral, phi, magicoder:7b-s-cl-q5_K_M
+# chat_openai: vicuna-7b-v1.5 (temperature=0.1) against OPENAI_API_BASE_URL
+default_llm_model = "starling-lm:7b-alpha-q8_0"
 
 
 def process_markdown_document(filename):
@@ -36,6 +26,10 @@ def process_markdown_document(filename):
         str: The list of recommended changes to make to the document.
 
     """
+    from crewai import Agent, Task
+    from utils import metrics
+    from utils.llm_factory import create_llm
+    from tools.MarkdownTools import markdown_validation_tool
 
     # Define general agent
     general_agent  = Agent(role='Requirements Manager',
@@ -46,7 +40,7 @@ def process_markdown_document(filename):
                     allow_delegation=False, 
                     verbose=True,
                     tools=[markdown_validation_tool],
-                    llm=default_llm)
+                    llm=create_llm(default_llm_model, "ollama"))
 
 
     # Define Tasks Using Crew Tools
@@ -65,17 +59,23 @@ def process_markdown_document(filename):
              agent=general_agent)
     
     print("Starting syntax review...")
-    updated_markdown = syntax_review_task.execute()
+    updated_markdown = metrics.instrumented_execute(syntax_review_task)
 
     return updated_markdown
 
+def build_parser():
+    parser = argparse.ArgumentParser(description="Review a markdown file and list the changes it needs.")
+    parser.add_argument("filename", type=str, help="The path to the markdown file to be processed.")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    processed_document = process_markdown_document(args.filename)
+    print(processed_document)
+
 # If called directly from the command line take the first argument as the filename
 if __name__ == "__main__":
-
-    if len(sys.argv) > 1:
-        filename = sys.argv[1]
-        processed_document = process_markdown_document(filename)
-        print(processed_document)
+    main()
 
 
 
@@ -0,0 +1,97 @@
+"""
+Import-time budget check for the `itl` commands.
+
+For every command this runs `python -X importtime` on what the command imports
+before doing any work (the CLI and the script module) and reports a failure when
+the cumulative import time exceeds the budget or when one of the heavy frameworks
+is imported eagerly. Run it with `itl check-imports`.
+"""
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_BUDGET_MS = 300
+
+# Top level packages that must only be imported once a command actually needs them.
+HEAVY_MODULES = (
+    "aider", "autogen", "crewai", "crewai_tools", "interpreter", "langchain", "langchain_community",
+    "langchain_core", "langchain_openai", "numpy", "openai", "pymarkdown", "qdrant_client",
+    "tiktoken", "tokenizers", "torch", "transformers",
+)
+
+
+def parse_importtime(output):
+    """
+    Parses `-X importtime` output.
+
+    Returns:
+        list: (module, self_us, cumulative_us, depth) tuples in the order they were printed.
+    """
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # the header line
+        name = fields[2].rstrip()
+        stripped = name.lstrip()
+        depth = (len(name) - len(stripped) - 1) // 2
+        entries.append((stripped, int(fields[0]), int(fields[1]), depth))
+    return entries
+
+
+def measure_command(name):
+    """
+    Imports the command's script in a fresh interpreter.
+
+    Returns:
+        tuple: The cumulative import time in milliseconds and the heavy modules it loaded.
+    """
+    code = f"from itlackey_assistants.cli import load_script; load_script({name!r})"
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [REPO_ROOT, env.get("PYTHONPATH")]))
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                             capture_output=True, text=True, cwd=REPO_ROOT, env=env)
+    if process.returncode != 0:
+        raise RuntimeError(f"Importing '{name}' failed:\n{process.stderr[-2000:]}")
+
+    entries = parse_importtime(process.stderr)
+    total_us = sum(cumulative for _, _, cumulative, depth in entries if depth == 0)
+    heavy = sorted({module.split(".")[0] for module, _, _, _ in entries
+                    if module.split(".")[0] in HEAVY_MODULES})
+    return total_us / 1000.0, heavy
+
+
+def check_import_time(commands, budget_ms=None):
+    """
+    Measures each command and prints a report.
+
+    Returns:
+        list: The names of the commands that are over budget or import a heavy module.
+    """
+    if budget_ms is None:
+        budget_ms = float(os.environ.get("ITL_IMPORT_BUDGET_MS", DEFAULT_BUDGET_MS))
+
+    failures = []
+    for name in commands:
+        try:
+            total_ms, heavy = measure_command(name)
+        except RuntimeError as error:
+            print(f"FAIL  {name:<16} {error}")
+            failures.append(name)
+            continue
+
+        problems = []
+        if total_ms > budget_ms:
+            problems.append(f"over the {budget_ms:.0f} ms budget")
+        if heavy:
+            problems.append("eagerly imports " + ", ".join(heavy))
+
+        status = "FAIL" if problems else "ok"
+        print(f"{status:<5} {name:<16} {total_ms:8.1f} ms  {'; '.join(problems)}".rstrip())
+        if problems:
+            failures.append(name)
+    return failures
@@ -1,8 +1,10 @@
 import os
 from langchain.tools import tool
 import sys
+from utils import metrics
 
 @tool("file_editor_tool")
+@metrics.timed("tool", "file_editor_tool")
 def file_editor_tool(file_path_and_instructions: str) -> str:
     """
     A tool to edit files based on the provided instructions.
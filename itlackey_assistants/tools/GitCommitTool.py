@@ -1,6 +1,7 @@
 from langchain.tools import BaseTool
 from pydantic import BaseModel, Field
 from git import Repo
+from utils import metrics
 
 # Define a Pydantic model for the input arguments
 class GitCommitInput(BaseModel):
@@ -16,6 +17,7 @@ class GitCommitterTool(BaseTool):
        super().__init__(*args, **kwargs)
        self.repo_dir = repo_dir
 
+   @metrics.timed("tool", "git_committer")
    def _run(self, commit_message: str) -> str:
        # Initialize the repository object using GitPython
        repo = Repo(self.repo_dir)
@@ -2,8 +2,10 @@ import os
 import sys
 from langchain.tools import tool
 from pymarkdown.api import PyMarkdownApi, PyMarkdownApiException
+from utils import metrics
 
 @tool("markdown_validation_tool")
+@metrics.timed("tool", "markdown_validation_tool")
 def markdown_validation_tool(file_path: str) -> str:
     """
     A tool to review files for markdown syntax errors.
@@ -0,0 +1,9 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# code_companion's modules import each other by their bare names, as when cc.py runs as a script
+for path in (ROOT, os.path.join(ROOT, "code_companion")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
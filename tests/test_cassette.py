@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from utils import cassette as cassette_module
+from utils.cassette import Cassette, CassetteMiss, get_cassette
+
+
+def test_record_and_replay_round_trip(tmp_path):
+    path = str(tmp_path / "cassette.jsonl")
+    recorder = Cassette(path, "record")
+    answers = iter(["first", "second"])
+    request = {"messages": [{"role": "user", "content": "hi"}], "model": "llama3.2"}
+    assert recorder.call("chat", request, lambda: next(answers)) == "first"
+    assert recorder.call("chat", request, lambda: next(answers)) == "second"
+    assert recorder.call("search", {"query": "hi"}, lambda: {"results": [1, 2]}) == {"results": [1, 2]}
+
+    player = Cassette(path, "replay")
+
+    def unreachable():
+        raise AssertionError("replay must not call the model")
+
+    # Identical requests replay in recorded order, then the last response repeats
+    assert [player.call("chat", request, unreachable) for _ in range(3)] == ["first", "second", "second"]
+    assert player.call("search", {"query": "hi"}, unreachable) == {"results": [1, 2]}
+
+
+def test_encode_and_decode(tmp_path):
+    path = str(tmp_path / "cassette.jsonl")
+    Cassette(path, "record").call("embedding", {"input": "hi"}, lambda: (1.0, 2.0), encode=list)
+    assert Cassette(path, "replay").call("embedding", {"input": "hi"}, None, decode=tuple) == (1.0, 2.0)
+
+
+def test_async_round_trip(tmp_path):
+    path = str(tmp_path / "cassette.jsonl")
+
+    async def answer():
+        return "async answer"
+
+    assert asyncio.run(Cassette(path, "record").acall("chat", {"n": 1}, answer)) == "async answer"
+    assert asyncio.run(Cassette(path, "replay").acall("chat", {"n": 1}, None)) == "async answer"
+
+
+def test_unrecorded_request_raises_cassette_miss(tmp_path):
+    path = str(tmp_path / "cassette.jsonl")
+    Cassette(path, "record").call("chat", {"content": "recorded"}, lambda: "answer")
+    player = Cassette(path, "replay")
+    with pytest.raises(CassetteMiss, match="not recorded"):
+        player.call("chat", {"content": "not recorded"}, lambda: "answer")
+    # The kind is part of the key as well
+    with pytest.raises(CassetteMiss):
+        player.call("search", {"content": "recorded"}, lambda: "answer")
+
+
+def test_replay_needs_a_recorded_file(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        Cassette(str(tmp_path / "missing.jsonl"), "replay")
+
+
+def test_object_addresses_do_not_change_the_key():
+    assert (cassette_module.request_key("llm", {"client": "<httpx.Client object at 0x7f00aa>"})
+            == cassette_module.request_key("llm", {"client": "<httpx.Client object at 0x7f11bb>"}))
+
+
+def test_replay_latency(tmp_path):
+    path = str(tmp_path / "cassette.jsonl")
+    Cassette(path, "record").record("chat", {"n": 1}, "answer", 2.5)
+    assert Cassette(path, "replay", latency="recorded").replay_delay(2.5) == 2.5
+    assert Cassette(path, "replay", latency="0.1").replay_delay(2.5) == 0.1
+    assert Cassette(path, "replay").replay_delay(2.5) == 0.0
+
+
+def test_get_cassette_from_environment(tmp_path, monkeypatch):
+    monkeypatch.setattr(cassette_module, "_cassettes", {})
+    monkeypatch.setenv("ITL_CASSETTE", str(tmp_path / "env.jsonl"))
+    monkeypatch.delenv("ITL_CASSETTE_MODE", raising=False)
+    assert get_cassette() is None
+    monkeypatch.setenv("ITL_CASSETTE_MODE", "Record")
+    cassette = get_cassette()
+    assert cassette.mode == "record" and cassette.path == str(tmp_path / "env.jsonl")
+    assert get_cassette() is cassette
+
+
+def test_langchain_cache_round_trip(tmp_path):
+    pytest.importorskip("langchain_core")
+    from langchain_core.outputs import Generation
+
+    path = str(tmp_path / "cassette.jsonl")
+    recording = cassette_module.cassette_llm_cache(Cassette(path, "record"))
+    assert recording.lookup("prompt", "llama3.2") is None
+    recording.update("prompt", "llama3.2", [Generation(text="answer")])
+
+    replaying = cassette_module.cassette_llm_cache(Cassette(path, "replay"))
+    generation, = replaying.lookup("prompt", "llama3.2")
+    assert generation.text == "answer"
+    with pytest.raises(CassetteMiss):
+        replaying.lookup("prompt", "qwen2.5")
@@ -0,0 +1,85 @@
+from context_buffer import PRIORITY_FILE, PRIORITY_QUERY, ContextBuffer
+
+
+def words(count, word="w"):
+    return " ".join([word] * count)
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def test_render_and_duplicate_keys():
+    context = ContextBuffer(100, count_words)
+    assert context.add("first chunk", key="a")
+    assert not context.add("first chunk again", key="a")
+    assert not context.add("   ")
+    assert context.add("second chunk")
+    assert context.render() == "\nfirst chunk\nsecond chunk"
+    assert context.keys() == {"a"}
+    assert context.tokens == 4
+
+
+def test_evicts_lowest_priority_then_oldest():
+    context = ContextBuffer(30, count_words)
+    context.add(words(10, "q1"), PRIORITY_QUERY, key="q1")
+    context.add(words(10, "f1"), PRIORITY_FILE, key="f1")
+    context.add(words(10, "q2"), PRIORITY_QUERY, key="q2")
+    context.add(words(10, "f2"), PRIORITY_FILE, key="f2")
+    assert context.keys() == {"f1", "q2", "f2"}
+    context.add(words(10, "f3"), PRIORITY_FILE, key="f3")
+    assert context.keys() == {"f1", "f2", "f3"}
+    assert context.tokens == 30
+
+
+def test_newest_segment_is_kept_and_truncated_to_budget():
+    context = ContextBuffer(10, count_words)
+    context.add(words(5, "old"), key="old")
+    context.add(words(40, "new"), key="new")
+    assert context.keys() == {"new"}
+    assert context.tokens <= 10
+
+    cut = ContextBuffer(10, count_words, truncate=lambda text, max_tokens: " ".join(text.split()[:max_tokens]))
+    cut.add(words(40))
+    assert cut.tokens == 10
+
+
+def summarize(texts):
+    return [f"digest of {text.split()[0]}" for text in texts]
+
+
+def test_compresses_older_segments_before_evicting():
+    context = ContextBuffer(50, count_words, compress=summarize)
+    context.add(words(30, "a"), key="a")
+    context.add(words(30, "b"), key="b")
+    assert [(segment.level, segment.tokens) for segment in context.segments] == [(1, 3), (0, 30)]
+    assert context.render() == "\ndigest of a\n" + words(30, "b")
+    assert context.keys() == {"a", "b"}
+    assert context.tokens == 33
+
+
+def test_folds_digests_into_a_rolling_summary():
+    calls = []
+
+    def compress(texts):
+        calls.append(len(texts))
+        return [words(12, "s") if count_words(text) > 20 else None for text in texts]
+
+    context = ContextBuffer(60, count_words, compress=compress)
+    for key in "abcd":
+        context.add(words(40, key), key=key)
+    summary, newest = context.segments
+    assert (summary.level, summary.key, summary.merged_keys) == (2, None, ("a", "b", "c"))
+    assert newest.key == "d"
+    assert context.keys() == {"a", "b", "c", "d"}
+    assert context.tokens == 52
+    # Chunks folded into the summary are still in the context
+    assert not context.add(words(5, "x"), key="a")
+
+
+def test_falls_back_to_eviction_without_digests():
+    context = ContextBuffer(50, count_words, compress=lambda texts: [None] * len(texts))
+    context.add(words(30, "a"), key="a")
+    context.add(words(30, "b"), key="b")
+    assert context.keys() == {"b"}
+    assert context.tokens == 30
@@ -0,0 +1,91 @@
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from utils.embedding_cache import EmbeddingCache
+
+
+class CountingEmbedder:
+    """Embeds a text as [len, count of "a", 1, 0] and remembers which texts it was asked for."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return [[len(text), text.count("a"), 1.0, 0.0] for text in texts]
+
+
+def test_embeds_only_uncached_texts(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    embed = CountingEmbedder()
+    first = cache.embed("nomic", ["alpha", "beta"], embed)
+    second = cache.embed("nomic", ["beta", "gamma", "alpha"], embed)
+
+    assert embed.calls == [["alpha", "beta"], ["gamma"]]
+    assert all(vector.dtype == np.float32 for vector in first + second)
+    np.testing.assert_array_equal(second[0], first[1])
+    np.testing.assert_array_equal(second[2], first[0])
+    np.testing.assert_array_equal(second[1], [5, 2, 1, 0])
+
+
+def test_whitespace_does_not_change_the_key(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    embed = CountingEmbedder()
+    cache.embed("nomic", ["def  main():\n    pass"], embed)
+    cache.embed("nomic", ["def main(): pass"], embed)
+    assert len(embed.calls) == 1
+
+
+def test_models_are_cached_separately(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    cache.put_many("nomic", ["alpha"], [[1, 2, 3, 4]])
+    assert cache.get_many("mxbai/large:v1", ["alpha"]) == [None]
+    cache.put_many("mxbai/large:v1", ["alpha"], [[1, 2]])
+    np.testing.assert_array_equal(cache.get_many("mxbai/large:v1", ["alpha"])[0], [1, 2])
+    np.testing.assert_array_equal(cache.get_many("nomic", ["alpha"])[0], [1, 2, 3, 4])
+
+
+def test_persists_across_instances(tmp_path):
+    EmbeddingCache(str(tmp_path)).put_many("nomic", ["alpha"], [[1, 2, 3, 4]])
+    vector, missing = EmbeddingCache(str(tmp_path)).get_many("nomic", ["alpha", "beta"])
+    np.testing.assert_array_equal(vector, [1, 2, 3, 4])
+    assert missing is None
+
+
+def test_rejects_other_dimensions(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    cache.put_many("nomic", ["alpha"], [[1, 2, 3, 4]])
+    with pytest.raises(ValueError, match="dimensions"):
+        cache.put_many("nomic", ["beta"], [[1, 2]])
+
+
+def test_overwrites_least_recently_used_row_when_full(tmp_path):
+    # Room for 3 rows of 4 float32s
+    cache = EmbeddingCache(str(tmp_path), max_bytes=3 * 4 * 4)
+    for index, text in enumerate(["a", "b", "c"]):
+        cache.put_many("nomic", [text], [[index] * 4])
+        time.sleep(0.01)
+    cache.get_many("nomic", ["a"])
+    time.sleep(0.01)
+    cache.put_many("nomic", ["d"], [[9] * 4])
+
+    a, b, c, d = cache.get_many("nomic", ["a", "b", "c", "d"])
+    assert b is None
+    np.testing.assert_array_equal(a, [0] * 4)
+    np.testing.assert_array_equal(c, [2] * 4)
+    np.testing.assert_array_equal(d, [9] * 4)
+    assert cache.max_rows(4) == 3
+
+
+def test_clear(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    cache.put_many("nomic", ["alpha"], [[1, 2, 3, 4]])
+    cache.put_many("other", ["alpha"], [[1, 2, 3, 4]])
+    cache.clear("nomic")
+    assert cache.get_many("nomic", ["alpha"]) == [None]
+    assert cache.get_many("other", ["alpha"])[0] is not None
+    cache.clear()
+    assert cache.get_many("other", ["alpha"]) == [None]
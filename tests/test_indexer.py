@@ -0,0 +1,104 @@
+import hashlib
+
+import pytest
+
+pytest.importorskip("qdrant_client")
+
+import indexer
+import lexical_index
+import query_cache
+from vector_store import QdrantVectorStore
+
+COLLECTION = "test-repo"
+
+
+def fake_embed(texts):
+    vectors = []
+    for text in texts:
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        vectors.append([byte / 255.0 + 0.01 for byte in digest[:16]])
+    return vectors
+
+
+class SpyStore(QdrantVectorStore):
+    def __init__(self, client):
+        super().__init__(client)
+        self.upserted = []
+        self.deleted = []
+
+    def upsert(self, collection, ids, vectors, payloads):
+        self.upserted.extend(zip(ids, payloads))
+        super().upsert(collection, ids, vectors, payloads)
+
+    def delete(self, collection, ids):
+        self.deleted.extend(ids)
+        super().delete(collection, ids)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    from qdrant_client import QdrantClient
+    cache = tmp_path / "cache"
+    monkeypatch.setattr(indexer, "MANIFEST_DIR", str(cache))
+    monkeypatch.setattr(lexical_index, "INDEX_DIR", str(cache))
+    monkeypatch.setattr(query_cache, "INDEX_DIR", str(cache))
+    return SpyStore(QdrantClient(location=":memory:"))
+
+
+@pytest.fixture
+def repo(tmp_path):
+    root = tmp_path / "repo"
+    root.mkdir()
+    (root / "app.py").write_text("def login(user):\n    return user\n\n\ndef logout(user):\n    return None\n")
+    (root / "README.md").write_text("# App\n\nSign in and out.\n\n## Usage\n\nRun it.\n")
+    (root / "node_modules").mkdir()
+    (root / "node_modules" / "skip.js").write_text("ignored()\n")
+    return root
+
+
+def index(store, repo):
+    # Small chunks, so that every function is a chunk of its own
+    return indexer.index_repository(str(repo), store=store, collection=COLLECTION, embed_fn=fake_embed, max_lines=4)
+
+
+def all_points(store):
+    points, _ = store.client.scroll(COLLECTION, limit=100, with_payload=True)
+    return {str(point.id): point.payload for point in points}
+
+
+def test_indexes_chunks_with_payloads(store, repo):
+    stats = index(store, repo)
+
+    points = all_points(store)
+    assert stats["files"] == 2
+    assert stats["embedded"] == len(points) > 2
+    assert {payload["path"] for payload in points.values()} == {"app.py", "README.md"}
+    login, = [payload for payload in points.values() if "def login" in payload["content"]]
+    assert login["language"] == "py"
+    assert (login["start_line"], login["end_line"]) == (1, 4)
+    assert lexical_index.LexicalIndex.open(COLLECTION).search("logout", 1)
+
+
+def test_second_run_only_touches_the_changed_file(store, repo):
+    index(store, repo)
+    before = all_points(store)
+    readme_ids = {point_id for point_id, payload in before.items() if payload["path"] == "README.md"}
+    logout_id, = [point_id for point_id, payload in before.items() if "def logout" in payload["content"]]
+    store.upserted.clear()
+
+    assert index(store, repo)["changed_files"] == 0
+    assert store.upserted == []
+
+    (repo / "app.py").write_text("def login(user):\n    return user\n\n\ndef logout(user, reason):\n"
+                                 "    return reason\n")
+    stats = index(store, repo)
+
+    assert stats["changed_files"] == 1
+    assert stats["embedded"] == 1
+    upserted_id, payload = store.upserted[0]
+    assert len(store.upserted) == 1 and "reason" in payload["content"] and payload["path"] == "app.py"
+    assert store.deleted == [logout_id]
+    after = all_points(store)
+    assert logout_id not in after
+    assert readme_ids <= set(after)
+    assert len(after) == len(before)
@@ -0,0 +1,60 @@
+import time
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.outputs import Generation
+
+from utils.llm_cache import SQLiteLLMCache, get_llm_cache, normalize_cache_seed
+
+
+def test_hit_and_miss(tmp_path):
+    cache = SQLiteLLMCache("42", path=str(tmp_path / "cache.sqlite"))
+    assert cache.lookup("prompt", "model-a") is None
+
+    cache.update("prompt", "model-a", [Generation(text="answer")])
+    hit, = cache.lookup("prompt", "model-a")
+    assert hit.text == "answer"
+    # Another model, another prompt or another seed is a miss
+    assert cache.lookup("prompt", "model-b") is None
+    assert cache.lookup("other prompt", "model-a") is None
+    assert SQLiteLLMCache("43", path=cache.path).lookup("prompt", "model-a") is None
+
+
+def test_persists_across_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    SQLiteLLMCache("42", path=path).update("prompt", "model", [Generation(text="answer")])
+    assert SQLiteLLMCache("42", path=path).lookup("prompt", "model")[0].text == "answer"
+
+
+def test_evicts_least_recently_used_over_the_size_bound(tmp_path):
+    cache = SQLiteLLMCache("42", path=str(tmp_path / "cache.sqlite"), max_bytes=10 ** 9)
+    for prompt in ("a", "b", "c"):
+        cache.update(prompt, "model", [Generation(text=prompt * 100)])
+        time.sleep(0.01)
+    entry_size, = cache._conn.execute("SELECT MAX(size) FROM responses").fetchone()
+    cache.lookup("a", "model")
+
+    cache.max_bytes = entry_size * 3
+    cache.update("d", "model", [Generation(text="d" * 100)])
+    assert cache.lookup("b", "model") is None
+    assert [cache.lookup(prompt, "model") is not None for prompt in "acd"] == [True, True, True]
+
+
+def test_clear_only_drops_its_seed(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    first, second = SQLiteLLMCache("1", path=path), SQLiteLLMCache("2", path=path)
+    first.update("prompt", "model", [Generation(text="one")])
+    second.update("prompt", "model", [Generation(text="two")])
+    first.clear()
+    assert first.lookup("prompt", "model") is None
+    assert second.lookup("prompt", "model")[0].text == "two"
+
+
+def test_cache_seed_off_values():
+    assert normalize_cache_seed(None) is None
+    assert normalize_cache_seed("False") is None
+    assert normalize_cache_seed(" ") is None
+    assert normalize_cache_seed(42) == "42"
+    assert get_llm_cache("false") is None
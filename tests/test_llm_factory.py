@@ -0,0 +1,57 @@
+import json
+import types
+
+import pytest
+
+from utils import llm_factory
+from utils.llm_factory import clear_registry, create_llm
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    monkeypatch.setenv("ITL_METRICS", "false")
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.delenv("ITL_CASSETTE_MODE", raising=False)
+    clear_registry()
+    yield
+    clear_registry()
+
+
+def test_same_settings_share_one_client(monkeypatch):
+    built = []
+
+    def build(model, model_type, base_url, params):
+        built.append((model, model_type, base_url, params))
+        return types.SimpleNamespace(cache=None)
+
+    monkeypatch.setattr(llm_factory, "_build_llm", build)
+    first = create_llm("m", "ollama", temperature=0.1)
+    assert create_llm("m", "ollama", temperature=0.1) is first
+    assert create_llm("m", "ollama", temperature=0.2) is not first
+    assert create_llm("m", "ollama", base_url="http://other:11434", temperature=0.1) is not first
+    assert len(built) == 3
+    assert built[0][2] == llm_factory.DEFAULT_OLLAMA_BASE_URL
+
+
+@pytest.mark.parametrize("model_type, class_name", [
+    ("openai", "OpenAI"),
+    ("chat_openai", "ChatOpenAI"),
+    ("ollama", "Ollama"),
+])
+def test_builds_every_langchain_backend(model_type, class_name):
+    pytest.importorskip("langchain")
+    llm = create_llm("some-model", model_type, base_url="http://127.0.0.1:9/v1")
+    assert type(llm).__name__ == class_name
+    assert create_llm("some-model", model_type, base_url="http://127.0.0.1:9/v1") is llm
+
+
+def test_builds_the_gateway_backend(tmp_path):
+    pytest.importorskip("langchain")
+    config = tmp_path / "local.json"
+    config.write_text(json.dumps([{"base_url": "http://127.0.0.1:9/v1", "api_key": "x", "model": "local"}]))
+    llm = create_llm("local", "gateway", base_url=str(config))
+    assert type(llm).__name__ == "GatewayLLM"
+
+
+def test_unknown_backend():
+    assert create_llm("m", "nope") is None
@@ -0,0 +1,142 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+openai = pytest.importorskip("openai")
+httpx = pytest.importorskip("httpx")
+
+from utils.llm_gateway import LLMGateway, NoEndpointForModel
+
+
+class FakeClient:
+    """Stands in for one endpoint's AsyncOpenAI client and records its concurrency."""
+
+    def __init__(self, name, load, delay=0.05, error=None):
+        self.name = name
+        self.load = load
+        self.delay = delay
+        self.error = error
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, model, messages, **params):
+        self.calls.append(model)
+        if self.error is not None:
+            raise self.error
+        self.in_flight += 1
+        self.load["now"] += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        self.load["max"] = max(self.load["max"], self.load["now"])
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+            self.load["now"] -= 1
+        return SimpleNamespace(endpoint=self.name, model=model)
+
+
+def connection_error(url):
+    return openai.APIConnectionError(request=httpx.Request("POST", url))
+
+
+@pytest.fixture(autouse=True)
+def no_side_effects(monkeypatch):
+    monkeypatch.setenv("ITL_METRICS", "false")
+    monkeypatch.delenv("ITL_CASSETTE_MODE", raising=False)
+
+
+def make_gateway(configs, errors=None, **kwargs):
+    gateway = LLMGateway(configs, **kwargs)
+    load = {"now": 0, "max": 0}
+    clients = []
+    for endpoint in gateway.endpoints:
+        client = FakeClient(endpoint.base_url, load, error=(errors or {}).get(endpoint.base_url))
+        endpoint.client = client
+        endpoint.semaphore = asyncio.Semaphore(endpoint.max_in_flight)
+        clients.append(client)
+    return gateway, clients, load
+
+
+def chat_concurrently(gateway, count, model=None):
+    async def run():
+        return await asyncio.gather(*(gateway.achat([{"role": "user", "content": str(i)}], model=model)
+                                      for i in range(count)))
+    return asyncio.run(run())
+
+
+def test_caps_in_flight_requests_per_endpoint():
+    gateway, (client,), _ = make_gateway([{"base_url": "http://a"}], max_in_flight=2)
+    responses = chat_concurrently(gateway, 6)
+    assert len(responses) == 6
+    assert client.max_in_flight == 2
+
+
+def test_endpoint_cap_from_config_list():
+    gateway, (client,), _ = make_gateway([{"base_url": "http://a", "max_in_flight": 3}], max_in_flight=1)
+    chat_concurrently(gateway, 6)
+    assert client.max_in_flight == 3
+
+
+def test_admits_at_most_max_queue_requests():
+    gateway, clients, load = make_gateway([{"base_url": "http://a"}, {"base_url": "http://b"}],
+                                          max_in_flight=4, max_queue=3)
+    chat_concurrently(gateway, 8)
+    assert load["max"] == 3
+    assert gateway.queued == 0
+
+
+def test_routes_to_least_loaded_endpoint():
+    gateway, clients, _ = make_gateway([{"base_url": "http://a"}, {"base_url": "http://b"}], max_in_flight=4)
+    responses = chat_concurrently(gateway, 4)
+    assert [len(client.calls) for client in clients] == [2, 2]
+    assert sorted(response.endpoint for response in responses) == ["http://a", "http://a", "http://b", "http://b"]
+
+
+def test_fails_over_and_cools_down_unreachable_endpoint():
+    gateway, (down, up), _ = make_gateway([{"base_url": "http://a"}, {"base_url": "http://b"}],
+                                          errors={"http://a": connection_error("http://a")}, cooldown=60)
+    response = gateway.chat([{"role": "user", "content": "hi"}])
+    assert response.endpoint == "http://b"
+    assert gateway.endpoints[0].failures == 1
+    assert not gateway.endpoints[0].is_up(time.monotonic())
+
+    # While it cools down the failed endpoint is not tried first
+    gateway.chat([{"role": "user", "content": "again"}])
+    assert len(down.calls) == 1
+    assert len(up.calls) == 2
+
+
+def test_raises_when_every_endpoint_fails():
+    gateway, clients, _ = make_gateway([{"base_url": "http://a"}, {"base_url": "http://b"}],
+                                       errors={"http://a": connection_error("http://a"),
+                                               "http://b": connection_error("http://b")})
+    with pytest.raises(openai.APIConnectionError):
+        gateway.chat([{"role": "user", "content": "hi"}])
+    assert [len(client.calls) for client in clients] == [1, 1]
+
+
+def test_does_not_fail_over_to_endpoint_without_the_model():
+    gateway, (serving, other), _ = make_gateway(
+        [{"base_url": "http://a", "model": "llama3.2"}, {"base_url": "http://b", "model": "qwen2.5"}],
+        errors={"http://a": connection_error("http://a")})
+    with pytest.raises(openai.APIConnectionError):
+        gateway.chat([{"role": "user", "content": "hi"}], model="llama3.2")
+    assert serving.calls == ["llama3.2"]
+    assert other.calls == []
+
+
+def test_local_endpoint_serves_any_model():
+    gateway, (client,), _ = make_gateway([{"base_url": "http://a", "model": "local"}])
+    assert gateway.chat([{"role": "user", "content": "hi"}], model="qwen2.5").model == "qwen2.5"
+
+
+def test_raises_when_no_endpoint_serves_the_model():
+    gateway, clients, _ = make_gateway([{"base_url": "http://a", "model": "llama3.2"}])
+    with pytest.raises(NoEndpointForModel, match="qwen2.5"):
+        gateway.chat([{"role": "user", "content": "hi"}], model="qwen2.5")
+    assert clients[0].calls == []
+    assert gateway.queued == 0
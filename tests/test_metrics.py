@@ -0,0 +1,116 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from utils import metrics
+
+
+@pytest.fixture
+def metrics_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("ITL_METRICS", "true")
+    monkeypatch.setenv("ITL_METRICS_DIR", str(tmp_path))
+    monkeypatch.setattr(metrics, "_records", [])
+    # The run's Prometheus file is written at exit, which the tests do by hand
+    monkeypatch.setattr(metrics, "_atexit_registered", True)
+    return tmp_path
+
+
+def test_records_json_lines(metrics_dir):
+    metrics.record("llm", "llama3.2", 1.5, role="Researcher", queue_time=0.25, prompt_tokens=100,
+                   completion_tokens=20, retries=1)
+    with metrics.role_scope("Writer"):
+        metrics.record("tool", "search", 0.5, error="TimeoutError")
+
+    with open(metrics_dir / "metrics.jsonl") as file:
+        first, second = [json.loads(line) for line in file]
+    assert first["kind"] == "llm" and first["name"] == "llama3.2" and first["role"] == "Researcher"
+    assert (first["wall_time"], first["queue_time"]) == (1.5, 0.25)
+    assert (first["prompt_tokens"], first["completion_tokens"], first["retries"]) == (100, 20, 1)
+    assert first["error"] is None
+    assert second["role"] == "Writer"
+    assert second["error"] == "TimeoutError"
+    assert metrics.load_records() == [first, second]
+
+
+def test_disabled_records_nothing(metrics_dir, monkeypatch):
+    monkeypatch.setenv("ITL_METRICS", "false")
+    metrics.record("llm", "llama3.2", 1.0)
+    assert not (metrics_dir / "metrics.jsonl").exists()
+    assert metrics.load_records() == []
+
+
+def test_timer_records_errors(metrics_dir):
+    with pytest.raises(ValueError):
+        with metrics.timer("tool", "parse", role="Coder") as fields:
+            fields["retries"] = 2
+            raise ValueError("bad input")
+    entry, = metrics.load_records()
+    assert (entry["kind"], entry["name"], entry["role"]) == ("tool", "parse", "Coder")
+    assert entry["retries"] == 2
+    assert entry["error"] == "ValueError"
+
+
+def test_summarize_per_role_and_kind(metrics_dir):
+    for wall_time in (1.0, 2.0, 3.0):
+        metrics.record("llm", "llama3.2", wall_time, role="Researcher", prompt_tokens=10)
+    metrics.record("task", "research", 7.0, role="Researcher")
+    rows = {(row["role"], row["kind"]): row for row in metrics.summarize(metrics.load_records())}
+    assert set(rows) == {("Researcher", "llm"), ("Researcher", "task")}
+    llm = rows["Researcher", "llm"]
+    assert (llm["count"], llm["p50"], llm["p95"], llm["prompt_tokens"]) == (3, 2.0, 3.0, 30)
+
+
+def test_prometheus_text(metrics_dir):
+    metrics.record("llm", "llama3.2", 1.0, role="Researcher", prompt_tokens=10, completion_tokens=5)
+    metrics.record("llm", "llama3.2", 3.0, role="Researcher", prompt_tokens=20, completion_tokens=5, retries=1)
+    metrics.record("tool", 'say "hi"', 0.5)
+
+    metrics.write_prometheus()
+    text = (metrics_dir / "metrics.prom").read_text()
+    assert text == metrics.prometheus_text(metrics.load_records())
+    lines = text.splitlines()
+    labels = 'kind="llm",name="llama3.2",role="Researcher"'
+    assert "# TYPE itl_duration_seconds summary" in lines
+    assert f'itl_duration_seconds{{{labels},quantile="0.5"}} 1.0' in lines
+    assert f'itl_duration_seconds{{{labels},quantile="0.95"}} 3.0' in lines
+    assert f"itl_duration_seconds_sum{{{labels}}} 4.0" in lines
+    assert f"itl_duration_seconds_count{{{labels}}} 2" in lines
+    assert f"itl_prompt_tokens_total{{{labels}}} 30" in lines
+    assert f"itl_completion_tokens_total{{{labels}}} 10" in lines
+    assert f"itl_retries_total{{{labels}}} 1" in lines
+    # Label values are escaped and a missing role is an empty label
+    assert 'itl_duration_seconds_count{kind="tool",name="say \\"hi\\"",role=""} 1' in lines
+
+
+def test_write_prometheus_without_records_writes_nothing(metrics_dir):
+    metrics.write_prometheus()
+    assert not (metrics_dir / "metrics.prom").exists()
+
+
+def test_instrumented_kickoff_records_tasks_and_the_crew_run(metrics_dir):
+    class Crew:
+        def __init__(self, tasks):
+            self.tasks = tasks
+
+        def kickoff(self):
+            for task in self.tasks:
+                metrics.record("llm", "llama3.2", 0.1)
+                task.callback(task.description)
+            return "done"
+
+    tasks = [SimpleNamespace(description="Research the topic", agent=SimpleNamespace(role="Researcher"),
+                             callback=None),
+             SimpleNamespace(description="Write the article", agent=SimpleNamespace(role="Writer"),
+                             callback=None)]
+    assert metrics.instrumented_kickoff(Crew(tasks)) == "done"
+    assert all(task.callback is None for task in tasks)
+
+    records = [(entry["kind"], entry["name"], entry["role"]) for entry in metrics.load_records()]
+    assert records == [
+        ("llm", "llama3.2", "Researcher"),
+        ("task", "Research the topic", "Researcher"),
+        ("llm", "llama3.2", "Writer"),
+        ("task", "Write the article", "Writer"),
+        ("crew", "crew.kickoff", "crew"),
+    ]
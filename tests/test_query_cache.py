@@ -0,0 +1,86 @@
+import time
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import query_cache
+from query_cache import QueryCache, bump_index_version, index_version
+
+PARAMS = '{"limit": 5}'
+RESULTS = [("1", "def parse(): ..."), ("2", "def load(): ...")]
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(query_cache, "INDEX_DIR", str(tmp_path / "index"))
+    return QueryCache(str(tmp_path / "queries"), threshold=0.95, ttl=3600)
+
+
+def test_similar_query_hits(cache):
+    cache.put("code", [1.0, 0.0, 0.0], PARAMS, [], RESULTS)
+    # cos = 0.995, the scale of the embedding does not matter
+    assert cache.get("code", [10.0, 1.0, 0.0], PARAMS) == RESULTS
+
+
+def test_dissimilar_query_misses(cache):
+    cache.put("code", [1.0, 0.0, 0.0], PARAMS, [], RESULTS)
+    # cos = 0.89
+    assert cache.get("code", [1.0, 0.5, 0.0], PARAMS) is None
+    assert cache.get("code", [0.0, 1.0, 0.0], PARAMS) is None
+
+
+def test_other_collection_or_params_miss(cache):
+    cache.put("code", [1.0, 0.0, 0.0], PARAMS, [], RESULTS)
+    assert cache.get("docs", [1.0, 0.0, 0.0], PARAMS) is None
+    assert cache.get("code", [1.0, 0.0, 0.0], '{"limit": 10}') is None
+
+
+def test_exclusions(cache):
+    cache.put("code", [1.0, 0.0, 0.0], PARAMS, ["7"], RESULTS)
+    # The cached search left out chunk 7, so only a query that also leaves it out can use it
+    assert cache.get("code", [1.0, 0.0, 0.0], PARAMS) is None
+    assert cache.get("code", [1.0, 0.0, 0.0], PARAMS, exclude_ids=["7", "8"]) == RESULTS
+    # A result the query has to leave out makes the cached results unusable
+    assert cache.get("code", [1.0, 0.0, 0.0], PARAMS, exclude_ids=["7", "2"]) is None
+
+
+def test_best_usable_match_wins(cache):
+    cache.put("code", [1.0, 0.0, 0.0], PARAMS, [], RESULTS)
+    cache.put("code", [1.0, 0.1, 0.0], PARAMS, [], [("3", "class Config: ...")])
+    assert cache.get("code", [1.0, 0.0, 0.0], PARAMS) == RESULTS
+    assert cache.get("code", [1.0, 0.1, 0.0], PARAMS) == [("3", "class Config: ...")]
+    assert cache.get("code", [1.0, 0.0, 0.0], PARAMS, exclude_ids=["1"]) == [("3", "class Config: ...")]
+
+
+def test_new_index_version_invalidates(cache, tmp_path):
+    assert index_version("code") == ""
+    cache.put("code", [1.0, 0.0, 0.0], PARAMS, [], RESULTS)
+    cache.put("docs", [1.0, 0.0, 0.0], PARAMS, [], RESULTS)
+    bump_index_version("code")
+    assert index_version("code") != ""
+    assert cache.get("code", [1.0, 0.0, 0.0], PARAMS) is None
+    assert cache.get("docs", [1.0, 0.0, 0.0], PARAMS) == RESULTS
+    # Also for another process reading the same file
+    assert QueryCache(str(tmp_path / "queries")).get("code", [1.0, 0.0, 0.0], PARAMS) is None
+
+
+def test_persists_and_expires(cache, tmp_path):
+    cache.put("code", [1.0, 0.0, 0.0], PARAMS, [], RESULTS)
+    assert QueryCache(str(tmp_path / "queries")).get("code", [1.0, 0.0, 0.0], PARAMS) == RESULTS
+    assert QueryCache(str(tmp_path / "queries"), ttl=-1).get("code", [1.0, 0.0, 0.0], PARAMS) is None
+
+
+def test_max_entries_drops_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(query_cache, "INDEX_DIR", str(tmp_path / "index"))
+    cache = QueryCache(str(tmp_path / "queries"), max_entries=2)
+    cache.put("code", [1.0, 0.0, 0.0], PARAMS, [], [("1", "a")])
+    time.sleep(0.01)
+    cache.put("code", [0.0, 1.0, 0.0], PARAMS, [], [("2", "b")])
+    time.sleep(0.01)
+    assert cache.get("code", [1.0, 0.0, 0.0], PARAMS) == [("1", "a")]
+    time.sleep(0.01)
+    cache.put("code", [0.0, 0.0, 1.0], PARAMS, [], [("3", "c")])
+    assert cache.get("code", [0.0, 1.0, 0.0], PARAMS) is None
+    assert cache.get("code", [1.0, 0.0, 0.0], PARAMS) == [("1", "a")]
+    assert cache.get("code", [0.0, 0.0, 1.0], PARAMS) == [("3", "c")]
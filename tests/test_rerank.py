@@ -0,0 +1,68 @@
+import time
+
+import pytest
+
+from rerank import CrossEncoderScorer, LexicalOverlapScorer, Reranker, ScoreCache, create_scorer
+
+
+class CountingScorer(LexicalOverlapScorer):
+    name = "counting"
+
+    def __init__(self):
+        self.scored = []
+
+    def score(self, query, texts):
+        self.scored.extend(texts)
+        return super().score(query, texts)
+
+
+def test_lexical_overlap_scores():
+    scorer = LexicalOverlapScorer()
+    assert scorer.score("parse config file", ["def parse_config(file): ...", "config", "nothing here"]) == \
+        pytest.approx([1.0, 1 / 3, 0.0])
+    assert scorer.score("", ["anything"]) == [0.0]
+
+
+def test_create_scorer():
+    assert isinstance(create_scorer("lexical"), LexicalOverlapScorer)
+    scorer = create_scorer("cross-encoder:BAAI/bge-reranker-base")
+    assert isinstance(scorer, CrossEncoderScorer) and scorer.model == "BAAI/bge-reranker-base"
+    with pytest.raises(ValueError, match="Unknown reranker"):
+        create_scorer("colbert")
+
+
+def test_cached_scores_are_not_recomputed(tmp_path):
+    scorer = CountingScorer()
+    reranker = Reranker(scorer, ScoreCache(str(tmp_path)))
+    first = reranker.scores("parse config", ["parse the config", "load a file", "parse the config"])
+    assert scorer.scored == ["parse the config", "load a file"]
+
+    second = reranker.scores("parse config", ["load a file", "read the config", "parse the config"])
+    assert scorer.scored == ["parse the config", "load a file", "read the config"]
+    assert first == [1.0, 0.0, 1.0]
+    assert second == [0.0, 0.5, 1.0]
+
+    # The cache is on disk, keyed by scorer and query
+    again = Reranker(scorer, ScoreCache(str(tmp_path)))
+    assert again.scores("parse config", ["read the config"]) == [0.5]
+    assert len(scorer.scored) == 3
+    again.scores("config", ["read the config"])
+    assert len(scorer.scored) == 4
+
+
+def test_without_cache_scores_every_call():
+    scorer = CountingScorer()
+    reranker = Reranker(scorer)
+    reranker.scores("parse", ["parse it"])
+    reranker.scores("parse", ["parse it"])
+    assert scorer.scored == ["parse it", "parse it"]
+
+
+def test_score_cache_keeps_newest_rows(tmp_path):
+    cache = ScoreCache(str(tmp_path), max_rows=3)
+    for index in range(5):
+        cache.put_many("lexical", "query", {f"chunk{index}": float(index)})
+        time.sleep(0.01)
+    assert cache.get_many("lexical", "query", [f"chunk{index}" for index in range(5)]) == \
+        {"chunk2": 2.0, "chunk3": 3.0, "chunk4": 4.0}
+    assert cache.get_many("lexical", "query", []) == {}
@@ -0,0 +1,41 @@
+import pytest
+
+from retrieval import mmr, reciprocal_rank_fusion
+
+
+def test_rrf_sums_reciprocal_ranks():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]], k=60)
+    scores = dict(fused)
+    assert fused[0][0] == "b"
+    assert scores["b"] == pytest.approx(1 / 62 + 1 / 61)
+    assert scores["a"] == pytest.approx(1 / 61)
+    assert scores["d"] == pytest.approx(1 / 62)
+    assert [doc_id for doc_id, _ in fused] == ["b", "a", "d", "c"]
+
+
+def test_rrf_of_nothing():
+    assert reciprocal_rank_fusion([]) == []
+    assert reciprocal_rank_fusion([[], []]) == []
+
+
+def test_mmr_by_relevance_only():
+    vectors = [[1.0, 0.0], [0.9, 0.1], [0.0, 1.0]]
+    assert mmr([1.0, 0.0], vectors, k=3, lambda_mult=1.0) == [0, 1, 2]
+
+
+def test_mmr_skips_near_duplicates():
+    # 0 and 1 are almost the same, 2 is less relevant but adds something new
+    vectors = [[1.0, 0.0, 0.0], [0.99, 0.01, 0.0], [0.6, 0.8, 0.0]]
+    assert mmr([1.0, 0.3, 0.0], vectors, k=2, lambda_mult=1.0) == [1, 0]
+    assert mmr([1.0, 0.3, 0.0], vectors, k=2, lambda_mult=0.5) == [1, 2]
+
+
+def test_mmr_uses_given_relevance():
+    vectors = [[1.0, 0.0], [0.0, 1.0]]
+    assert mmr([1.0, 0.0], vectors, k=1, lambda_mult=1.0, relevance=[0.1, 0.9]) == [1]
+
+
+def test_mmr_edge_cases():
+    assert mmr([1.0, 0.0], [], k=3) == []
+    assert mmr([1.0, 0.0], [[1.0, 0.0]], k=0) == []
+    assert mmr([1.0, 0.0], [[1.0, 0.0], [0.0, 1.0]], k=5, lambda_mult=1.0) == [0, 1]
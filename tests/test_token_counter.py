@@ -0,0 +1,49 @@
+import pytest
+
+from utils import token_counter
+from utils.token_counter import Tokenizer, count_tokens, fit_to_budget, truncate_tokens
+
+
+def char_tokenizer():
+    # One token per character, far more than the length estimate
+    return Tokenizer("chars", lambda text: list(text), lambda ids: "".join(ids))
+
+
+@pytest.fixture
+def tokenizer(monkeypatch):
+    loaded = []
+
+    def get_tokenizer(model):
+        loaded.append(model)
+        return char_tokenizer()
+
+    monkeypatch.setattr(token_counter, "get_tokenizer", get_tokenizer)
+    return loaded
+
+
+def test_estimate_never_loads_a_tokenizer(tokenizer):
+    text = "x" * 700
+    assert count_tokens(text, "llama3") == 200
+    assert len(truncate_tokens(text, 100, model="llama3")) == 350
+    assert truncate_tokens("short", 100, model="llama3") == "short"
+    assert tokenizer == []
+
+
+def test_exact_truncation_does_not_trust_the_estimate(tokenizer):
+    text = "{}" * 20
+    assert token_counter.approximate_tokens(text) <= 30
+    assert count_tokens(text, "llama3", exact=True) == 40
+    assert truncate_tokens(text, 30, model="llama3", exact=True) == text[:30]
+    assert fit_to_budget(text, 30, model="llama3", exact=True) == text[:30]
+    assert truncate_tokens(text, 40, model="llama3", exact=True) == text
+
+
+def test_exact_falls_back_to_the_estimate(monkeypatch):
+    monkeypatch.setattr(token_counter, "get_tokenizer", lambda model: None)
+    assert count_tokens("x" * 70, "unknown", exact=True) == 20
+    assert len(truncate_tokens("x" * 700, 100, model="unknown", exact=True)) == 350
+
+
+def test_fit_to_budget_without_a_limit(monkeypatch):
+    monkeypatch.delenv("ITL_MAX_FILE_TOKENS", raising=False)
+    assert fit_to_budget("x" * 10000) == "x" * 10000
@@ -0,0 +1,131 @@
+import numpy as np
+import pytest
+
+import vector_store
+from vector_store import LocalVectorStore
+
+DIM = 8
+
+
+def unit(index):
+    vector = np.zeros(DIM, dtype=np.float32)
+    vector[index % DIM] = 1.0
+    return vector.tolist()
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LocalVectorStore(str(tmp_path))
+    store.create("chunks", DIM)
+    return store
+
+
+def test_upsert_query_and_retrieve(store):
+    store.upsert("chunks", ["a", "b", "c"], [unit(0), unit(1), unit(2)],
+                 [{"content": "A", "language": "py"}, {"content": "B", "language": "md"}, {"content": "C"}])
+
+    hits = store.query("chunks", unit(1), limit=2)
+    assert hits[0].id == "b"
+    assert hits[0].score == pytest.approx(1.0)
+    assert hits[0].payload == {"content": "B", "language": "md"}
+    assert len(hits) == 2
+
+    point, = store.retrieve("chunks", ["c"], with_vectors=True, payload_fields=["content"])
+    assert point.payload == {"content": "C"}
+    assert point.vector == pytest.approx(unit(2))
+
+
+def test_exclude_ids_filters_and_projection(store):
+    store.upsert("chunks", ["a", "b", "c"], [unit(0), unit(0), unit(0)],
+                 [{"content": "A", "language": "py"}, {"content": "B", "language": "md"},
+                  {"content": "C", "language": "py"}])
+
+    assert {hit.id for hit in store.query("chunks", unit(0), limit=5, exclude_ids=["a"])} == {"b", "c"}
+    hits = store.query("chunks", unit(0), limit=5, filters={"language": "py"}, payload_fields=["language"])
+    assert {hit.id for hit in hits} == {"a", "c"}
+    assert all(hit.payload == {"language": "py"} for hit in hits)
+    assert store.query("chunks", unit(0), limit=5, filters={"language": ["rs"]}) == []
+
+
+def test_delete_reuses_rows_and_reupsert_overwrites(store):
+    store.upsert("chunks", ["a", "b"], [unit(0), unit(1)], [{"content": "A"}, {"content": "B"}])
+    collection = store._collection("chunks")
+    row_a = collection._rows["a"]
+
+    store.delete("chunks", ["a"])
+    assert store.retrieve("chunks", ["a"]) == []
+    assert [hit.id for hit in store.query("chunks", unit(0), limit=5)] == ["b"]
+
+    # The freed row is taken by the next new point
+    store.upsert("chunks", ["c"], [unit(2)], [{"content": "C"}])
+    assert collection._rows["c"] == row_a
+
+    store.upsert("chunks", ["b"], [unit(3)], [{"content": "B2"}])
+    hit, = store.query("chunks", unit(3), limit=1)
+    assert (hit.id, hit.payload) == ("b", {"content": "B2"})
+    assert len(collection._rows) == 2
+
+
+def test_grows_past_initial_capacity(store, monkeypatch):
+    monkeypatch.setattr(vector_store, "INITIAL_CAPACITY", 4)
+    store.drop("chunks")
+    store.create("chunks", DIM)
+    ids = [f"p{index}" for index in range(11)]
+    vectors = np.random.default_rng(0).normal(size=(11, DIM)).astype(np.float32)
+    store.upsert("chunks", ids[:3], vectors[:3], [{"content": point_id} for point_id in ids[:3]])
+    store.upsert("chunks", ids[3:], vectors[3:], [{"content": point_id} for point_id in ids[3:]])
+
+    assert len(store._collection("chunks")._alive) == 16
+    for index, point_id in enumerate(ids):
+        assert store.query("chunks", vectors[index], limit=1)[0].id == point_id
+
+
+def test_reopen_from_disk(store, tmp_path):
+    store.upsert("chunks", ["a", "b", "c"], [unit(0), unit(1), unit(2)],
+                 [{"content": "A"}, {"content": "B"}, {"content": "C"}])
+    store.delete("chunks", ["b"])
+    store.set_payload("chunks", "c", {"start_line": 3})
+
+    reopened = LocalVectorStore(str(tmp_path))
+    assert reopened.exists("chunks")
+    assert {hit.id for hit in reopened.query("chunks", unit(0), limit=5)} == {"a", "c"}
+    assert reopened.retrieve("chunks", ["c"])[0].payload == {"content": "C", "start_line": 3}
+    reopened.upsert("chunks", ["d"], [unit(1)], [{"content": "D"}])
+    assert reopened.query("chunks", unit(1), limit=1)[0].id == "d"
+
+
+def test_sees_changes_of_another_store(store, tmp_path):
+    store.upsert("chunks", ["a"], [unit(0)], [{"content": "A"}])
+    other = LocalVectorStore(str(tmp_path))
+    assert [hit.id for hit in other.query("chunks", unit(0), limit=5)] == ["a"]
+
+    store.upsert("chunks", ["b"], [unit(0)], [{"content": "B"}])
+    assert {hit.id for hit in other.query("chunks", unit(0), limit=5)} == {"a", "b"}
+
+    # A recreated collection has a new generation, even at the same version
+    store.create("chunks", DIM, recreate=True)
+    assert other.query("chunks", unit(0), limit=5) == []
+
+
+def test_query_of_missing_collection(tmp_path):
+    store = LocalVectorStore(str(tmp_path))
+    assert store.query("missing", unit(0), limit=5) == []
+    assert store.retrieve("missing", ["a"]) == []
+
+
+def test_hnsw_matches_exhaustive_search(store, monkeypatch):
+    pytest.importorskip("hnswlib")
+    vectors = np.random.default_rng(1).normal(size=(200, DIM)).astype(np.float32)
+    ids = [f"p{index}" for index in range(200)]
+    store.upsert("chunks", ids, vectors, [{"content": point_id} for point_id in ids])
+    exhaustive = [hit.id for hit in store.query("chunks", vectors[0], limit=5)]
+
+    monkeypatch.setattr(vector_store, "HNSW_THRESHOLD", 100)
+    assert [hit.id for hit in store.query("chunks", vectors[0], limit=5)] == exhaustive
+    collection = store._collection("chunks")
+    assert collection._hnsw_version == collection.version
+
+    # Changing the collection rebuilds the graph
+    store.delete("chunks", ["p0"])
+    assert "p0" not in [hit.id for hit in store.query("chunks", vectors[0], limit=5)]
+    assert collection._hnsw_version == collection.version
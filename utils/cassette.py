@@ -0,0 +1,179 @@
+"""
+Record/replay cassettes for LLM, embedding and search calls.
+
+With ITL_CASSETTE_MODE=record every request that goes through the gateway, a
+client from create_llm or the search tool is appended with its response and
+latency to the cassette file (ITL_CASSETTE, default .cache/cassette.jsonl). With
+ITL_CASSETTE_MODE=replay the same requests are answered from the file without
+touching a model or the network, which makes runs repeatable for benchmarks.
+
+Identical requests are replayed in the order they were recorded; once those run
+out the last response is repeated. A request that was never recorded raises
+CassetteMiss. ITL_CASSETTE_LATENCY controls the simulated latency in replay mode:
+"recorded" sleeps for the recorded latency, a number sleeps that many seconds
+and the default 0 answers right away.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+DEFAULT_CASSETTE_PATH = os.path.join(".cache", "cassette.jsonl")
+MODES = ("record", "replay")
+
+_cassettes = {}
+_cassettes_lock = threading.Lock()
+
+
+class CassetteMiss(KeyError):
+    """Raised in replay mode for a request the cassette has no response for."""
+
+
+def cassette_mode():
+    mode = os.environ.get("ITL_CASSETTE_MODE", "").strip().lower()
+    return mode if mode in MODES else None
+
+
+def request_key(kind, request):
+    # Object reprs such as "<httpx.Client object at 0x7f...>" differ between runs
+    text = re.sub(r" at 0x[0-9a-fA-F]+", "", json.dumps(request, sort_keys=True, default=str))
+    return hashlib.sha256(f"{kind}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """
+    One cassette file.
+
+    Args:
+        path (str): The JSONL file holding the interactions.
+        mode (str): "record" or "replay".
+        latency (str, optional): The replay latency, see the module docstring.
+            Defaults to ITL_CASSETTE_LATENCY.
+    """
+
+    def __init__(self, path, mode, latency=None):
+        self.path = path
+        self.mode = mode
+        self.latency = latency if latency is not None else os.environ.get("ITL_CASSETTE_LATENCY", "0")
+        self._lock = threading.Lock()
+        self._interactions = {}
+        self._played = {}
+        if mode == "replay":
+            self._load()
+        else:
+            cassette_dir = os.path.dirname(path)
+            if cassette_dir and not os.path.exists(cassette_dir):
+                os.makedirs(cassette_dir)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Cassette '{self.path}' does not exist, record it first.")
+        with open(self.path, "r") as file:
+            for line in file:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._interactions.setdefault(entry["key"], []).append(entry)
+
+    def record(self, kind, request, response, latency):
+        entry = {"key": request_key(kind, request), "kind": kind, "request": request,
+                 "response": response, "latency": round(latency, 6)}
+        with self._lock, open(self.path, "a") as file:
+            file.write(json.dumps(entry, default=str) + "\n")
+
+    def lookup(self, kind, request):
+        """Returns the next recorded (response, latency) for the request."""
+        key = request_key(kind, request)
+        with self._lock:
+            entries = self._interactions.get(key)
+            if not entries:
+                raise CassetteMiss(f"No recorded {kind} response in '{self.path}' for: "
+                                   f"{json.dumps(request, default=str)[:200]}")
+            index = self._played.get(key, 0)
+            self._played[key] = index + 1
+            entry = entries[min(index, len(entries) - 1)]
+        return entry["response"], entry["latency"]
+
+    def replay_delay(self, recorded_latency):
+        if self.latency == "recorded":
+            return recorded_latency
+        return float(self.latency or 0)
+
+    def replay(self, kind, request):
+        """Returns the recorded response after the simulated latency."""
+        response, latency = self.lookup(kind, request)
+        time.sleep(self.replay_delay(latency))
+        return response
+
+    def call(self, kind, request, func, encode=None, decode=None):
+        """
+        Calls func() and records its result, or returns the recorded result in
+        replay mode. encode turns the result into JSON data, decode turns it back.
+        """
+        if self.mode == "replay":
+            response = self.replay(kind, request)
+            return decode(response) if decode else response
+        start = time.perf_counter()
+        result = func()
+        self.record(kind, request, encode(result) if encode else result, time.perf_counter() - start)
+        return result
+
+    async def acall(self, kind, request, func, encode=None, decode=None):
+        """Async version of call, func returns an awaitable."""
+        import asyncio
+        if self.mode == "replay":
+            response, latency = self.lookup(kind, request)
+            await asyncio.sleep(self.replay_delay(latency))
+            return decode(response) if decode else response
+        start = time.perf_counter()
+        result = await func()
+        self.record(kind, request, encode(result) if encode else result, time.perf_counter() - start)
+        return result
+
+
+def get_cassette():
+    """Returns the cassette for ITL_CASSETTE/ITL_CASSETTE_MODE, or None when neither mode is on."""
+    mode = cassette_mode()
+    if mode is None:
+        return None
+    path = os.environ.get("ITL_CASSETTE", DEFAULT_CASSETTE_PATH)
+    with _cassettes_lock:
+        cassette = _cassettes.get((path, mode))
+        if cassette is None:
+            cassette = Cassette(path, mode)
+            _cassettes[(path, mode)] = cassette
+        return cassette
+
+
+def cassette_llm_cache(cassette):
+    """
+    Returns a langchain cache that records or replays the calls of the LLM it is
+    set on, so the langchain clients from create_llm take part in a cassette.
+    """
+    from langchain_core.caches import BaseCache
+    from langchain_core.load import dumps, loads
+
+    class CassetteLLMCache(BaseCache):
+        def __init__(self):
+            self._started = {}
+
+        def lookup(self, prompt, llm_string):
+            request = {"prompt": prompt, "llm_string": llm_string}
+            if cassette.mode == "replay":
+                return [loads(generation) for generation in cassette.replay("llm", request)]
+            # Nothing to return, langchain calls the model and then update()
+            self._started[(prompt, llm_string)] = time.perf_counter()
+            return None
+
+        def update(self, prompt, llm_string, return_val):
+            if cassette.mode != "record":
+                return
+            start = self._started.pop((prompt, llm_string), time.perf_counter())
+            cassette.record("llm", {"prompt": prompt, "llm_string": llm_string},
+                            [dumps(generation) for generation in return_val], time.perf_counter() - start)
+
+        def clear(self, **kwargs):
+            pass
+
+    return CassetteLLMCache()
@@ -0,0 +1,191 @@
+"""
+Persistent embedding cache.
+
+Vectors are stored as float32 rows in one memory-mapped file per embedding model
+(.cache/embeddings/<model>.f32) and a SQLite index maps a hash of the model and
+the normalized text to a row. Texts that only differ in whitespace share an entry.
+Each model's file is bounded by ITL_EMBED_CACHE_MAX_MB (default 64); once it is
+full, the least recently used row is overwritten.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_DIR = os.path.join(".cache", "embeddings")
+DEFAULT_MAX_MB = 64
+MIN_CAPACITY = 256
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def normalize_text(text):
+    return " ".join(text.split())
+
+
+def text_key(text):
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Args:
+        directory (str, optional): Where the index and the vector files live.
+            Defaults to ITL_EMBED_CACHE_DIR or .cache/embeddings.
+        max_bytes (int, optional): Size bound of each model's vector file.
+            Defaults to ITL_EMBED_CACHE_MAX_MB.
+    """
+
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = directory or os.environ.get("ITL_EMBED_CACHE_DIR", DEFAULT_CACHE_DIR)
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get("ITL_EMBED_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._vectors = {}
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        self._conn = sqlite3.connect(os.path.join(self.directory, "index.sqlite"), check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS models ("
+                " model TEXT PRIMARY KEY,"
+                " dim INTEGER NOT NULL,"
+                " capacity INTEGER NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " model TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " row INTEGER NOT NULL,"
+                " last_access REAL NOT NULL,"
+                " PRIMARY KEY (model, key))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (model, last_access)")
+
+    def _path(self, model):
+        slug = re.sub(r"[^A-Za-z0-9_.-]", "_", model)
+        return os.path.join(self.directory, f"{slug}-{hashlib.sha256(model.encode('utf-8')).hexdigest()[:8]}.f32")
+
+    def _open(self, model, dim, capacity):
+        import numpy as np
+        path = self._path(model)
+        size = capacity * dim * 4
+        with open(path, "ab") as file:
+            if file.tell() < size:
+                file.truncate(size)
+        vectors = np.memmap(path, dtype=np.float32, mode="r+", shape=(capacity, dim))
+        self._vectors[model] = vectors
+        return vectors
+
+    def _model(self, model, dim=None):
+        """Returns (dim, capacity, vectors) for a model, registering it when dim is given."""
+        row = self._conn.execute("SELECT dim, capacity FROM models WHERE model = ?", (model,)).fetchone()
+        if row is None:
+            if dim is None:
+                return None
+            capacity = min(MIN_CAPACITY, self.max_rows(dim))
+            self._conn.execute("INSERT INTO models (model, dim, capacity) VALUES (?, ?, ?)", (model, dim, capacity))
+            return dim, capacity, self._open(model, dim, capacity)
+        dim, capacity = row
+        vectors = self._vectors.get(model)
+        if vectors is None or vectors.shape[0] != capacity:
+            vectors = self._open(model, dim, capacity)
+        return dim, capacity, vectors
+
+    def max_rows(self, dim):
+        return max(1, self.max_bytes // (dim * 4))
+
+    def get_many(self, model, texts):
+        """Returns the cached vectors (float32 arrays) for the texts, None where there is none."""
+        import numpy as np
+        keys = [text_key(text) for text in texts]
+        results = [None] * len(texts)
+        with self._lock, self._conn:
+            registered = self._model(model)
+            if registered is None:
+                return results
+            _, _, vectors = registered
+            now = time.time()
+            for index, key in enumerate(keys):
+                row = self._conn.execute("SELECT row FROM entries WHERE model = ? AND key = ?",
+                                         (model, key)).fetchone()
+                if row is not None:
+                    results[index] = np.array(vectors[row[0]])
+                    self._conn.execute("UPDATE entries SET last_access = ? WHERE model = ? AND key = ?",
+                                       (now, model, key))
+        return results
+
+    def put_many(self, model, texts, embeddings):
+        import numpy as np
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if len(texts) == 0:
+            return
+        with self._lock, self._conn:
+            dim, capacity, vectors = self._model(model, embeddings.shape[1])
+            if embeddings.shape[1] != dim:
+                raise ValueError(f"Embeddings for {model} have {embeddings.shape[1]} dimensions, the cache has {dim}.")
+            for text, embedding in zip(texts, embeddings):
+                key = text_key(text)
+                existing = self._conn.execute("SELECT row FROM entries WHERE model = ? AND key = ?",
+                                              (model, key)).fetchone()
+                if existing is not None:
+                    row = existing[0]
+                else:
+                    row, capacity, vectors = self._free_row(model, dim, capacity, vectors)
+                vectors[row] = embedding
+                self._conn.execute("INSERT OR REPLACE INTO entries (model, key, row, last_access) VALUES (?, ?, ?, ?)",
+                                   (model, key, row, time.time()))
+            vectors.flush()
+
+    def _free_row(self, model, dim, capacity, vectors):
+        count = self._conn.execute("SELECT COUNT(*) FROM entries WHERE model = ?", (model,)).fetchone()[0]
+        if count < capacity:
+            return count, capacity, vectors
+        max_rows = self.max_rows(dim)
+        if capacity < max_rows:
+            capacity = min(max_rows, capacity * 2)
+            self._conn.execute("UPDATE models SET capacity = ? WHERE model = ?", (capacity, model))
+            return count, capacity, self._open(model, dim, capacity)
+        key, row = self._conn.execute(
+            "SELECT key, row FROM entries WHERE model = ? ORDER BY last_access ASC LIMIT 1", (model,)
+        ).fetchone()
+        self._conn.execute("DELETE FROM entries WHERE model = ? AND key = ?", (model, key))
+        return row, capacity, vectors
+
+    def embed(self, model, texts, embed_fn):
+        """
+        Returns float32 embeddings for the texts, calling embed_fn(texts) with only the
+        ones that are not cached yet and storing what it returns.
+        """
+        import numpy as np
+        cached = self.get_many(model, texts)
+        missing = [index for index, vector in enumerate(cached) if vector is None]
+        if missing:
+            missing_texts = [texts[index] for index in missing]
+            embeddings = np.asarray(embed_fn(missing_texts), dtype=np.float32)
+            self.put_many(model, missing_texts, embeddings)
+            for index, embedding in zip(missing, embeddings):
+                cached[index] = embedding
+        return cached
+
+    def clear(self, model=None):
+        with self._lock, self._conn:
+            if model is None:
+                self._conn.execute("DELETE FROM entries")
+            else:
+                self._conn.execute("DELETE FROM entries WHERE model = ?", (model,))
+
+
+def get_embedding_cache():
+    """Returns the process-wide embedding cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+        return _cache
@@ -0,0 +1,103 @@
+"""
+Framework adapters for utils/llm_gateway.py.
+
+GatewayLLM plugs the gateway into crewAI/langchain agents (create_llm backend
+"gateway") and GatewayModelClient plugs it into autogen through
+`register_model_client`, so both frameworks share the same per-endpoint limits.
+"""
+from typing import Any, List, Optional
+
+from langchain_core.language_models.llms import LLM
+
+from utils.llm_gateway import get_gateway, load_config_list
+
+
+class GatewayLLM(LLM):
+    """langchain LLM that sends each prompt as a chat completion through the gateway."""
+
+    model: Optional[str] = None
+    env_or_file: Optional[str] = None
+    temperature: Optional[float] = None
+    top_p: Optional[float] = None
+    max_tokens: Optional[int] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "itl-gateway"
+
+    @property
+    def _identifying_params(self):
+        return {"model": self.model, "temperature": self.temperature,
+                "top_p": self.top_p, "max_tokens": self.max_tokens}
+
+    def _request(self, prompt, stop, kwargs):
+        params = {k: v for k, v in self._identifying_params.items() if k != "model" and v is not None}
+        if stop:
+            params["stop"] = stop
+        params.update(kwargs)
+        return [{"role": "user", "content": prompt}], params
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        messages, params = self._request(prompt, stop, kwargs)
+        response = get_gateway(self.env_or_file).chat(messages, model=self.model, **params)
+        return response.choices[0].message.content or ""
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        messages, params = self._request(prompt, stop, kwargs)
+        response = await get_gateway(self.env_or_file).achat(messages, model=self.model, **params)
+        return response.choices[0].message.content or ""
+
+
+class GatewayModelClient:
+    """
+    autogen ModelClient that sends completions through the gateway.
+
+    Use `gateway_config_list` to build the llm_config entries and register the class
+    on every agent that has an llm_config:
+
+        agent.register_model_client(model_client_cls=GatewayModelClient)
+    """
+
+    # Parameters autogen may pass through that the chat completions endpoint understands.
+    PASSTHROUGH = ("temperature", "top_p", "max_tokens", "stop", "seed", "presence_penalty",
+                   "frequency_penalty", "response_format", "tools", "tool_choice")
+
+    def __init__(self, config, **kwargs):
+        self.model = config.get("model")
+        self.env_or_file = config.get("env_or_file")
+
+    def create(self, params):
+        request = {k: v for k, v in params.items() if k in self.PASSTHROUGH and v is not None}
+        model = params.get("model", self.model)
+        return get_gateway(self.env_or_file).chat(params["messages"], model=model, **request)
+
+    def message_retrieval(self, response):
+        return [choice.message if choice.message.tool_calls else choice.message.content
+                for choice in response.choices]
+
+    def cost(self, response):
+        return 0.0
+
+    @staticmethod
+    def get_usage(response):
+        usage = response.usage
+        return {
+            "prompt_tokens": usage.prompt_tokens if usage else 0,
+            "completion_tokens": usage.completion_tokens if usage else 0,
+            "total_tokens": usage.total_tokens if usage else 0,
+            "cost": 0.0,
+            "model": response.model,
+        }
+
+
+def gateway_config_list(env_or_file):
+    """
+    Returns an autogen config list with one GatewayModelClient entry per distinct model
+    in the config list, so autogen defers endpoint selection to the gateway.
+    """
+    models = []
+    for config in load_config_list(env_or_file):
+        if config.get("model") not in models:
+            models.append(config.get("model"))
+    return [{"model": model, "model_client_cls": "GatewayModelClient", "env_or_file": env_or_file}
+            for model in models]
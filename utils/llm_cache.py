@@ -0,0 +1,142 @@
+"""
+Persistent LLM response cache for the crewAI pipelines.
+
+Responses are stored in a SQLite file keyed by a hash of the prompt/messages and
+langchain's llm_string (model name plus sampling params), and namespaced by the
+cache seed so `--cache-seed` / ITL_CACHE_SEED behave like autogen's cache_seed.
+The file is size bounded and evicts the least recently used entries first.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "llm_cache.sqlite")
+DEFAULT_MAX_MB = 256
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def normalize_cache_seed(cache_seed):
+    """Returns the seed as a string, or None when caching is disabled ("False", empty or None)."""
+    if cache_seed is None:
+        return None
+    cache_seed = str(cache_seed).strip()
+    if not cache_seed or cache_seed.lower() == "false":
+        return None
+    return cache_seed
+
+
+def cache_seed_from_env():
+    return normalize_cache_seed(os.environ.get("ITL_CACHE_SEED"))
+
+
+class SQLiteLLMCache(BaseCache):
+    """
+    A langchain cache that keeps responses for one cache seed in a shared SQLite file.
+
+    Args:
+        namespace (str): The cache seed the entries belong to.
+        path (str): The SQLite file. Defaults to ITL_LLM_CACHE_PATH or .cache/llm_cache.sqlite.
+        max_bytes (int): Size bound for all namespaces together. Defaults to ITL_LLM_CACHE_MAX_MB.
+    """
+
+    def __init__(self, namespace, path=None, max_bytes=None):
+        self.namespace = namespace
+        self.path = path or os.environ.get("ITL_LLM_CACHE_PATH", DEFAULT_CACHE_PATH)
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get("ITL_LLM_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        cache_dir = os.path.dirname(self.path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " namespace TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " last_access REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)"
+            )
+
+    @staticmethod
+    def _key(prompt, llm_string):
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt, llm_string):
+        key = self._key(prompt, llm_string)
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value FROM responses WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE responses SET last_access = ? WHERE namespace = ? AND key = ?",
+                (time.time(), self.namespace, key),
+            )
+        return [loads(generation) for generation in json.loads(row[0])]
+
+    def update(self, prompt, llm_string, return_val):
+        key = self._key(prompt, llm_string)
+        value = json.dumps([dumps(generation) for generation in return_val])
+        size = len(value.encode("utf-8"))
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (namespace, key, value, size, last_access)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, value, size, time.time()),
+            )
+            self._evict()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            "SELECT namespace, key, size FROM responses ORDER BY last_access ASC"
+        ).fetchall()
+        stale = []
+        for namespace, key, size in rows:
+            if total <= self.max_bytes:
+                break
+            stale.append((namespace, key))
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE namespace = ? AND key = ?", stale)
+
+    def clear(self, **kwargs):
+        """Removes every entry for this cache seed."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses WHERE namespace = ?", (self.namespace,))
+
+
+def get_llm_cache(cache_seed):
+    """
+    Returns the shared cache for a cache seed, or None when caching is disabled.
+    """
+    namespace = normalize_cache_seed(cache_seed)
+    if namespace is None:
+        return None
+    with _caches_lock:
+        cache = _caches.get(namespace)
+        if cache is None:
+            cache = SQLiteLLMCache(namespace)
+            _caches[namespace] = cache
+        return cache
@@ -1,9 +1,137 @@
+"""
+Process-wide registry of LLM clients.
+
+Scripts call ``create_llm`` where they build their agents instead of creating
+clients at import time. The first call for a given (backend, model, base_url,
+params) builds the client, every later call returns the same instance, so a run
+only pays for the models it actually touches and rebuilding agents does not
+open new connections.
+"""
+import os
+import threading
+
+DEFAULT_OLLAMA_BASE_URL = "http://localhost:11434"
+DEFAULT_OPENAI_BASE_URL = "https://api.openai.com/v1"
+
+_registry = {}
+_registry_lock = threading.RLock()
+_http_client = None
+
+
+def get_http_client():
+    """
+    Returns the shared keep-alive HTTP client used by the OpenAI compatible backends.
+
+    The pool size can be tuned with ITL_HTTP_MAX_CONNECTIONS and ITL_HTTP_MAX_KEEPALIVE.
+    """
+    global _http_client
+    with _registry_lock:
+        if _http_client is None:
+            import httpx
+            limits = httpx.Limits(
+                max_connections=int(os.environ.get("ITL_HTTP_MAX_CONNECTIONS", "20")),
+                max_keepalive_connections=int(os.environ.get("ITL_HTTP_MAX_KEEPALIVE", "10")),
+            )
+            _http_client = httpx.Client(limits=limits, timeout=httpx.Timeout(600.0, connect=10.0))
+        return _http_client
+
+
+def _default_base_url(model_type):
+    if model_type == "gateway":
+        return os.environ.get("ITL_CONFIG_LIST", "local.json")
+    if model_type == "ollama":
+        return os.environ.get("OLLAMA_BASE_URL", DEFAULT_OLLAMA_BASE_URL)
+    return os.environ.get("OPENAI_API_BASE_URL", DEFAULT_OPENAI_BASE_URL)
+
+
+def _registry_key(model, model_type, base_url, params):
+    # repr() keeps the key hashable when a param is a dict or list (e.g. model_kwargs)
+    return (model_type, model, base_url, tuple(sorted((k, repr(v)) for k, v in params.items())))
+
+
+def _http_client_params(llm_class):
+    """
+    The shared client for an OpenAI backend class, when it can be passed safely. The
+    langchain_community classes also hand http_client to their openai.AsyncOpenAI,
+    which only accepts an httpx.AsyncClient, so they keep their own clients. Classes
+    with a separate http_async_client field use http_client for the sync side only.
+    """
+    fields = getattr(llm_class, "model_fields", None) or getattr(llm_class, "__fields__", {})
+    if "http_async_client" in fields:
+        return {"http_client": get_http_client()}
+    return {}
+
+
+def _build_llm(model, model_type, base_url, params):
+    from utils import metrics
+    if model_type != "gateway" and metrics.enabled():
+        # The gateway records its own calls, with queue time and retries.
+        params.setdefault("callbacks", [metrics.metrics_callback_handler()])
 
-def create_llm(model, model_type):
     if model_type == "openai":
         from langchain.llms import OpenAI
-        return OpenAI(model_name=model)
+        return OpenAI(model_name=model, openai_api_base=base_url, **_http_client_params(OpenAI), **params)
+    elif model_type == "chat_openai":
+        from langchain.chat_models.openai import ChatOpenAI
+        params.setdefault("openai_api_key", os.environ.get("OPENAI_API_KEY"))
+        return ChatOpenAI(model_name=model, openai_api_base=base_url, **_http_client_params(ChatOpenAI), **params)
     elif model_type == "ollama":
+        # langchain's Ollama client posts through the requests module directly,
+        # so sharing the instance is as far as reuse goes for this backend.
         from langchain.llms import Ollama
-        return Ollama(model=model)
+        return Ollama(model=model, base_url=base_url, **params)
+    elif model_type == "gateway":
+        from utils.gateway_llm import GatewayLLM
+        return GatewayLLM(model=model, env_or_file=base_url, **params)
     return None
+
+
+def create_llm(model, model_type, base_url=None, cache_seed=None, **params):
+    """
+    Returns the shared LLM client for the given model, creating it on first use.
+
+    Args:
+        model (str): The model name, e.g. "openhermes" or "gpt-3.5-turbo".
+        model_type (str): The backend: "openai", "chat_openai", "ollama" or "gateway".
+        base_url (str, optional): The server URL. Defaults to OLLAMA_BASE_URL or
+            OPENAI_API_BASE_URL depending on the backend. For "gateway" this is the
+            environment variable or JSON file holding the config list (local.json).
+        cache_seed (str, optional): When set (and not "False"), responses are cached
+            on disk under this seed, see utils/llm_cache.py. A cassette in record or
+            replay mode takes precedence, see utils/cassette.py.
+        **params: Extra client settings such as temperature or top_p.
+
+    Returns:
+        The langchain LLM instance, or None for an unknown backend.
+    """
+    from utils.cassette import cassette_llm_cache, get_cassette
+    from utils.llm_cache import get_llm_cache, normalize_cache_seed
+
+    base_url = base_url or _default_base_url(model_type)
+    cache_seed = normalize_cache_seed(cache_seed)
+    key = _registry_key(model, model_type, base_url, dict(params, cache_seed=cache_seed))
+
+    with _registry_lock:
+        llm = _registry.get(key)
+        if llm is None:
+            llm = _build_llm(model, model_type, base_url, dict(params))
+            if llm is not None:
+                if cache_seed is not None:
+                    llm.cache = get_llm_cache(cache_seed)
+                cassette = get_cassette()
+                if cassette is not None and model_type != "gateway":
+                    # Takes the place of the response cache so every call is recorded.
+                    # The gateway records its own calls.
+                    llm.cache = cassette_llm_cache(cassette)
+                _registry[key] = llm
+        return llm
+
+
+def clear_registry():
+    """Drops every registered client and closes the shared HTTP pool."""
+    global _http_client
+    with _registry_lock:
+        _registry.clear()
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
@@ -0,0 +1,439 @@
+"""
+Bounded-concurrency gateway for the OpenAI compatible endpoints listed in local.json.
+
+Every request goes through one asyncio loop running in a background thread. The
+gateway admits at most `max_queue` requests at a time (callers beyond that wait,
+which is the backpressure) and each endpoint serves at most `max_in_flight` of
+them concurrently, so several scripts, threads or crew tools can overlap their
+calls without piling them all onto a single local server.
+
+Requests are routed to the endpoint with the fewest outstanding (waiting plus
+in-flight) requests relative to its cap. An endpoint that times out or refuses
+connections is skipped for ITL_GATEWAY_COOLDOWN seconds and the request is
+retried on the next best endpoint, so throughput grows with the number of hosts.
+
+Both APIs are available:
+
+    gateway = get_gateway("local.json")
+    response = gateway.chat(messages, model="llama3.2")          # sync
+    response = await gateway.achat(messages, model="llama3.2")   # async
+    for text in gateway.chat_stream(messages, model="llama3.2"):  # streamed tokens
+        print(text, end="")
+"""
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+
+from utils import metrics
+from utils.cassette import get_cassette
+
+DEFAULT_CONFIG = "local.json"
+DEFAULT_MAX_IN_FLIGHT = 2
+DEFAULT_MAX_QUEUE = 64
+DEFAULT_TIMEOUT = 600.0
+DEFAULT_COOLDOWN = 30.0
+
+_STREAM_END = object()
+
+_gateways = {}
+_gateways_lock = threading.Lock()
+
+
+class StreamInterrupted(RuntimeError):
+    """A streamed response failed after some tokens were already delivered, so it is not retried."""
+
+
+class NoEndpointForModel(ValueError):
+    """No endpoint of the config list serves the requested model."""
+
+
+def load_config_list(env_or_file=None):
+    """
+    Loads a config list the same way autogen.config_list_from_json does: from the
+    environment variable named `env_or_file` if it is set, otherwise from the file.
+    Defaults to ITL_CONFIG_LIST or local.json.
+    """
+    env_or_file = env_or_file or os.environ.get("ITL_CONFIG_LIST", DEFAULT_CONFIG)
+    value = os.environ.get(env_or_file)
+    if value:
+        return json.loads(value)
+    with open(env_or_file, "r") as file:
+        return json.load(file)
+
+
+class Endpoint:
+    """One entry of the config list plus its concurrency bookkeeping."""
+
+    def __init__(self, config, max_in_flight):
+        self.config = config
+        self.base_url = config.get("base_url")
+        self.model = config.get("model")
+        self.max_in_flight = int(config.get("max_in_flight", max_in_flight))
+        self.in_flight = 0
+        self.waiting = 0
+        self.failures = 0
+        self.down_until = 0.0
+        self.last_used = 0.0
+        self.semaphore = None
+        self.client = None
+
+    def serves(self, model):
+        return model is None or self.model in (None, "local", model)
+
+    def load(self):
+        return (self.waiting + self.in_flight) / self.max_in_flight
+
+    def is_up(self, now):
+        return now >= self.down_until
+
+
+class LLMGateway:
+    """
+    Routes chat and embedding requests to a list of endpoints with bounded concurrency.
+
+    Args:
+        config_list (list): Endpoint configs with `base_url`, `api_key`, `model` and
+            an optional `max_in_flight`.
+        max_in_flight (int): Default per endpoint cap. Defaults to ITL_GATEWAY_MAX_IN_FLIGHT.
+        max_queue (int): Requests admitted at once across all endpoints. Defaults to
+            ITL_GATEWAY_MAX_QUEUE.
+        timeout (float): Per request timeout in seconds. Defaults to ITL_GATEWAY_TIMEOUT.
+        cooldown (float): Seconds a failed endpoint is skipped. Defaults to ITL_GATEWAY_COOLDOWN.
+    """
+
+    def __init__(self, config_list, max_in_flight=None, max_queue=None, timeout=None, cooldown=None):
+        if not config_list:
+            raise ValueError("The gateway needs at least one endpoint in its config list.")
+        max_in_flight = max_in_flight or int(os.environ.get("ITL_GATEWAY_MAX_IN_FLIGHT", DEFAULT_MAX_IN_FLIGHT))
+        self.endpoints = [Endpoint(config, max_in_flight) for config in config_list]
+        self.max_queue = max_queue or int(os.environ.get("ITL_GATEWAY_MAX_QUEUE", DEFAULT_MAX_QUEUE))
+        self.timeout = timeout or float(os.environ.get("ITL_GATEWAY_TIMEOUT", DEFAULT_TIMEOUT))
+        if cooldown is None:
+            cooldown = float(os.environ.get("ITL_GATEWAY_COOLDOWN", DEFAULT_COOLDOWN))
+        self.cooldown = cooldown
+        self.queued = 0
+        self._admission = None
+        self._loop = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    # -- event loop ---------------------------------------------------------
+
+    def _ensure_loop(self):
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=run, name="llm-gateway", daemon=True)
+                self._thread.start()
+                ready.wait()
+                self._loop = loop
+        return self._loop
+
+    def _submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    async def _run_on_loop(self, coro):
+        loop = self._ensure_loop()
+        try:
+            if asyncio.get_running_loop() is loop:
+                return await coro
+        except RuntimeError:
+            pass
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+    # -- request plumbing ---------------------------------------------------
+
+    def _client_for(self, endpoint):
+        if endpoint.client is None:
+            import openai
+            endpoint.client = openai.AsyncOpenAI(
+                api_key=endpoint.config.get("api_key") or "none",
+                base_url=endpoint.base_url,
+                timeout=self.timeout,
+                max_retries=0,
+            )
+            endpoint.semaphore = asyncio.Semaphore(endpoint.max_in_flight)
+        return endpoint.client
+
+    def _candidates(self, model):
+        """The endpoints that serve the model."""
+        return [endpoint for endpoint in self.endpoints if endpoint.serves(model)]
+
+    def _select_endpoint(self, model, tried):
+        """
+        Picks the least loaded endpoint that serves the model, preferring ones that are up.
+        Returns None once every such endpoint has been tried.
+        """
+        candidates = [endpoint for endpoint in self._candidates(model) if endpoint not in tried]
+        if not candidates:
+            return None
+        now = time.monotonic()
+        healthy = [endpoint for endpoint in candidates if endpoint.is_up(now)] or candidates
+        return min(healthy, key=lambda endpoint: (endpoint.load(), endpoint.last_used))
+
+    @staticmethod
+    def _should_fail_over(error):
+        import openai
+        return isinstance(error, (asyncio.TimeoutError, openai.APIConnectionError,
+                                  openai.InternalServerError))
+
+    async def _attempt(self, endpoint, model, call, fields):
+        client = self._client_for(endpoint)
+        endpoint.waiting += 1
+        waiting = True
+        wait_start = time.perf_counter()
+        try:
+            async with endpoint.semaphore:
+                endpoint.waiting -= 1
+                waiting = False
+                fields["queue_time"] += time.perf_counter() - wait_start
+                endpoint.in_flight += 1
+                endpoint.last_used = time.monotonic()
+                try:
+                    return await call(client, model or endpoint.model, fields)
+                finally:
+                    endpoint.in_flight -= 1
+        finally:
+            if waiting:
+                endpoint.waiting -= 1
+
+    async def _dispatch(self, model, call, kind, role):
+        if not self._candidates(model):
+            raise NoEndpointForModel(
+                f"No endpoint in the config list serves '{model}'. Add it to an entry's model, or use "
+                f"\"local\" or no model for an endpoint that serves any model.")
+        if self._admission is None:
+            self._admission = asyncio.Semaphore(self.max_queue)
+        start = time.perf_counter()
+        fields = {"queue_time": 0.0, "prompt_tokens": 0, "completion_tokens": 0, "retries": 0}
+        tried = []
+        error = None
+
+        self.queued += 1
+        try:
+            await self._admission.acquire()
+        finally:
+            self.queued -= 1
+        fields["queue_time"] += time.perf_counter() - start
+
+        try:
+            while True:
+                endpoint = self._select_endpoint(model, tried)
+                tried.append(endpoint)
+                try:
+                    result = await self._attempt(endpoint, model, call, fields)
+                except Exception as exc:
+                    fail_over = self._should_fail_over(exc)
+                    if fail_over:
+                        endpoint.failures += 1
+                        endpoint.down_until = time.monotonic() + self.cooldown
+                    # Only endpoints that serve the model are tried, a host without it would
+                    # answer with a 404 or with another model
+                    if not fail_over or self._select_endpoint(model, tried) is None:
+                        error = type(exc).__name__
+                        raise
+                    fields["retries"] += 1
+                    continue
+                endpoint.failures = 0
+                endpoint.down_until = 0.0
+                usage = getattr(result, "usage", None)
+                if usage is not None:
+                    fields["prompt_tokens"] = usage.prompt_tokens or 0
+                    fields["completion_tokens"] = getattr(usage, "completion_tokens", 0) or 0
+                return result
+        except BaseException as exc:
+            error = error or type(exc).__name__
+            raise
+        finally:
+            self._admission.release()
+            name = model or (tried[-1].model if tried else None)
+            metrics.record(kind, name, time.perf_counter() - start, role=role, error=error, **fields)
+
+    async def _chat(self, messages, model, params, role):
+        async def call(client, model_name, fields):
+            return await client.chat.completions.create(model=model_name, messages=messages, **params)
+        cassette = get_cassette()
+        if cassette is None:
+            return await self._dispatch(model, call, "llm", role)
+        from openai.types.chat import ChatCompletion
+        return await cassette.acall("chat", {"messages": messages, "model": model, "params": params},
+                                    lambda: self._dispatch(model, call, "llm", role),
+                                    encode=lambda result: result.model_dump(), decode=ChatCompletion.model_validate)
+
+    async def _embed(self, input, model, params, role):
+        async def call(client, model_name, fields):
+            return await client.embeddings.create(model=model_name, input=input, **params)
+        cassette = get_cassette()
+        if cassette is None:
+            return await self._dispatch(model, call, "embedding", role)
+        from openai.types import CreateEmbeddingResponse
+        return await cassette.acall("embedding", {"input": input, "model": model, "params": params},
+                                    lambda: self._dispatch(model, call, "embedding", role),
+                                    encode=lambda result: result.model_dump(),
+                                    decode=CreateEmbeddingResponse.model_validate)
+
+    async def _stream(self, messages, model, params, emit, role):
+        cassette = get_cassette()
+        request = {"messages": messages, "model": model, "params": params}
+        if cassette is not None and cassette.mode == "replay":
+            chunks, latency = cassette.lookup("chat_stream", request)
+            delay = cassette.replay_delay(latency) / max(len(chunks), 1)
+            for text in chunks:
+                await asyncio.sleep(delay)
+                emit(text)
+            return
+
+        recorded = []
+
+        async def call(client, model_name, fields):
+            stream = await client.chat.completions.create(
+                model=model_name, messages=messages, stream=True, **params)
+            emitted = False
+            try:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        emitted = True
+                        # Servers send roughly one token per delta; close enough for the metrics.
+                        fields["completion_tokens"] += 1
+                        recorded.append(chunk.choices[0].delta.content)
+                        emit(chunk.choices[0].delta.content)
+            except Exception as error:
+                if emitted:
+                    raise StreamInterrupted(str(error)) from error
+                raise
+            finally:
+                await stream.close()
+
+        start = time.perf_counter()
+        try:
+            await self._dispatch(model, call, "llm", role)
+        except asyncio.CancelledError:
+            # The reader closed the stream early (cc.py stops at the first directive). What it
+            # received so far is all a replay of the same run reads.
+            if cassette is not None and recorded:
+                cassette.record("chat_stream", request, recorded, time.perf_counter() - start)
+            raise
+        if cassette is not None:
+            cassette.record("chat_stream", request, recorded, time.perf_counter() - start)
+
+    # -- public API ---------------------------------------------------------
+
+    async def achat(self, messages, model=None, **params):
+        """Sends a chat completion request and returns the openai ChatCompletion."""
+        return await self._run_on_loop(self._chat(messages, model, params, metrics.current_role()))
+
+    def chat(self, messages, model=None, **params):
+        """Blocking version of achat."""
+        return self._submit(self._chat(messages, model, params, metrics.current_role())).result()
+
+    async def aembed(self, input, model=None, **params):
+        """Sends an embeddings request and returns the openai CreateEmbeddingResponse."""
+        return await self._run_on_loop(self._embed(input, model, params, metrics.current_role()))
+
+    def embed(self, input, model=None, **params):
+        """Blocking version of aembed."""
+        return self._submit(self._embed(input, model, params, metrics.current_role())).result()
+
+    def chat_stream(self, messages, model=None, **params):
+        """
+        Streams a chat completion, yielding the text deltas as they arrive.
+
+        Closing the generator early cancels the request and frees its endpoint slot.
+        """
+        chunks = queue.Queue()
+        future = self._submit(self._stream(messages, model, params, chunks.put, metrics.current_role()))
+        future.add_done_callback(lambda _: chunks.put(_STREAM_END))
+        try:
+            while True:
+                text = chunks.get()
+                if text is _STREAM_END:
+                    break
+                yield text
+            future.result()
+        finally:
+            if not future.done():
+                future.cancel()
+
+    async def achat_stream(self, messages, model=None, **params):
+        """Async version of chat_stream."""
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+
+        def emit(text):
+            loop.call_soon_threadsafe(chunks.put_nowait, text)
+
+        future = self._submit(self._stream(messages, model, params, emit, metrics.current_role()))
+        future.add_done_callback(lambda _: emit(_STREAM_END))
+        try:
+            while True:
+                text = await chunks.get()
+                if text is _STREAM_END:
+                    break
+                yield text
+            future.result()
+        finally:
+            if not future.done():
+                future.cancel()
+
+    def stats(self):
+        """Returns the admission queue depth and the live load of every endpoint."""
+        now = time.monotonic()
+        return {
+            "queued": self.queued,
+            "endpoints": [
+                {"base_url": e.base_url, "model": e.model, "waiting": e.waiting,
+                 "in_flight": e.in_flight, "max_in_flight": e.max_in_flight,
+                 "failures": e.failures, "up": e.is_up(now)}
+                for e in self.endpoints
+            ],
+        }
+
+    def close(self):
+        if self._loop is None:
+            return
+
+        async def shutdown():
+            for endpoint in self.endpoints:
+                if endpoint.client is not None:
+                    await endpoint.client.close()
+                    endpoint.client = None
+
+        self._submit(shutdown()).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+        self._admission = None
+
+
+def get_gateway(env_or_file=None, config_list=None):
+    """
+    Returns the process-wide gateway for a config list, creating it on first use.
+
+    Args:
+        env_or_file (str, optional): Environment variable or JSON file holding the
+            config list. Defaults to ITL_CONFIG_LIST or local.json.
+        config_list (list, optional): An explicit config list, used instead of env_or_file.
+    """
+    if config_list is None:
+        env_or_file = env_or_file or os.environ.get("ITL_CONFIG_LIST", DEFAULT_CONFIG)
+        key = env_or_file
+    else:
+        key = json.dumps(config_list, sort_keys=True)
+
+    with _gateways_lock:
+        gateway = _gateways.get(key)
+        if gateway is None:
+            gateway = LLMGateway(config_list if config_list is not None else load_config_list(env_or_file))
+            _gateways[key] = gateway
+        return gateway
@@ -0,0 +1,337 @@
+"""
+Latency and token metrics for LLM calls, tool calls and tasks.
+
+Every record is appended as one JSON line to .cache/metrics/metrics.jsonl and the
+current run's aggregates are written in Prometheus text format to
+.cache/metrics/metrics.prom when the process exits. `itl stats` summarizes the
+JSONL file per agent role. Set ITL_METRICS=false to turn recording off and
+ITL_METRICS_DIR to write somewhere else.
+
+A record has the fields: ts, kind ("llm", "embedding", "tool", "task" or "crew"),
+name, role, wall_time, queue_time, prompt_tokens, completion_tokens, retries and
+error. A "crew" record times a whole crew run, which its "task" records already cover.
+
+The role comes from a context variable: `role_scope("Researcher")` sets it for a
+block, `instrumented_kickoff(crew)` sets it to the agent of the running task, and
+`track_autogen_roles(agents)` sets it to the autogen agent that is replying.
+"""
+import atexit
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+
+DEFAULT_METRICS_DIR = os.path.join(".cache", "metrics")
+QUANTILES = (0.5, 0.95)
+
+_current_role = contextvars.ContextVar("itl_metrics_role", default=None)
+_lock = threading.Lock()
+_records = []
+_atexit_registered = False
+
+
+def enabled():
+    return os.environ.get("ITL_METRICS", "true").lower() not in ("0", "false", "no")
+
+
+def metrics_dir():
+    return os.environ.get("ITL_METRICS_DIR", DEFAULT_METRICS_DIR)
+
+
+def jsonl_path():
+    return os.path.join(metrics_dir(), "metrics.jsonl")
+
+
+def prometheus_path():
+    return os.path.join(metrics_dir(), "metrics.prom")
+
+
+def current_role():
+    return _current_role.get()
+
+
+@contextlib.contextmanager
+def role_scope(role):
+    token = _current_role.set(role)
+    try:
+        yield
+    finally:
+        _current_role.reset(token)
+
+
+def record(kind, name, wall_time, role=None, queue_time=0.0, prompt_tokens=0,
+           completion_tokens=0, retries=0, error=None):
+    """Appends one measurement to the JSONL file and the run's aggregates."""
+    global _atexit_registered
+    if not enabled():
+        return
+    entry = {
+        "ts": time.time(),
+        "kind": kind,
+        "name": name,
+        "role": role if role is not None else current_role(),
+        "wall_time": round(wall_time, 6),
+        "queue_time": round(queue_time, 6),
+        "prompt_tokens": int(prompt_tokens or 0),
+        "completion_tokens": int(completion_tokens or 0),
+        "retries": int(retries or 0),
+        "error": error,
+    }
+    with _lock:
+        path = jsonl_path()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(path, "a") as file:
+            file.write(json.dumps(entry) + "\n")
+        _records.append(entry)
+        if not _atexit_registered:
+            atexit.register(write_prometheus)
+            _atexit_registered = True
+
+
+@contextlib.contextmanager
+def timer(kind, name, role=None):
+    """
+    Times a block and records it. The yielded dict can be filled with
+    prompt_tokens, completion_tokens, queue_time or retries before the block ends.
+    """
+    fields = {}
+    start = time.perf_counter()
+    error = None
+    try:
+        yield fields
+    except BaseException as exc:
+        error = type(exc).__name__
+        raise
+    finally:
+        record(kind, name, time.perf_counter() - start, role=role, error=error, **fields)
+
+
+def timed(kind, name):
+    """Decorator version of timer, e.g. for tool functions."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(kind, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrumented_kickoff(crew):
+    """
+    Runs crew.kickoff() for a sequential crew and records one "task" entry per task
+    plus one "crew" entry for the whole run.
+    While a task runs, its agent's role is the current role, so the LLM and tool
+    calls it makes (including delegated ones) are attributed to that role.
+    """
+    tasks = list(crew.tasks)
+    original_callbacks = [task.callback for task in tasks]
+    previous_role = current_role()
+    state = {"start": time.perf_counter()}
+
+    def start_task(index):
+        state["start"] = time.perf_counter()
+        if index < len(tasks):
+            _current_role.set(_agent_role(tasks[index]))
+
+    def finish_task(index, callback):
+        def on_done(output):
+            task = tasks[index]
+            record("task", _task_name(task), time.perf_counter() - state["start"], role=_agent_role(task))
+            start_task(index + 1)
+            if callback is not None:
+                return callback(output)
+        return on_done
+
+    for index, task in enumerate(tasks):
+        task.callback = finish_task(index, original_callbacks[index])
+
+    start_task(0)
+    try:
+        with timer("crew", "crew.kickoff", role=previous_role or "crew"):
+            return crew.kickoff()
+    finally:
+        _current_role.set(previous_role)
+        for task, callback in zip(tasks, original_callbacks):
+            task.callback = callback
+
+
+def instrumented_execute(task, context=None):
+    """Runs task.execute() with its agent's role and records it as a "task" entry."""
+    role = _agent_role(task)
+    with role_scope(role), timer("task", _task_name(task), role=role):
+        return task.execute(context=context) if context else task.execute()
+
+
+def _agent_role(task):
+    return task.agent.role if task.agent is not None else None
+
+
+def _task_name(task):
+    description = " ".join(str(task.description).split())
+    return description[:60]
+
+
+def track_autogen_roles(agents):
+    """Makes every LLM call of an autogen agent count towards its name as the role."""
+    for agent in agents:
+        def before_reply(messages, name=agent.name):
+            _current_role.set(name)
+            return messages
+        agent.register_hook("process_all_messages_before_reply", before_reply)
+
+
+def metrics_callback_handler():
+    """
+    Returns a langchain callback handler that records every LLM call of the client
+    it is attached to. create_llm attaches one to each client it builds.
+    """
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class MetricsCallbackHandler(BaseCallbackHandler):
+        def __init__(self):
+            self._started = {}
+
+        def on_llm_start(self, serialized, prompts, run_id=None, **kwargs):
+            self._started[run_id] = (time.perf_counter(), current_role(), _model_name(serialized, kwargs))
+
+        on_chat_model_start = on_llm_start
+
+        def on_llm_end(self, response, run_id=None, **kwargs):
+            start, role, model = self._started.pop(run_id, (time.perf_counter(), None, None))
+            prompt_tokens, completion_tokens = _token_usage(response)
+            record("llm", model, time.perf_counter() - start, role=role,
+                   prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+        def on_llm_error(self, error, run_id=None, **kwargs):
+            start, role, model = self._started.pop(run_id, (time.perf_counter(), None, None))
+            record("llm", model, time.perf_counter() - start, role=role, error=type(error).__name__)
+
+    return MetricsCallbackHandler()
+
+
+def _model_name(serialized, kwargs):
+    params = kwargs.get("invocation_params") or {}
+    serialized = serialized or {}
+    return (params.get("model") or params.get("model_name")
+            or serialized.get("kwargs", {}).get("model") or serialized.get("name"))
+
+
+def _token_usage(response):
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    # Ollama reports its counts per generation
+    prompt_tokens = completion_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            info = generation.generation_info or {}
+            prompt_tokens += info.get("prompt_eval_count") or 0
+            completion_tokens += info.get("eval_count") or 0
+    return prompt_tokens, completion_tokens
+
+
+def load_records(path=None):
+    path = path or jsonl_path()
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(int(round(q * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+def summarize(records):
+    """Groups records by (role, kind) and returns rows with counts, p50/p95 and token totals."""
+    groups = {}
+    for entry in records:
+        groups.setdefault((entry.get("role") or "-", entry["kind"]), []).append(entry)
+    rows = []
+    for (role, kind), entries in sorted(groups.items()):
+        wall_times = [entry["wall_time"] for entry in entries]
+        rows.append({
+            "role": role,
+            "kind": kind,
+            "count": len(entries),
+            "p50": percentile(wall_times, 0.5),
+            "p95": percentile(wall_times, 0.95),
+            "queue_time": sum(entry.get("queue_time", 0.0) for entry in entries),
+            "prompt_tokens": sum(entry.get("prompt_tokens", 0) for entry in entries),
+            "completion_tokens": sum(entry.get("completion_tokens", 0) for entry in entries),
+            "retries": sum(entry.get("retries", 0) for entry in entries),
+            "errors": sum(1 for entry in entries if entry.get("error")),
+        })
+    return rows
+
+
+def format_summary(rows):
+    header = f"{'role':<28} {'kind':<9} {'count':>6} {'p50 s':>8} {'p95 s':>8} {'prompt tok':>11} {'compl tok':>10} {'retries':>8}"
+    lines = [header, "-" * len(header)]
+    for row in rows:
+        lines.append(f"{row['role'][:28]:<28} {row['kind']:<9} {row['count']:>6} {row['p50']:>8.2f} "
+                     f"{row['p95']:>8.2f} {row['prompt_tokens']:>11} {row['completion_tokens']:>10} {row['retries']:>8}")
+    return "\n".join(lines)
+
+
+def _label(value):
+    return str(value if value is not None else "").replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def prometheus_text(records):
+    """Renders records as Prometheus text exposition format."""
+    series = {}
+    for entry in records:
+        labels = (entry["kind"], entry.get("name"), entry.get("role"))
+        series.setdefault(labels, []).append(entry)
+
+    lines = [
+        "# HELP itl_duration_seconds Wall time of LLM, embedding and tool calls, tasks and crew runs.",
+        "# TYPE itl_duration_seconds summary",
+    ]
+    for (kind, name, role), entries in sorted(series.items(), key=lambda item: tuple(map(str, item[0]))):
+        labels = f'kind="{_label(kind)}",name="{_label(name)}",role="{_label(role)}"'
+        wall_times = [entry["wall_time"] for entry in entries]
+        for q in QUANTILES:
+            lines.append(f'itl_duration_seconds{{{labels},quantile="{q}"}} {percentile(wall_times, q)}')
+        lines.append(f"itl_duration_seconds_sum{{{labels}}} {sum(wall_times)}")
+        lines.append(f"itl_duration_seconds_count{{{labels}}} {len(wall_times)}")
+
+    for metric, field, help_text in (
+        ("itl_queue_seconds_total", "queue_time", "Time spent waiting for a gateway slot."),
+        ("itl_prompt_tokens_total", "prompt_tokens", "Prompt tokens sent."),
+        ("itl_completion_tokens_total", "completion_tokens", "Completion tokens received."),
+        ("itl_retries_total", "retries", "Requests retried on another endpoint."),
+    ):
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} counter")
+        for (kind, name, role), entries in sorted(series.items(), key=lambda item: tuple(map(str, item[0]))):
+            labels = f'kind="{_label(kind)}",name="{_label(name)}",role="{_label(role)}"'
+            lines.append(f"{metric}{{{labels}}} {sum(entry.get(field, 0) for entry in entries)}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path=None, records=None):
+    """Writes the run's aggregates (or the given records) to the Prometheus text file."""
+    with _lock:
+        records = list(_records if records is None else records)
+    if not records:
+        return
+    path = path or prometheus_path()
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as file:
+        file.write(prometheus_text(records))
+    os.replace(temp_path, path)
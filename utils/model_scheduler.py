@@ -0,0 +1,215 @@
+"""
+Model-swap-aware task scheduling for crews that run on a single Ollama host.
+
+When consecutive tasks use different models, Ollama has to evict one multi-GB
+model and load the next before it can generate. ``ModelScheduler`` runs crewAI
+tasks in an order that keeps tasks on the same model together, as far as their
+dependencies allow.
+
+After a task the scheduler asks Ollama to keep its model loaded for keep_alive
+when a later task uses it again, so it is not unloaded after the default 5
+minutes while other tasks run. The agents' LLMs are not changed for that, they
+are shared and their settings are part of the LLM cache keys.
+
+On a host that fits two models at once (ITL_OLLAMA_MAX_LOADED_MODELS, or
+Ollama's own OLLAMA_MAX_LOADED_MODELS, is 2 or more) the scheduler also preloads
+the next task's model while the current task generates, unless /api/ps shows it
+is loaded already. With room for one model it does not: Ollama would evict the
+current model between two of its requests, for instance during a tool call, and
+load it again for the next one.
+
+Usage:
+    scheduler = ModelScheduler(agents=[researcher, writer])
+    research = scheduler.add(research_task)
+    filename = scheduler.add(filename_task)
+    outline = scheduler.add(outline_task, depends_on=[research])
+    outputs = scheduler.run()
+    outputs[outline]
+"""
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_KEEP_ALIVE = "30m"
+DEFAULT_MAX_LOADED_MODELS = 1
+
+logger = logging.getLogger(__name__)
+
+
+def keep_alive_from_env():
+    return os.environ.get("ITL_OLLAMA_KEEP_ALIVE", DEFAULT_KEEP_ALIVE)
+
+
+def max_loaded_models_from_env():
+    return int(os.environ.get("ITL_OLLAMA_MAX_LOADED_MODELS")
+               or os.environ.get("OLLAMA_MAX_LOADED_MODELS") or DEFAULT_MAX_LOADED_MODELS)
+
+
+def _ollama_url(base_url):
+    from utils.llm_factory import _default_base_url
+    return (base_url or _default_base_url("ollama")).rstrip("/")
+
+
+def loaded_models(base_url=None):
+    """Returns the names of the models Ollama has loaded (/api/ps)."""
+    from utils.llm_factory import get_http_client
+    response = get_http_client().get(f"{_ollama_url(base_url)}/api/ps")
+    response.raise_for_status()
+    names = [entry.get("name") or entry.get("model") for entry in response.json().get("models", [])]
+    # A model asked for without a tag is loaded as <model>:latest
+    return names + [name[:-len(":latest")] for name in names if name and name.endswith(":latest")]
+
+
+def preload_model(model, base_url=None, keep_alive=None):
+    """
+    Asks Ollama to load a model and keep it loaded for keep_alive. Blocks until the
+    model is loaded and returns the seconds it took.
+    """
+    from utils.llm_factory import get_http_client
+    start = time.perf_counter()
+    # A generate request without a prompt only loads the model, or sets keep_alive of a loaded one
+    response = get_http_client().post(f"{_ollama_url(base_url)}/api/generate",
+                                      json={"model": model, "keep_alive": keep_alive or keep_alive_from_env()})
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+def unload_model(model, base_url=None):
+    """Asks Ollama to unload a model right away."""
+    preload_model(model, base_url=base_url, keep_alive=0)
+
+
+def model_for(agent):
+    """Returns the (model, base_url) an agent's LLM runs on, or (None, None) when unknown."""
+    llm = getattr(agent, "llm", None)
+    model = getattr(llm, "model", None) or getattr(llm, "model_name", None)
+    return model, getattr(llm, "base_url", None)
+
+
+class ModelScheduler:
+    """
+    Runs crewAI tasks grouped by the model of their agent.
+
+    Args:
+        agents (list, optional): The agents that tasks may delegate to, like the agents of a Crew.
+        keep_alive (str, optional): How long Ollama keeps a model loaded after its last request.
+            Defaults to ITL_OLLAMA_KEEP_ALIVE or 30m.
+        preload (bool, optional): Whether to warm the next model while a task runs.
+            Defaults to ITL_OLLAMA_PRELOAD or true.
+        max_loaded_models (int, optional): How many models the Ollama host keeps loaded at once.
+            The next model is only preloaded when there is room for two. Defaults to
+            ITL_OLLAMA_MAX_LOADED_MODELS, OLLAMA_MAX_LOADED_MODELS or 1.
+    """
+
+    def __init__(self, agents=None, keep_alive=None, preload=None, max_loaded_models=None):
+        self.agents = list(agents or [])
+        self.keep_alive = keep_alive or keep_alive_from_env()
+        if preload is None:
+            preload = os.environ.get("ITL_OLLAMA_PRELOAD", "true").lower() not in ("0", "false", "no")
+        self.preload = preload
+        self.max_loaded_models = max_loaded_models or max_loaded_models_from_env()
+        self.tasks = []
+        self.outputs = {}
+        self.current_model = None
+        self._delegation_added = set()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ollama-preload")
+
+    def add(self, task, depends_on=()):
+        """
+        Adds a task. Its context is the output of the tasks it depends on, which run first.
+
+        Returns:
+            int: A handle for the task's output in the dict returned by run.
+        """
+        handle = len(self.tasks)
+        self.tasks.append((task, tuple(depends_on)))
+        return handle
+
+    def plan(self):
+        """
+        Returns the handles of the pending tasks in the order they will run. Among
+        the tasks whose dependencies are done, tasks on the model that is loaded go
+        first, otherwise the earliest added task goes next.
+        """
+        done = set(self.outputs)
+        pending = [handle for handle in range(len(self.tasks)) if handle not in done]
+        current = self.current_model
+        order = []
+        while pending:
+            ready = [handle for handle in pending if set(self.tasks[handle][1]) <= done]
+            if not ready:
+                raise ValueError("The scheduled tasks have a dependency cycle.")
+            same_model = [handle for handle in ready if self._model(handle)[0] == current]
+            handle = (same_model or ready)[0]
+            order.append(handle)
+            done.add(handle)
+            pending.remove(handle)
+            current = self._model(handle)[0]
+        return order
+
+    def run(self):
+        """
+        Runs all pending tasks.
+
+        Returns:
+            dict: The output of every task run so far, by handle.
+        """
+        from utils import metrics
+
+        order = self.plan()
+        for index, handle in enumerate(order):
+            task, depends_on = self.tasks[handle]
+            model, base_url = self._model(handle)
+            if index + 1 < len(order):
+                self._warm(order[index + 1], model)
+
+            self._add_delegation_tools(task)
+            context = "\n\n".join(str(self.outputs[dependency]) for dependency in depends_on) or None
+            self.outputs[handle] = metrics.instrumented_execute(task, context=context)
+            self.current_model = model
+            later = [self._model(next_handle)[0] for next_handle in order[index + 1:]]
+            if later and later[0] != model and model in later[1:]:
+                self._keep_loaded(model, base_url)
+        return self.outputs
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def _model(self, handle):
+        return model_for(self.tasks[handle][0].agent)
+
+    def _keep_loaded(self, model, base_url):
+        # Ollama unloads a model 5 minutes after its last request, which is shorter than some
+        # of the tasks that run until it is used again. This runs before the next task starts,
+        # a request for this model while the next one loads could load it back on a small host.
+        if model is None:
+            return
+        try:
+            preload_model(model, base_url=base_url, keep_alive=self.keep_alive)
+        except Exception as error:
+            logger.warning("Could not keep %s loaded: %s", model, error)
+
+    def _warm(self, next_handle, model):
+        next_model, base_url = self._model(next_handle)
+        if not self.preload or self.max_loaded_models < 2 or next_model is None or next_model == model:
+            return
+        def preload():
+            try:
+                if next_model in loaded_models(base_url):
+                    return
+                seconds = preload_model(next_model, base_url=base_url, keep_alive=self.keep_alive)
+                logger.debug("Preloaded %s in %.1fs", next_model, seconds)
+            except Exception as error:
+                logger.warning("Could not preload %s: %s", next_model, error)
+        self._executor.submit(preload)
+
+    def _add_delegation_tools(self, task):
+        # Crew adds these in its sequential loop, tasks run on their own need them too
+        if not task.agent.allow_delegation or id(task) in self._delegation_added:
+            return
+        from crewai.tools.agent_tools import AgentTools
+        agents_for_delegation = [agent for agent in self.agents if agent != task.agent]
+        if agents_for_delegation:
+            task.tools = list(task.tools or []) + AgentTools(agents=agents_for_delegation).tools()
+        self._delegation_added.add(id(task))
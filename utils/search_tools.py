@@ -0,0 +1,31 @@
+"""
+Web search tool shared by the crews.
+"""
+from utils import metrics
+from utils.cassette import get_cassette
+
+
+def create_search_tool(name=None, description=None):
+    """
+    Returns a DuckDuckGo search tool whose calls are recorded as "search" tool metrics
+    and take part in the cassette when ITL_CASSETTE_MODE is set.
+
+    Args:
+        name (str, optional): The tool name shown to the agent. Defaults to DuckDuckGoSearchRun's.
+        description (str, optional): The tool description. Defaults to DuckDuckGoSearchRun's.
+    """
+    from langchain.tools import DuckDuckGoSearchRun, Tool
+
+    search = DuckDuckGoSearchRun()
+
+    def run(query):
+        cassette = get_cassette()
+        if cassette is None:
+            return search.run(query)
+        return cassette.call("search", {"query": query}, lambda: search.run(query))
+
+    return Tool(
+        name=name or search.name,
+        description=description or search.description,
+        func=metrics.timed("tool", "search")(run),
+    )
@@ -0,0 +1,150 @@
+"""
+Token counting matched to the model that receives the prompt.
+
+`count_tokens(text)` is a fast estimate from the text length, good enough for
+budget checks and deliberately a little high for English and code.
+`count_tokens(text, model, exact=True)` uses the model's own tokenizer, which is
+loaded on first use and cached: tiktoken for OpenAI models, the Hugging Face
+tokenizer of the model family for local models (llama3, mistral, deepseek-coder,
+...). ITL_TOKENIZER overrides the choice with a Hugging Face repo id or
+"tiktoken:<encoding>". When no tokenizer can be loaded the estimate is used.
+truncate_tokens and fit_to_budget take the same `exact` flag and otherwise cut
+by the characters-per-token ratio, so no tokenizer is loaded unless asked for.
+"""
+import logging
+import math
+import os
+import threading
+
+# Code and English average a bit over 3.5 characters per token for the models we use
+CHARS_PER_TOKEN = float(os.environ.get("ITL_CHARS_PER_TOKEN", "3.5"))
+
+# Model name prefix -> Hugging Face repo with the same tokenizer. Ollama tags
+# ("llama3.2:3b-instruct-q8_0") are matched on the part before the tag.
+HF_TOKENIZERS = (
+    ("llama3", "NousResearch/Meta-Llama-3-8B-Instruct"),
+    ("llama2", "NousResearch/Llama-2-7b-hf"),
+    ("codellama", "codellama/CodeLlama-7b-hf"),
+    ("mixtral", "mistralai/Mixtral-8x7B-v0.1"),
+    ("dolphin-mixtral", "mistralai/Mixtral-8x7B-v0.1"),
+    ("mistral", "mistralai/Mistral-7B-v0.1"),
+    ("openhermes", "teknium/OpenHermes-2.5-Mistral-7B"),
+    ("starling-lm", "berkeley-nest/Starling-LM-7B-alpha"),
+    ("deepseek-coder", "deepseek-ai/deepseek-coder-6.7b-instruct"),
+    ("magicoder", "ise-uiuc/Magicoder-S-DS-6.7B"),
+    ("qwen2.5", "Qwen/Qwen2.5-7B-Instruct"),
+    ("phi3", "microsoft/Phi-3-mini-4k-instruct"),
+    ("gemma2", "google/gemma-2-9b-it"),
+)
+OPENAI_PREFIXES = ("gpt-", "text-embedding-", "o1", "o3")
+
+logger = logging.getLogger(__name__)
+
+_tokenizers = {}
+_tokenizers_lock = threading.Lock()
+
+
+def approximate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+class Tokenizer:
+    """A loaded tokenizer with a uniform encode/decode/count interface."""
+
+    def __init__(self, name, encode, decode):
+        self.name = name
+        self.encode = encode
+        self.decode = decode
+
+    def count(self, text):
+        return len(self.encode(text))
+
+
+def tokenizer_source(model):
+    """Returns the tokenizer to load for a model: "tiktoken:<encoding or model>" or a Hugging Face repo id."""
+    override = os.environ.get("ITL_TOKENIZER")
+    if override:
+        return override
+    name = (model or "").lower().split("/")[-1]
+    if name.startswith(OPENAI_PREFIXES):
+        return "tiktoken:" + name
+    base = name.split(":")[0].replace("_", "-")
+    for prefix, repo in HF_TOKENIZERS:
+        if base.startswith(prefix):
+            return repo
+    return None
+
+
+def _load(source):
+    if source.startswith("tiktoken:"):
+        import tiktoken
+        name = source[len("tiktoken:"):]
+        try:
+            encoding = tiktoken.encoding_for_model(name)
+        except KeyError:
+            encoding = tiktoken.get_encoding(name if name.endswith("_base") else "cl100k_base")
+        return Tokenizer(source, lambda text: encoding.encode(text, disallowed_special=()), encoding.decode)
+    try:
+        # The tokenizers package alone is much lighter than transformers
+        from tokenizers import Tokenizer as HFTokenizer
+        tokenizer = HFTokenizer.from_pretrained(source)
+        return Tokenizer(source, lambda text: tokenizer.encode(text, add_special_tokens=False).ids, tokenizer.decode)
+    except ImportError:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(source)
+        return Tokenizer(source, lambda text: tokenizer.encode(text, add_special_tokens=False), tokenizer.decode)
+
+
+def get_tokenizer(model):
+    """Returns the cached tokenizer for a model, or None when none can be loaded."""
+    source = tokenizer_source(model)
+    if source is None:
+        return None
+    with _tokenizers_lock:
+        if source not in _tokenizers:
+            try:
+                _tokenizers[source] = _load(source)
+            except Exception as error:
+                logger.warning("Could not load the %s tokenizer for %s, estimating token counts: %s",
+                               source, model, error)
+                _tokenizers[source] = None
+        return _tokenizers[source]
+
+
+def count_tokens(text, model=None, exact=False):
+    """Returns the number of tokens in text, estimated unless exact is set and the model's tokenizer loads."""
+    if exact:
+        tokenizer = get_tokenizer(model)
+        if tokenizer is not None:
+            return tokenizer.count(text)
+    return approximate_tokens(text)
+
+
+def truncate_tokens(text, max_tokens, model=None, exact=False):
+    """
+    Returns the start of text that fits in max_tokens, counted with the model's tokenizer
+    when exact is set and it loads, estimated otherwise.
+    """
+    tokenizer = get_tokenizer(model) if exact else None
+    if tokenizer is None:
+        if approximate_tokens(text) <= max_tokens:
+            return text
+        return text[:int(max_tokens * CHARS_PER_TOKEN)]
+    # The estimate can be low for symbol-heavy code and non-Latin text, so it is no shortcut here
+    ids = tokenizer.encode(text)
+    return text if len(ids) <= max_tokens else tokenizer.decode(ids[:max_tokens])
+
+
+def fit_to_budget(text, max_tokens=None, model=None, label="text", exact=False):
+    """
+    Truncates text to max_tokens (ITL_MAX_FILE_TOKENS when not given, no limit when
+    neither is set) and prints a note when it had to.
+    """
+    if max_tokens is None:
+        max_tokens = int(os.environ.get("ITL_MAX_FILE_TOKENS", "0")) or None
+    if max_tokens is None:
+        return text
+    truncated = truncate_tokens(text, max_tokens, model=model, exact=exact)
+    if truncated != text:
+        print(f"Note: {label} was truncated to {max_tokens} tokens to fit the prompt budget.")
+    return truncated
@@ -1,42 +1,38 @@
 
+import argparse
 import sys
 import os
 from dotenv import find_dotenv, load_dotenv
-from langchain.llms import Ollama
-from langchain.chat_models.openai import ChatOpenAI
-from crewai import Agent, Task, Crew, Process
-from langchain.tools import Tool, DuckDuckGoSearchRun
 
-from tools import write_outline_to_markdown, read_outline_from_file, write_article_to_markdown, publish_to_devto_from_file
-from langchain.agents import load_tools
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 os.environ.clear()
 load_dotenv(find_dotenv())
 
-openai_llm = ChatOpenAI(openai_api_base=os.environ.get("OPENAI_API_BASE_URL", "https://api.openai.com/v1"),
-                    temperature=0,
-                    top_p=0.3,
-                    model_name=os.environ.get("MODEL_NAME", "gpt-3.5-turbo")) #"gpt-3.5-turbo")
+# Alternatives: create_llm(os.environ.get("MODEL_NAME", "gpt-3.5-turbo"), "chat_openai", temperature=0, top_p=0.3)
+# or the openhermes, dolphin-mixtral and mistral Ollama models.
+default_llm_model = "starling-lm:7b-alpha-q8_0"
 
 
-human_tools = load_tools(['human'])
-
-hermes_llm = Ollama(model="openhermes")
-mixtral_llm = Ollama(model="dolphin-mixtral")
-mistral_llm = Ollama(model="mistral")
-
-starling_llm = Ollama(model="starling-lm:7b-alpha-q8_0")
-default_llm = starling_llm
-
+def write_article(tutorial_topic):
+    from crewai import Agent, Task, Crew, Process
+    from langchain.agents import load_tools
+    from tools import write_outline_to_markdown, read_outline_from_file, write_article_to_markdown, publish_to_devto_from_file
+    from utils.llm_cache import cache_seed_from_env
+    from utils import metrics
+    from utils.llm_factory import create_llm
+    from utils.search_tools import create_search_tool
+
+    human_tools = load_tools(['human'])
+
+    # Create a DuckDuckGo search tool
+    ddg_search_tool = create_search_tool(
+        name="search_tool",
+        description="Search the web for information"
+    )
 
-# Create a DuckDuckGo search tool
-ddg_search_tool = Tool(
-    name="search_tool",
-    func=DuckDuckGoSearchRun().run,
-    description="Search the web for information"
-)
+    default_llm = create_llm(default_llm_model, "ollama", cache_seed=cache_seed_from_env())
 
-def write_article(tutorial_topic):
     # Define Agents
     research_analyst = Agent(
         role='Researcher',
@@ -222,7 +218,7 @@ def write_article(tutorial_topic):
 
 
     # Code to initiate the crew's work
-    outline_result = crew.kickoff()
+    outline_result = metrics.instrumented_kickoff(crew)
     print(outline_result)
 
 
@@ -334,16 +330,22 @@ def write_article(tutorial_topic):
         verbose=True
     )
     # Code to initiate the article writing crew's work
-    article_result = article_crew.kickoff()
+    article_result = metrics.instrumented_kickoff(article_crew)
 
     print(outline_result)
     print(article_result)
 
-if __name__ == "__main__":
-    if len(sys.argv) > 1:
+def build_parser():
+    parser = argparse.ArgumentParser(description="Research, write and publish a technical article.")
+    parser.add_argument("topic", type=str, help="The topic of the article.")
+    return parser
 
-        print(f"Topic: {sys.argv[1]}")
-        tutorial_topic = sys.argv[1]
-        write_article(tutorial_topic)
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    print(f"Topic: {args.topic}")
+    write_article(args.topic)
+
+if __name__ == "__main__":
+    main()
 
 